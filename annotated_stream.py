@@ -0,0 +1,72 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import LatestQueue
+
+
+# Publishes annotated detection frames to a StreamingOutput, which the
+# MJPEG server fans out to every viewer. submit() is called from the
+# detection loop and only copies the frame when one is due under
+# `max_fps` (due() tells the loop whether to annotate it at all); JPEG
+# encoding happens once per published frame on this worker thread, so
+# viewers never slow detection down. If encoding falls behind, older
+# frames are replaced by newer ones.
+#
+# quality, scale and max_fps may be changed while running, e.g. by
+# apply() as a QualityController listener.
+class AnnotatedStreamPublisher(threading.Thread):
+    def __init__(self, output, quality=70, max_fps=10.0, scale=1.0):
+        super().__init__(name='annotated-stream', daemon=True)
+        self.output = output
+        self.quality = quality
+        self.max_fps = max_fps
+        self.scale = scale
+        self.frames_submitted = 0
+        self.frames_encoded = 0
+        self.encode_seconds = 0.0
+        self._queue = LatestQueue(1)
+        self._next_due = 0.0
+
+    def due(self):
+        # Whether submit() would take a frame now; lets the loop skip
+        # drawing frames that would only be thrown away
+        return time.perf_counter() >= self._next_due
+
+    def submit(self, frame):
+        now = time.perf_counter()
+        if now < self._next_due:
+            return False
+        self._next_due = now + (1.0 / self.max_fps if self.max_fps else 0.0)
+        # The loop reuses and redraws its frame buffers, so keep a copy
+        self._queue.put(np.copy(frame))
+        self.frames_submitted += 1
+        return True
+
+    def run(self):
+        while True:
+            frame = self._queue.get(timeout=0.5)
+            if frame is None:
+                if self._queue.closed:
+                    break
+                continue
+            t_start = time.perf_counter()
+            if self.scale != 1.0:
+                frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+            self.encode_seconds = time.perf_counter() - t_start
+            if ok:
+                self.output.publish(buf.tobytes())
+                self.frames_encoded += 1
+
+    def apply(self, point):
+        self.quality = point.quality
+        self.scale = point.scale
+        if point.fps:
+            self.max_fps = point.fps
+
+    def close(self):
+        self._queue.close()
+        self.join(timeout=2)
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import threading
+
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from streaming import PAGE, ClientStats
+
+FRAME_HEADER = b'--FRAME\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+
+STREAM_RESPONSE = (b'HTTP/1.0 200 OK\r\n'
+                   b'Age: 0\r\n'
+                   b'Cache-Control: no-cache, private\r\n'
+                   b'Pragma: no-cache\r\n'
+                   b'Content-Type: multipart/x-mixed-replace; boundary=FRAME\r\n'
+                   b'\r\n')
+
+
+def http_response(status, content_type=None, body=b'', headers=()):
+    lines = [f'HTTP/1.0 {status}']
+    if content_type:
+        lines.append(f'Content-Type: {content_type}')
+    lines.append(f'Content-Length: {len(body)}')
+    lines.extend(headers)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii') + body
+
+
+# One viewer of /stream.mjpg. Frames are written straight into the
+# socket's transport buffer; a client whose buffer is still above
+# `max_backlog` bytes when the next frame arrives skips that frame
+# instead of holding anyone else up. Skipped frames show up as gaps in
+# the sequence numbers and are counted in frames_dropped.
+class MjpegClient(ClientStats):
+    def __init__(self, writer, max_backlog):
+        super().__init__(writer.get_extra_info('peername'))
+        self.writer = writer
+        self.transport = writer.transport
+        self.max_backlog = max_backlog
+        self.last_seq = 0
+
+    @property
+    def backlog(self):
+        return self.transport.get_write_buffer_size()
+
+    def send(self, seq, header, frame):
+        if self.transport.is_closing():
+            return False
+        if self.transport.get_write_buffer_size() > self.max_backlog:
+            return True
+        self.transport.writelines((header, frame, b'\r\n'))
+        self.record(seq, self.last_seq, len(header) + len(frame) + 2)
+        self.last_seq = seq
+        return True
+
+
+# Single-threaded MJPEG broadcaster built on asyncio. All viewers are
+# served from one event loop: publish() hands each encoded frame to the
+# loop once and it is written to every client without blocking, instead
+# of waking one OS thread per viewer as StreamingServer does.
+#
+# attach() subscribes the server to a StreamingOutput, whose publish()
+# runs on the encoder thread; frames are passed to the loop with
+# call_soon_threadsafe.
+#
+# /status.json reports the viewers plus whatever the callables in
+# `status` return, keyed by name (e.g. the adaptive quality controller).
+# /metrics serves `metrics` (a metrics.Metrics registry) when one is set.
+class AsyncMjpegServer:
+    def __init__(self, address=('', 8000), page=PAGE, max_backlog=512 * 1024):
+        self.address = address
+        self.page = page.encode('utf-8')
+        self.max_backlog = max_backlog
+        self.clients = set()
+        self.frames_published = 0
+        self.status = {}
+        self.metrics = None
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.error = None
+
+    def attach(self, output):
+        output.subscribers.append(self.publish)
+        return output
+
+    def publish(self, seq, frame):
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._broadcast, seq, frame)
+
+    def _broadcast(self, seq, frame):
+        self.frames_published += 1
+        header = FRAME_HEADER % len(frame)
+        for client in list(self.clients):
+            if not client.send(seq, header, frame):
+                self.clients.discard(client)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.decode('latin-1').split()
+            path = parts[1] if len(parts) >= 2 else ''
+            if path == '/':
+                writer.write(http_response('301 Moved Permanently', headers=['Location: /index.html']))
+            elif path == '/index.html':
+                writer.write(http_response('200 OK', 'text/html', self.page))
+            elif path == '/status.json':
+                writer.write(http_response('200 OK', 'application/json', self.status_json()))
+            elif path == '/metrics' and self.metrics is not None:
+                writer.write(http_response('200 OK', METRICS_CONTENT_TYPE,
+                                           self.metrics.render()))
+            elif path == '/stream.mjpg':
+                await self._stream(reader, writer)
+                return
+            else:
+                writer.write(http_response('404 Not Found', 'text/plain', b'Not found'))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logging.warning('Request from %s failed: %s', writer.get_extra_info('peername'), e)
+        finally:
+            writer.close()
+
+    def status_json(self):
+        status = {'frames_published': self.frames_published,
+                  'clients': [{'address': str(c.address), 'frames_sent': c.frames_sent,
+                               'frames_dropped': c.frames_dropped, 'backlog': c.backlog}
+                              for c in list(self.clients)]}
+        for name, fn in self.status.items():
+            status[name] = fn()
+        return json.dumps(status).encode('utf-8')
+
+    async def _stream(self, reader, writer):
+        writer.write(STREAM_RESPONSE)
+        client = MjpegClient(writer, self.max_backlog)
+        self.clients.add(client)
+        try:
+            # Nothing more is expected from the viewer; EOF means it left
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            logging.warning('Removed streaming client %s (%d frames sent, %d dropped)',
+                            client.address, client.frames_sent, client.frames_dropped)
+
+    async def _serve(self):
+        host, port = self.address
+        self._server = await asyncio.start_server(self._handle, host or None, port, reuse_address=True)
+        self._ready.set()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def serve_forever(self):
+        # Runs the event loop on the calling thread until shutdown()
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # e.g. the port is taken; kept for start() to raise
+            self.error = e
+            raise
+        finally:
+            self.loop.close()
+            self._ready.set()
+
+    def _run(self):
+        try:
+            self.serve_forever()
+        except Exception:
+            pass  # in self.error
+
+    def start(self):
+        # Runs the event loop on a background thread; raises if the server
+        # couldn't start listening
+        self._thread = threading.Thread(target=self._run, name='mjpeg-server', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def shutdown(self):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        def close():
+            for client in list(self.clients):
+                client.transport.close()
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+        loop.call_soon_threadsafe(close)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
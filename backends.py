@@ -0,0 +1,134 @@
+import glob
+import importlib.metadata
+import importlib.util
+import json
+import os
+import platform
+
+from instrumentation import board_model
+
+# Exported model formats we know how to pick between: name -> (path
+# suffix ultralytics recognises, module that must be importable)
+BACKENDS = {
+    'ncnn': ('_ncnn_model', 'ncnn'),
+    'openvino': ('_openvino_model', 'openvino'),
+    'onnx': ('.onnx', 'onnxruntime'),
+    'pytorch': ('.pt', 'torch'),
+}
+
+# Backends whose inference thread count can be changed after loading.
+# ONNX Runtime and OpenVINO sessions are created inside ultralytics with
+# their own defaults, so they are benchmarked as they come.
+THREADED_BACKENDS = ('ncnn', 'pytorch')
+
+DEFAULT_CACHE = 'backend_cache.json'
+
+
+def backend_of(path):
+    name = os.path.basename(path.rstrip(os.sep))
+    for backend, (suffix, _) in BACKENDS.items():
+        if name.endswith(suffix):
+            return backend
+    return None
+
+
+def backend_available(backend):
+    return importlib.util.find_spec(BACKENDS[backend][1]) is not None
+
+
+def find_models(directory='.'):
+    # Every exported or PyTorch model in the directory, sorted by path
+    models = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        if backend_of(path) is not None:
+            models.append(path)
+    return models
+
+
+def export_imgsz(path):
+    # Input size baked into an export, from the metadata.yaml ultralytics
+    # writes next to NCNN and OpenVINO models; None if the model takes any
+    # size (PyTorch) or we can't tell
+    meta = os.path.join(path, 'metadata.yaml')
+    if not os.path.isfile(meta):
+        return None
+    with open(meta) as f:
+        lines = f.read().splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith('imgsz:'):
+            value = line.split(':', 1)[1].strip()
+            if value.startswith('['):
+                return int(value.strip('[]').split(',')[0])
+            if value:
+                return int(value)
+            # Block list: "imgsz:\n- 320\n- 320"
+            if i + 1 < len(lines) and lines[i + 1].lstrip().startswith('-'):
+                return int(lines[i + 1].lstrip()[1:].strip())
+    return None
+
+
+def set_threads(model, threads):
+    # Call after the first inference, once ultralytics has built its
+    # backend. Returns False where the backend doesn't allow it.
+    if not threads:
+        return False
+    backend = getattr(getattr(model, 'predictor', None), 'model', None)
+    net = getattr(backend, 'net', None)
+    if net is not None and hasattr(net, 'opt'):
+        net.opt.num_threads = threads
+        return True
+    if getattr(backend, 'pt', False):
+        import torch
+        torch.set_num_threads(threads)
+        return True
+    return False
+
+
+def fingerprint(model_path):
+    # What the cached choice depends on: a different board, OS image,
+    # library versions or a re-exported model invalidate it. Versions come
+    # from package metadata so nothing heavy gets imported.
+    versions = {}
+    for package in ['ultralytics'] + [module for _, module in BACKENDS.values()]:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    try:
+        stat = os.stat(model_path)
+        model = [os.path.basename(model_path.rstrip(os.sep)), int(stat.st_mtime)]
+    except OSError:
+        model = None
+    return {
+        'board': board_model(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'libraries': versions,
+        'model': model,
+    }
+
+
+def save_config(path, config):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_config(path=DEFAULT_CACHE):
+    # The cached winner, or None if there is none or it was measured on a
+    # different setup. Returns (config, reason).
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return None, f'no backend cache at {path}'
+    except (OSError, ValueError) as e:
+        return None, f'unreadable backend cache {path}: {e}'
+    model = config.get('model')
+    if not model or not os.path.exists(model):
+        return None, f'cached model {model} is missing'
+    if config.get('fingerprint') != fingerprint(model):
+        return None, 'backend cache was measured on a different board, image or model; re-run benchmark_backends.py'
+    return config, f"using {config['backend']} {model} imgsz {config['imgsz']} threads {config['threads'] or 'default'}"
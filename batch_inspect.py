@@ -0,0 +1,265 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from backends import set_threads
+from detector import DEFAULT_MODEL, Detector
+from frame_source import IMAGE_EXTENSIONS, parse_resolution
+from roi import RailRoi, parse_band
+
+# Offline re-inspection of recorded runs. Every input (a video file or a
+# directory of images) is cut into chunks of consecutive frames that a
+# process pool works through; each worker process loads the model once
+# and reads its own frames straight from disk, so only detections travel
+# back to the parent. Workers write the crops themselves; the parent
+# streams one CSV row per detection as chunks finish and writes a JSON
+# summary at the end.
+#
+#   python batch_inspect.py runs/2024-05-01.mp4 runs/frames/ --model yolo11n.pt --batch 8 --out report/
+
+CSV_FIELDS = ('input', 'frame', 'time_s', 'cls', 'label', 'conf', 'x0', 'y0', 'x1', 'y1', 'crop')
+
+# Per-process state set up by init_worker()
+_worker = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Re-inspect recorded runs with a process pool')
+    parser.add_argument('inputs', nargs='+', help='Video files and/or directories of images')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Model path; any format ultralytics loads')
+    parser.add_argument('--min-thresh', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes, one model each (default: one per core)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Inference threads per worker; 1 scales best across processes')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='Frames per model call; NCNN exports only run batch 1')
+    parser.add_argument('--chunk', type=int, default=128,
+                        help='Consecutive frames per task; larger chunks seek less in video files')
+    parser.add_argument('--resolution', type=parse_resolution, metavar='WxH',
+                        help='Resize frames to this size first, e.g. 320x240 to match the live setup')
+    parser.add_argument('--roi', type=parse_band, metavar='Y0,Y1',
+                        help='Only run the model on the rail band between these fractions of the frame height')
+    parser.add_argument('--roi-x', type=parse_band, default=(0.0, 1.0), metavar='X0,X1')
+    parser.add_argument('--tiles', type=int, default=1)
+    parser.add_argument('--tile-overlap', type=float, default=0.2)
+    parser.add_argument('--crop-margin', type=int, default=8)
+    parser.add_argument('--jpeg-quality', type=int, default=85)
+    parser.add_argument('--no-crops', action='store_true', help='Only write the CSV and JSON report')
+    parser.add_argument('--out', default='inspection', help='Report directory')
+    return parser.parse_args()
+
+
+def list_inputs(paths):
+    # (path, frame count, fps, image files) per input; image files is
+    # None for a video
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(f for f in glob.glob(os.path.join(path, '*')) if f.lower().endswith(IMAGE_EXTENSIONS))
+            if not files:
+                raise IOError(f'No images found in {path}')
+            inputs.append((path, len(files), None, files))
+        elif os.path.isfile(path):
+            cap = cv2.VideoCapture(path)
+            if not cap.isOpened():
+                raise IOError(f'Unable to open video file {path}')
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            cap.release()
+            inputs.append((path, count, fps, None))
+        else:
+            raise IOError(f'No such input {path}')
+    return inputs
+
+
+def make_tasks(inputs, chunk):
+    return [(index, start, min(chunk, count - start))
+            for index, (path, count, fps, files) in enumerate(inputs)
+            for start in range(0, count, chunk)]
+
+
+def init_worker(args, inputs):
+    # Runs once in each worker process. The model is imported and loaded
+    # here so the parent never pays for it, and OpenCV is kept to
+    # --threads so the workers don't fight over cores. An exception here
+    # would make the pool respawn workers forever, so a failed load is
+    # kept and raised from the first task instead, which ends the run.
+    cv2.setNumThreads(args.threads)
+    _worker['args'] = args
+    _worker['inputs'] = inputs
+    _worker['size'] = args.resolution
+    try:
+        from ultralytics import YOLO
+        model = YOLO(args.model, task='detect')
+    except Exception as e:
+        _worker['error'] = e
+        return
+    roi = None
+    if args.roi is not None:
+        roi = RailRoi(args.roi, args.roi_x, args.tiles, args.tile_overlap)
+    _worker['detector'] = Detector(model, args.min_thresh, roi)
+    _worker['labels'] = model.names
+    _worker['model'] = model
+    _worker['threads_set'] = False
+
+
+def read_chunk(path, files, start, count):
+    # Yields (frame index, BGR frame) for one task
+    if files is not None:
+        for i, name in enumerate(files[start:start + count], start):
+            frame = cv2.imread(name)
+            if frame is not None:
+                yield i, frame
+        return
+    cap = cv2.VideoCapture(path)
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for i in range(start, start + count):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield i, frame
+    finally:
+        cap.release()
+
+
+def inspect_chunk(task):
+    # Worker side: detect on one chunk, write the crops, return CSV rows
+    if 'error' in _worker:
+        raise RuntimeError(f"Loading {_worker['args'].model} failed: {_worker['error']}")
+    index, start, count = task
+    args, detector, labels = _worker['args'], _worker['detector'], _worker['labels']
+    path, _, fps, files = _worker['inputs'][index]
+    crop_dir = os.path.join(args.out, 'crops', f'{index:03d}-{os.path.splitext(os.path.basename(path.rstrip(os.sep)))[0]}')
+    if not args.no_crops:
+        os.makedirs(crop_dir, exist_ok=True)
+
+    rows = []
+    frames = 0
+    t_start = time.perf_counter()
+    batch = []
+
+    def flush():
+        if args.batch > 1:
+            results = detector.detect_batch([frame for _, frame in batch])
+        else:
+            results = [detector(frame) for _, frame in batch]
+        if not _worker['threads_set']:
+            # The backend only exists after the first inference; NCNN
+            # doesn't read OMP_NUM_THREADS, so size its pool here
+            set_threads(_worker['model'], args.threads)
+            _worker['threads_set'] = True
+        for (i, frame), dets in zip(batch, results):
+            rows.extend(detection_rows(path, i, fps, frame, dets, labels, crop_dir))
+        batch.clear()
+
+    for i, frame in read_chunk(path, files, start, count):
+        if _worker['size'] is not None:
+            frame = cv2.resize(frame, _worker['size'], interpolation=cv2.INTER_AREA)
+        batch.append((i, frame))
+        frames += 1
+        if len(batch) >= args.batch:
+            flush()
+    if batch:
+        flush()
+    return index, frames, rows, time.perf_counter() - t_start
+
+
+def detection_rows(path, i, fps, frame, dets, labels, crop_dir):
+    args = _worker['args']
+    h, w = frame.shape[:2]
+    m = args.crop_margin
+    rows = []
+    boxes = dets['xyxy'].tolist()
+    for k, ((x0, y0, x1, y1), conf, cls) in enumerate(zip(boxes, dets['conf'].tolist(), dets['cls'].tolist())):
+        label = labels.get(cls, str(cls))
+        crop_path = ''
+        if not args.no_crops:
+            crop = frame[max(int(y0) - m, 0):min(int(y1) + m, h), max(int(x0) - m, 0):min(int(x1) + m, w)]
+            if crop.size:
+                crop_path = os.path.join(crop_dir, f'{i:07d}-{k}-{label}.jpg')
+                cv2.imwrite(crop_path, crop, [int(cv2.IMWRITE_JPEG_QUALITY), args.jpeg_quality])
+        rows.append((path, i, round(i / fps, 3) if fps else '', cls, label, round(conf, 4),
+                     round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), crop_path))
+    return rows
+
+
+def main():
+    args = parse_args()
+    # Checked here rather than left to the workers, which would only fail
+    # one by one after the pool started
+    if not os.path.exists(args.model):
+        sys.exit(f'Model not found: {args.model}')
+    if args.batch > 1 and 'ncnn' in os.path.basename(args.model.rstrip(os.sep)).lower():
+        print('NCNN models only run the first image of a batch; using --batch 1')
+        args.batch = 1
+    inputs = list_inputs(args.inputs)
+    tasks = make_tasks(inputs, args.chunk)
+    total_frames = sum(count for _, count, _, _ in inputs)
+    os.makedirs(args.out, exist_ok=True)
+    workers = max(1, min(args.workers, len(tasks)))
+    print(f'{len(inputs)} inputs, {total_frames} frames in {len(tasks)} chunks on {workers} workers')
+
+    # Thread pools inside torch/OpenMP are sized per process; set this
+    # before the workers start so they inherit it
+    os.environ['OMP_NUM_THREADS'] = str(args.threads)
+
+    per_input = [{'input': path, 'frames': 0, 'detections': 0} for path, _, _, _ in inputs]
+    frames = detections = 0
+    busy = 0.0
+    t_start = time.perf_counter()
+    # spawn rather than fork: workers start clean instead of inheriting
+    # the parent's OpenCV and thread-pool state
+    context = multiprocessing.get_context('spawn')
+    csv_path = os.path.join(args.out, 'defects.csv')
+    with open(csv_path, 'w', newline='') as f, \
+            context.Pool(workers, initializer=init_worker, initargs=(args, inputs)) as pool:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for index, chunk_frames, rows, seconds in pool.imap_unordered(inspect_chunk, tasks):
+            writer.writerows(rows)
+            f.flush()
+            per_input[index]['frames'] += chunk_frames
+            per_input[index]['detections'] += len(rows)
+            frames += chunk_frames
+            detections += len(rows)
+            busy += seconds
+            elapsed = time.perf_counter() - t_start
+            print(f'\r{frames}/{total_frames} frames, {detections} detections, {frames / elapsed:.1f} FPS',
+                  end='', file=sys.stderr)
+    elapsed = time.perf_counter() - t_start
+    print(file=sys.stderr)
+
+    summary = {
+        'model': args.model,
+        'min_thresh': args.min_thresh,
+        'workers': workers,
+        'batch': args.batch,
+        'chunk': args.chunk,
+        'frames': frames,
+        'detections': detections,
+        'elapsed_s': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        # Fraction of the pool's time spent inside chunks; well below 1
+        # means the workers were starved (too few chunks or slow reads)
+        'worker_utilisation': busy / (elapsed * workers) if elapsed else 0.0,
+        'inputs': per_input,
+        'csv': csv_path,
+    }
+    with open(os.path.join(args.out, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"{frames} frames, {detections} detections in {elapsed:.1f} s ({summary['fps']:.1f} FPS); "
+          f"report in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
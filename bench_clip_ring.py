@@ -0,0 +1,79 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from clip_buffer import JpegRing
+
+# Append throughput of the clip pre-roll ring, checking on the way that
+# every frame it still indexes reads back intact. Frames are filled with
+# their sequence number and come in mixed sizes, so the write head keeps
+# wrapping with tail frames left past it; a frame whose bytes were
+# overwritten while it stayed indexed shows up as corrupt, and the
+# script exits with status 1.
+#
+#   python bench_clip_ring.py --frames 20000 --capacity 1000000
+
+
+def frame_for(seq, size):
+    return bytes([seq % 251]) * size
+
+
+def check(ring):
+    # Indexed frames must read back as written and not share bytes
+    bad = 0
+    spans = []
+    for seq, _, jpeg in ring.frames_after(-1):
+        if jpeg != frame_for(seq, len(jpeg)):
+            bad += 1
+    for _, _, offset, length in ring.index:
+        spans.append((offset, offset + length))
+    spans.sort()
+    overlaps = sum(1 for (_, end), (start, _) in zip(spans, spans[1:]) if start < end)
+    used = sum(end - start for start, end in spans)
+    return bad, overlaps, used != ring.bytes_used or ring.bytes_used > ring.capacity
+
+
+def run(capacity, sizes, verify):
+    ring = JpegRing(capacity)
+    problems = 0
+    t_start = time.perf_counter()
+    for seq, size in enumerate(sizes, 1):
+        ring.append(seq, float(seq), frame_for(seq, size))
+        if verify:
+            bad, overlaps, miscounted = check(ring)
+            if bad or overlaps or miscounted:
+                problems += 1
+                if problems <= 5:
+                    print(f'after seq {seq}: {bad} corrupt frames, {overlaps} overlapping, '
+                          f'bytes_used {"wrong" if miscounted else "ok"}')
+    return ring, problems, time.perf_counter() - t_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and check the clip pre-roll ring')
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--capacity', type=int, default=1_000_000, help='Ring size in bytes')
+    parser.add_argument('--min-kb', type=float, default=5)
+    parser.add_argument('--max-kb', type=float, default=60)
+    args = parser.parse_args()
+
+    # The smallest case that used to leave a stale frame indexed
+    _, problems, _ = run(35, [10, 10, 10, 5, 10, 10, 8, 10], verify=True)
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(int(args.min_kb * 1024), int(args.max_kb * 1024), args.frames).tolist()
+    ring, random_problems, _ = run(args.capacity, sizes[:2000], verify=True)
+    problems += random_problems
+    ring, _, elapsed = run(args.capacity, sizes, verify=False)
+
+    print(f'{args.frames} frames of {args.min_kb:g}-{args.max_kb:g} KiB into a {args.capacity / 1024:.0f} KiB ring')
+    print(f'append: {1e6 * elapsed / args.frames:.1f} us/frame, {ring.evicted} evicted, '
+          f'{len(ring)} frames / {ring.bytes_used / 1024:.0f} KiB held at the end')
+    print('ring contents:', 'ok' if not problems else f'{problems} bad states')
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
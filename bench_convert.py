@@ -0,0 +1,66 @@
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from frame_convert import BgrConverter
+
+RESOLUTIONS = ((320, 240), (640, 480), (1280, 720))
+
+
+def copy_then_convert(frame):
+    # What the capture loops used to do
+    return cv2.cvtColor(np.copy(frame), cv2.COLOR_BGRA2BGR)
+
+
+def measure(convert, frame, frames):
+    # Warm up so one-off buffer allocation is not counted per frame
+    for _ in range(3):
+        convert(frame)
+
+    # Bytes allocated and released within each frame show up as the peak
+    # above the steady-state level
+    tracemalloc.start()
+    transient = 0
+    for _ in range(min(frames, 50)):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        convert(frame)
+        transient += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    bytes_per_frame = transient / min(frames, 50)
+
+    t_start = time.perf_counter()
+    for _ in range(frames):
+        convert(frame)
+    ms_per_frame = (time.perf_counter() - t_start) / frames * 1000
+    return bytes_per_frame, ms_per_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame acquisition copy/convert cost per frame')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'resolution':>10} {'method':<22} {'KiB/frame':>10} {'frame allocs':>13} {'ms/frame':>9}")
+    for w, h in RESOLUTIONS:
+        frame_bgra = rng.integers(0, 255, size=(h, w, 4), dtype=np.uint8)
+        frame_bgr = np.ascontiguousarray(frame_bgra[:, :, :3])
+        methods = (
+            ('np.copy + cvtColor', copy_then_convert, frame_bgra),
+            ('cvtColor (new array)', BgrConverter(pool_size=None).convert, frame_bgra),
+            ('cvtColor dst= pool', BgrConverter(pool_size=1).convert, frame_bgra),
+            ('RGB888 pass-through', BgrConverter().convert, frame_bgr),
+        )
+        for name, convert, frame in methods:
+            bytes_per_frame, ms = measure(convert, frame, args.frames)
+            # Allocations expressed in units of a full BGR frame
+            allocs = bytes_per_frame / (w * h * 3)
+            print(f"{f'{w}x{h}':>10} {name:<22} {bytes_per_frame / 1024:>10.1f} {allocs:>13.2f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
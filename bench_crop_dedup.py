@@ -0,0 +1,126 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from crop_dedup import CropIndex, hash_window, phash
+from frame_source import SyntheticSource
+
+# Crop dedup costs and quality: insert and lookup latency of the hash
+# index once it holds --entries hashes, at each radius; what phash()
+# costs per crop; and how many bits the hash moves under the changes a
+# re-seen defect goes through (JPEG noise, lighting, box jitter) compared
+# with a box on something else. Recall (the share of pairs within each
+# radius) is shown for the region DefectLogger hashes, hash_window(), and
+# for the box + 8 px margin crop it used to hash.
+#
+#   python bench_crop_dedup.py --entries 100000 --radii 6,10
+
+
+def bench_index(radius, entries, queries, rng):
+    index = CropIndex(radius=radius, window=None)
+    hashes = [int(h) for h in rng.integers(0, 1 << 64, size=entries, dtype=np.uint64)]
+    t_start = time.perf_counter()
+    for i, h in enumerate(hashes):
+        index.check(h, 0, float(i))
+    insert_us = 1e6 * (time.perf_counter() - t_start) / entries
+    # Stored hashes with exactly `radius` bits flipped: the hardest match
+    near = []
+    for h in hashes[:queries]:
+        for b in rng.choice(64, size=radius, replace=False):
+            h ^= 1 << int(b)
+        near.append(h)
+    fresh = [int(h) for h in rng.integers(0, 1 << 64, size=queries, dtype=np.uint64)]
+    results = {}
+    for label, batch in (('near', near), ('fresh', fresh)):
+        times = []
+        hits = 0
+        for h in batch:
+            t = time.perf_counter()
+            hits += index.find(h, 0) is not None
+            times.append(time.perf_counter() - t)
+        results[label] = (1e6 * np.mean(times), 1e6 * np.percentile(times, 99), hits)
+    return insert_us, results, len(index)
+
+
+def box_pairs(size, crop, count, rng):
+    # (change, box, box of the re-seen defect) around the synthetic scene
+    w, h = size
+    pad = crop // 2
+    grow = round(crop * 0.05)
+    for _ in range(count):
+        x = int(rng.integers(pad, w - crop - pad))
+        y = int(rng.integers(pad, h - crop - pad))
+        box = (x, y, x + crop, y + crop)
+        yield 'jpeg q50', box, box
+        yield 'brightness +10%', box, box
+        yield 'box 1 px off', box, (x + 1, y + 1, x + 1 + crop, y + 1 + crop)
+        yield 'box 3 px off', box, (x + 2, y + 3, x + 2 + crop, y + 3 + crop)
+        yield 'corners +-2 px', box, tuple(v + int(d) for v, d in zip(box, rng.integers(-2, 3, 4)))
+        yield 'box 10% larger', box, (x - grow, y - grow, x + crop + grow, y + crop + grow)
+        x2 = int(rng.integers(pad, w - crop - pad))
+        y2 = int(rng.integers(pad, h - crop - pad))
+        yield 'other box', box, (x2, y2, x2 + crop, y2 + crop)
+
+
+def margin_region(box, size, margin=8):
+    x0, y0, x1, y1 = box
+    w, h = size
+    return max(x0 - margin, 0), max(y0 - margin, 0), min(x1 + margin, w), min(y1 + margin, h)
+
+
+def region_hash(frame, region):
+    x0, y0, x1, y1 = region
+    return phash(frame[y0:y1, x0:x1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the crop dedup index')
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--radii', default='6,10')
+    parser.add_argument('--size', default='640x480')
+    parser.add_argument('--crop', type=int, default=80, help='Box side in pixels')
+    parser.add_argument('--recall-radii', default='6,8,10,12')
+    parser.add_argument('--pairs', type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'radius':>6} {'entries':>8} {'insert us':>9} {'near us':>8} {'p99':>6} {'found':>7} "
+          f"{'fresh us':>8} {'p99':>6} {'false':>5}")
+    for radius in (int(v) for v in args.radii.split(',')):
+        insert_us, results, entries = bench_index(radius, args.entries, args.queries, rng)
+        near_mean, near_p99, found = results['near']
+        fresh_mean, fresh_p99, false = results['fresh']
+        print(f'{radius:>6} {entries:>8} {insert_us:>9.1f} {near_mean:>8.1f} {near_p99:>6.0f} '
+              f'{found / args.queries:>7.1%} {fresh_mean:>8.1f} {fresh_p99:>6.0f} {false:>5}')
+
+    size = tuple(int(v) for v in args.size.split('x'))
+    frame = SyntheticSource(size, fmt='RGB888').capture_array()
+    _, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
+    changed = {'jpeg q50': cv2.imdecode(buf, cv2.IMREAD_COLOR),
+               'brightness +10%': cv2.convertScaleAbs(frame, alpha=1.1, beta=5)}
+    radii = [int(v) for v in args.recall_radii.split(',')]
+    distances = {}
+    for name, a, b in box_pairs(size, args.crop, args.pairs, rng):
+        other = changed.get(name, frame)
+        for method, region in (('window', hash_window), ('margin', margin_region)):
+            d = (region_hash(frame, region(a, size)) ^ region_hash(other, region(b, size))).bit_count()
+            distances.setdefault((name, method), []).append(d)
+    x0, y0, x1, y1 = hash_window(next(box_pairs(size, args.crop, 1, rng))[1], size)
+    region = frame[y0:y1, x0:x1]
+    t_start = time.perf_counter()
+    for _ in range(1000):
+        phash(region)
+    print(f'\nphash of a {args.crop}x{args.crop} box ({x1 - x0}x{y1 - y0} window): '
+          f'{(time.perf_counter() - t_start) * 1000:.1f} us')
+    print(f"{'change':<16} {'hashed':<7} {'median bits':>11} {'p90':>4}" + ''.join(f" {f'<= {r}':>6}" for r in radii))
+    for (name, method), d in distances.items():
+        d = np.array(d)
+        print(f'{name:<16} {method:<7} {np.median(d):>11.0f} {np.percentile(d, 90):>4.0f}'
+              + ''.join(f' {np.mean(d <= r):>6.1%}' for r in radii))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from event_log import DefectLogger
+from frame_source import SyntheticSource
+from postprocess import make_detections
+
+
+def run_loop(source, frames, dets_per_frame, infer_ms, logger, rng):
+    # Stand-in for the detection loop: capture, a fixed inference cost
+    # that releases the GIL like the NCNN backend does, then logging
+    h, w = source.size[1], source.size[0]
+    t_start = time.perf_counter()
+    for seq in range(frames):
+        frame = source.capture_array()
+        time.sleep(infer_ms / 1000)
+        xy = rng.uniform(0, [w - 60, h - 60], size=(dets_per_frame, 2))
+        dets = make_detections(np.hstack([xy, xy + 50]), np.full(dets_per_frame, 0.8), np.zeros(dets_per_frame))
+        if logger is not None:
+            logger.log(frame[:, :, :3], seq, dets)
+    return frames / (time.perf_counter() - t_start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection loop FPS with and without the defect log')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--dets', type=int, default=5, help='Detections logged per frame')
+    parser.add_argument('--infer-ms', type=float, default=30.0, help='Simulated inference time per frame')
+    parser.add_argument('--size', default='640x480')
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split('x'))
+    directory = tempfile.mkdtemp(prefix='defect_log_bench_')
+    try:
+        rng = np.random.default_rng(0)
+        base_fps = run_loop(SyntheticSource(size), args.frames, args.dets, args.infer_ms, None, rng)
+
+        logger = DefectLogger(directory)
+        logger.start()
+        log_fps = run_loop(SyntheticSource(size), args.frames, args.dets, args.infer_ms, logger, rng)
+        t_close = time.perf_counter()
+        logger.close()
+        drain = time.perf_counter() - t_close
+
+        # Writer throughput on its own, with the loop producing flat out
+        logger = DefectLogger(directory)
+        logger.start()
+        t_start = time.perf_counter()
+        run_loop(SyntheticSource(size), args.frames, args.dets, 0.0, logger, rng)
+        logger.close()
+        writer_rate = logger.written / (time.perf_counter() - t_start)
+
+        print(f'{args.frames} frames at {args.size}, {args.dets} detections/frame, {args.infer_ms:.0f} ms inference')
+        print(f'loop FPS without logging: {base_fps:8.2f}')
+        print(f'loop FPS with logging:    {log_fps:8.2f}  ({(log_fps / base_fps - 1) * 100:+.1f}%)')
+        print(f'writer drain at close:    {drain * 1000:8.1f} ms')
+        print(f'writer throughput:        {writer_rate:8.0f} records/s '
+              f'({logger.batches} batches, {logger.dropped} dropped)')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
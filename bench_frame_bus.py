@@ -0,0 +1,189 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from frame_bus import FrameBusReader, FrameBusWriter
+from frame_source import SyntheticSource
+
+# Frames/s delivered from one producer to 1-4 consumer processes: the
+# shared-memory FrameBus against pickling each frame through a
+# multiprocessing.Queue per consumer (what camera_stream.py's pickle
+# protocol amounted to). The producer publishes flat out, or at --fps
+# like a camera. Every frame carries its sequence number in its first 8
+# bytes; a consumer that finds the wrong number in a frame the seqlock
+# passed as valid counts it as missed.
+#
+#   python bench_frame_bus.py --size 640x480 --consumers 1,2,3,4
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the shared-memory frame bus')
+    parser.add_argument('--size', default='640x480', metavar='WxH')
+    parser.add_argument('--consumers', default='1,2,3,4')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--fps', type=float, default=0.0,
+                        help='Pace the producer like a camera (default: flat out)')
+    parser.add_argument('--work', choices=('mean', 'none'), default='mean',
+                        help='What a consumer does with each frame: average every pixel, or only check the stamp')
+    return parser.parse_args()
+
+
+def stamp_of(frame):
+    return int(frame.reshape(-1)[:8].view(np.int64)[0])
+
+
+def consume(frame, work):
+    if work == 'mean':
+        frame.mean()
+
+
+def bus_consumer(name, work, barrier, results):
+    reader = FrameBusReader(name)
+    barrier.wait()
+    frames = missed = 0
+    t_start = None
+    while True:
+        item = reader.next(timeout=2.0)
+        if item is None:
+            break
+        seq, _, frame = item
+        if t_start is None:
+            t_start = time.perf_counter()
+            cpu_start = time.process_time()
+        stamp = stamp_of(frame)
+        consume(frame, work)
+        if reader.valid(seq) and stamp != seq:
+            missed += 1
+        frames += 1
+    elapsed = time.perf_counter() - t_start if t_start else 0.0
+    cpu = time.process_time() - cpu_start if t_start else 0.0
+    results.put(dict(reader.stats(), frames=frames, missed=missed, elapsed=elapsed, cpu=cpu))
+    reader.close()
+
+
+def queue_consumer(frames_in, work, barrier, results):
+    barrier.wait()
+    frames = missed = 0
+    t_start = None
+    while True:
+        try:
+            item = frames_in.get(timeout=2.0)
+        except queue.Empty:
+            break
+        if item is None:
+            break
+        seq, frame = item
+        if t_start is None:
+            t_start = time.perf_counter()
+            cpu_start = time.process_time()
+        if stamp_of(frame) != seq:
+            missed += 1
+        consume(frame, work)
+        frames += 1
+    elapsed = time.perf_counter() - t_start if t_start else 0.0
+    cpu = time.process_time() - cpu_start if t_start else 0.0
+    results.put({'frames': frames, 'missed': missed, 'elapsed': elapsed, 'cpu': cpu, 'overrun': 0, 'torn': 0})
+
+
+def pace(published, t_start, fps):
+    if fps:
+        delay = t_start + published / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def make_frames(size, count=8):
+    source = SyntheticSource(size, fmt='RGB888')
+    return [source.capture_array() for _ in range(count)]
+
+
+def bench_bus(context, frames, consumers, args):
+    name = f'bench-bus-{os.getpid()}'
+    writer = FrameBusWriter(name, frames[0].shape, slots=args.slots)
+    barrier = context.Barrier(consumers + 1)
+    results = context.Queue()
+    procs = [context.Process(target=bus_consumer, args=(name, args.work, barrier, results))
+             for _ in range(consumers)]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    published = 0
+    t_start = time.perf_counter()
+    end = t_start + args.duration
+    while time.perf_counter() < end:
+        slot = writer.begin()
+        np.copyto(slot, frames[published % len(frames)])
+        slot.reshape(-1)[:8].view(np.int64)[0] = writer.write_seq + 1
+        writer.commit()
+        published += 1
+        pace(published, t_start, args.fps)
+    elapsed = time.perf_counter() - t_start
+    # Consumers drain what's left and stop once they see the bus closed
+    writer.close()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return published / elapsed, out
+
+
+def bench_queue(context, frames, consumers, args):
+    barrier = context.Barrier(consumers + 1)
+    results = context.Queue()
+    queues = [context.Queue(maxsize=args.slots) for _ in range(consumers)]
+    procs = [context.Process(target=queue_consumer, args=(q, args.work, barrier, results)) for q in queues]
+    for p in procs:
+        p.start()
+    barrier.wait()
+    published = dropped = 0
+    t_start = time.perf_counter()
+    end = t_start + args.duration
+    while time.perf_counter() < end:
+        frame = frames[published % len(frames)].copy()
+        published += 1
+        frame.reshape(-1)[:8].view(np.int64)[0] = published
+        for q in queues:
+            try:
+                q.put_nowait((published, frame))
+            except queue.Full:
+                dropped += 1
+        pace(published, t_start, args.fps)
+    elapsed = time.perf_counter() - t_start
+    for q in queues:
+        q.put(None)
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    for r in out:
+        r['overrun'] = dropped // consumers
+    return published / elapsed, out
+
+
+def main():
+    args = parse_args()
+    w, h = (int(v) for v in args.size.lower().split('x'))
+    frames = make_frames((w, h))
+    context = multiprocessing.get_context('spawn')
+    print(f'{w}x{h} BGR frames, {args.duration:.0f} s per run, consumer work: {args.work}, '
+          f'{os.cpu_count()} CPUs')
+    print(f"{'transport':<10} {'consumers':>9} {'produced/s':>10} {'per consumer/s':>14} "
+          f"{'total/s':>8} {'CPU ms/frame':>12} {'lost':>6} {'torn':>5} {'missed':>6}")
+    for consumers in (int(v) for v in args.consumers.split(',')):
+        for label, bench in (('pickle', bench_queue), ('framebus', bench_bus)):
+            produced, out = bench(context, frames, consumers, args)
+            rates = [r['frames'] / r['elapsed'] if r['elapsed'] else 0.0 for r in out]
+            lost = sum(r['overrun'] for r in out)
+            torn = sum(r['torn'] for r in out)
+            missed = sum(r['missed'] for r in out)
+            # Consumer-side cost of receiving and using one frame
+            cpu_ms = 1000 * sum(r['cpu'] for r in out) / max(sum(r['frames'] for r in out), 1)
+            print(f'{label:<10} {consumers:>9} {produced:>10.1f} {np.mean(rates):>14.1f} '
+                  f'{sum(rates):>8.1f} {cpu_ms:>12.2f} {lost:>6} {torn:>5} {missed:>6}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import pickle
+import socket
+import struct
+import threading
+import time
+
+import cv2
+
+from frame_protocol import FrameReader, FrameServer, ProtocolError, send_frame
+from frame_source import SyntheticSource
+
+
+def make_frames(count, size, quality):
+    source = SyntheticSource(size, fmt='RGB888')
+    return [cv2.imencode('.jpg', source.capture_array(), [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1]
+            for _ in range(count)]
+
+
+def bench_pickle(frames, duration):
+    # The old camera_stream.py wire format and the matching client loop
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('127.0.0.1', 0))
+    server_socket.listen(1)
+    port = server_socket.getsockname()[1]
+    stop = threading.Event()
+
+    def send():
+        client_socket, _ = server_socket.accept()
+        i = 0
+        try:
+            while not stop.is_set():
+                data = pickle.dumps(frames[i % len(frames)])
+                client_socket.sendall(struct.pack("L", len(data)) + data)
+                i += 1
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def recv_more(sock):
+        # recv() returns b'' once the sender has gone; the old client
+        # looped on that forever
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ProtocolError('Connection closed mid-frame')
+        return chunk
+
+    threading.Thread(target=send, daemon=True).start()
+    sock = socket.create_connection(('127.0.0.1', port))
+    payload_size = struct.calcsize("L")
+    data = b''
+    received = nbytes = 0
+    end = time.perf_counter() + duration
+    t_start = time.perf_counter()
+    while time.perf_counter() < end:
+        while len(data) < payload_size:
+            data += recv_more(sock)
+        msg_size = struct.unpack("L", data[:payload_size])[0]
+        data = data[payload_size:]
+        while len(data) < msg_size:
+            data += recv_more(sock)
+        frame = pickle.loads(data[:msg_size])
+        data = data[msg_size:]
+        received += 1
+        nbytes += len(frame)
+    elapsed = time.perf_counter() - t_start
+    stop.set()
+    sock.close()
+    server_socket.close()
+    return received / elapsed, nbytes / elapsed
+
+
+def receive(sock, duration):
+    reader = FrameReader(sock)
+    received = nbytes = 0
+    end = time.perf_counter() + duration
+    t_start = time.perf_counter()
+    while time.perf_counter() < end:
+        frame = reader.read()
+        if frame is None:
+            raise ProtocolError('Sender closed the connection')
+        seq, timestamp, payload = frame
+        received += 1
+        nbytes += len(payload)
+    elapsed = time.perf_counter() - t_start
+    return received / elapsed, nbytes / elapsed
+
+
+def bench_direct(frames, duration):
+    # Wire format alone: one thread calling send_frame back to back
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('127.0.0.1', 0))
+    server_socket.listen(1)
+    stop = threading.Event()
+
+    def send():
+        client_socket, _ = server_socket.accept()
+        i = 0
+        try:
+            while not stop.is_set():
+                send_frame(client_socket, i + 1, time.time(), frames[i % len(frames)])
+                i += 1
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    sock = socket.create_connection(server_socket.getsockname())
+    result = receive(sock, duration)
+    stop.set()
+    sock.close()
+    server_socket.close()
+    return result
+
+
+def bench_server(frames, duration):
+    # Full FrameServer path, including the hand-off to the per-client
+    # sender thread that the capture loop relies on
+    server = FrameServer(('127.0.0.1', 0))
+    server.start()
+    stop = threading.Event()
+
+    def send():
+        # Publish flat out; the sender thread paces itself to the client
+        i = 0
+        while not stop.is_set():
+            server.publish(frames[i % len(frames)], time.time())
+            i += 1
+            if i % 64 == 0:
+                time.sleep(0)
+
+    sock = socket.create_connection(server.address)
+    while not server.client_count:
+        time.sleep(0.01)
+    threading.Thread(target=send, daemon=True).start()
+    result = receive(sock, duration)
+    stop.set()
+    sock.close()
+    server.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback frames/s and bytes/s: pickle vs framed protocol')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--quality', type=int, default=80)
+    args = parser.parse_args()
+
+    print(f"{'resolution':>10} {'protocol':<14} {'frames/s':>10} {'MB/s':>8}")
+    for size in ((320, 240), (640, 480), (1280, 720)):
+        frames = make_frames(10, size, args.quality)
+        for name, bench in (('pickle', bench_pickle), ('framed', bench_direct), ('framed+server', bench_server)):
+            fps, bps = bench(frames, args.duration)
+            print(f"{f'{size[0]}x{size[1]}':>10} {name:<14} {fps:>10.0f} {bps / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from annotated_stream import AnnotatedStreamPublisher
+from frame_source import SyntheticSource
+from overlay import BBOX_COLORS, OverlayRenderer
+from postprocess import make_detections
+from streaming import StreamingOutput
+
+# Detection loop FPS with and without the overlay, in the ways
+# yolo_detect.py can run: headless with nothing wanting annotated frames,
+# headless feeding the annotated stream (only frames the stream takes are
+# drawn), and annotating every frame with the cached renderer or with the
+# old per-box cv2.getTextSize drawing. Frames are captured up front so
+# the loop's own cost is just copying one into the working buffer. The
+# windowed loop (imshow + waitKey(5)) is measured with a display (DISPLAY
+# set) and otherwise simulated as a 5 ms wait.
+#
+#   python bench_overlay.py --frames 300 --dets 10 --infer-ms 30
+
+
+def draw_uncached(frame, dets, labels):
+    # yolo_detect.py's drawing before OverlayRenderer, as the baseline
+    for (xmin, ymin, xmax, ymax), classidx, conf in zip(dets['xyxy'].astype(int).tolist(), dets['cls'].tolist(),
+                                                        dets['conf'].tolist()):
+        color = BBOX_COLORS[classidx % 10]
+        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 2)
+        label = f'{labels[classidx]}: {int(conf*100)}%'
+        labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        label_ymin = max(ymin, labelSize[1] + 10)
+        cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), color, cv2.FILLED)
+        cv2.putText(frame, label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    for i, line in enumerate(('FPS: 0.00', f'Number of objects: {len(dets)}')):
+        cv2.putText(frame, line, (10, 20 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, .7, (0, 255, 255), 2)
+
+
+def make_dets(rng, count, size, classes):
+    w, h = size
+    xy = rng.uniform(0, [w - 80, h - 80], size=(count, 2))
+    return make_detections(np.hstack([xy, xy + rng.uniform(20, 80, size=(count, 2))]),
+                           rng.uniform(0.5, 1.0, count), rng.integers(0, classes, count))
+
+
+def run_loop(captured, args, mode, labels, rng):
+    # Stand-in for run_sequential: capture, a fixed inference cost that
+    # releases the GIL like the NCNN backend does, then the overlay
+    renderer = OverlayRenderer(labels)
+    publisher = None
+    if mode == 'stream':
+        publisher = AnnotatedStreamPublisher(StreamingOutput(), max_fps=args.stream_fps)
+        publisher.start()
+    h, w = captured[0].shape[:2]
+    frame = np.empty_like(captured[0])
+    dets_per_frame = [make_dets(rng, args.dets, (w, h), len(labels)) for _ in range(args.frames)]
+    overlay_time = 0.0
+    drawn = 0
+    t_start = time.perf_counter()
+    for i, dets in enumerate(dets_per_frame):
+        np.copyto(frame, captured[i % len(captured)])
+        if args.infer_ms:
+            time.sleep(args.infer_ms / 1000)
+        t0 = time.perf_counter()
+        if mode in ('uncached', 'window', 'simulated window'):
+            draw_uncached(frame, dets, labels)
+        elif mode == 'cached' or (mode == 'stream' and publisher.due()):
+            renderer.draw(frame, dets, status=('FPS: 0.00', f'Number of objects: {len(dets)}'))
+        else:
+            t0 = None
+        if t0 is not None:
+            overlay_time += time.perf_counter() - t0
+            drawn += 1
+        if publisher is not None and t0 is not None:
+            publisher.submit(frame)
+        if mode == 'window':
+            cv2.imshow('bench', frame)
+            cv2.waitKey(5)
+        elif mode == 'simulated window':
+            time.sleep(0.005)
+    fps = args.frames / (time.perf_counter() - t_start)
+    if publisher is not None:
+        publisher.close()
+    if mode == 'window':
+        cv2.destroyAllWindows()
+    return fps, drawn, 1000 * overlay_time / max(drawn, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detection loop FPS with and without the overlay')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--dets', type=int, default=10, help='Detections drawn per frame')
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--infer-ms', type=float, default=30.0, help='Simulated inference time per frame')
+    parser.add_argument('--stream-fps', type=float, default=10.0)
+    parser.add_argument('--size', default='640x480')
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split('x'))
+    labels = {i: f'defect_{i}' for i in range(args.classes)}
+    modes = [('headless, no consumer', 'none'),
+             (f'headless, stream {args.stream_fps:g} FPS', 'stream'),
+             ('every frame, cached', 'cached'),
+             ('every frame, uncached', 'uncached')]
+    if os.environ.get('DISPLAY'):
+        modes.append(('window, uncached', 'window'))
+    else:
+        modes.append(('window, uncached (simulated)', 'simulated window'))
+    source = SyntheticSource(size)
+    captured = [source.capture_array()[:, :, :3].copy() for _ in range(8)]
+
+    print(f'{args.frames} frames at {args.size}, {args.dets} detections/frame, {args.infer_ms:.0f} ms inference')
+    print(f"{'loop':<30} {'FPS':>8} {'drawn':>6} {'overlay ms':>10}")
+    for name, mode in modes:
+        rng = np.random.default_rng(0)
+        fps, drawn, overlay_ms = run_loop(captured, args, mode, labels, rng)
+        print(f'{name:<30} {fps:>8.1f} {drawn:>6} {overlay_ms:>10.3f}')
+
+
+if __name__ == "__main__":
+    main()
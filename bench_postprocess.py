@@ -0,0 +1,95 @@
+import argparse
+import time
+
+import numpy as np
+
+from postprocess import extract_detections
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+# Stand-in for ultralytics Boxes: indexing returns another Boxes view and
+# xyxy/conf/cls are derived from the same (N, 6) data tensor
+class SyntheticBoxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return SyntheticBoxes(self.data[idx:idx + 1] if isinstance(idx, int) else self.data[idx])
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5]
+
+
+def make_boxes(n, rng):
+    xy = rng.uniform(0, 280, size=(n, 2))
+    wh = rng.uniform(5, 40, size=(n, 2))
+    data = np.column_stack([xy, xy + wh, rng.uniform(0, 1, n), rng.integers(0, 10, n)]).astype(np.float32)
+    if torch is not None:
+        data = torch.from_numpy(data)
+    return SyntheticBoxes(data)
+
+
+def _item(value):
+    return value.item() if hasattr(value, 'item') else float(value.squeeze())
+
+
+# The original yolo_detect.py loop: several views and host copies per box
+def per_box(detections, min_thresh):
+    kept = []
+    for i in range(len(detections)):
+        xyxy_tensor = detections[i].xyxy
+        if hasattr(xyxy_tensor, 'cpu'):
+            xyxy_tensor = xyxy_tensor.cpu().numpy()
+        xmin, ymin, xmax, ymax = xyxy_tensor.squeeze().astype(int)
+        classidx = int(_item(detections[i].cls))
+        conf = _item(detections[i].conf)
+        if conf > min_thresh:
+            kept.append((xmin, ymin, xmax, ymax, classidx, conf))
+    return kept
+
+
+def vectorized(detections, min_thresh):
+    dets = extract_detections(detections, min_thresh)
+    return dets['xyxy'].astype(int).tolist(), dets['cls'].tolist(), dets['conf'].tolist()
+
+
+def time_it(func, boxes, repeats):
+    t_start = time.perf_counter()
+    for _ in range(repeats):
+        func(boxes, 0.5)
+    return (time.perf_counter() - t_start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-box vs vectorized detection post-processing')
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"Backing arrays: {'torch' if torch is not None else 'numpy'}")
+    print(f"{'boxes':>6} {'per-box us':>12} {'vectorized us':>14} {'speedup':>8}")
+    for n in (0, 1, 5, 10, 25, 50, 100, 200, 300):
+        boxes = make_boxes(n, rng)
+        t_loop = time_it(per_box, boxes, args.repeats)
+        t_vec = time_it(vectorized, boxes, args.repeats)
+        print(f'{n:>6} {t_loop:>12.1f} {t_vec:>14.1f} {t_loop / t_vec:>7.1f}x')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+
+from motor import MockGPIO, MotorController, SPEEDS
+from speed_control import DutyCalibration, SpeedGovernor, max_ground_speed
+
+
+def parse_profile(text):
+    # "8:20,3:20,8:20" -> [(rate, seconds), ...]
+    return [tuple(float(v) for v in part.split(':')) for part in text.split(',')]
+
+
+def simulate(profile, footprint, overlap, calibration, governed, fixed_duty, step=0.01, interval=0.5):
+    # Drives the real MotorController on a MockGPIO with a simulated
+    # detector whose analysed-frame rate follows `profile`. Time is
+    # simulated, so a minute of driving runs in well under a second.
+    # Returns the largest distance between consecutive analysed frames,
+    # which must stay under footprint * (1 - overlap) for full coverage.
+    gpio = MockGPIO()
+    motors = MotorController(gpio, speed=fixed_duty)
+    motors.start()
+    motors.submit('forward').wait()
+    pwm = motors._pwm[0]
+
+    analysed = [0.0]
+    governor = None
+    if governed:
+        governor = SpeedGovernor(motors, lambda: int(analysed[0]), footprint, overlap, calibration,
+                                 interval=interval)
+
+    allowed = footprint * (1.0 - overlap)
+    t = position = distance_since = worst_gap = 0.0
+    next_update = 0.0
+    gaps_over = frames = 0
+    for rate, seconds in profile:
+        end = t + seconds
+        while t < end:
+            if governor is not None and t >= next_update:
+                governor.update(t)
+                governor.applied.wait(timeout=1)
+                next_update = t + interval
+            ground_speed = calibration.speed(pwm.duty)
+            position += ground_speed * step
+            distance_since += ground_speed * step
+            before = int(analysed[0])
+            analysed[0] += rate * step
+            if int(analysed[0]) > before:
+                frames += 1
+                worst_gap = max(worst_gap, distance_since)
+                gaps_over += distance_since > allowed
+                distance_since = 0.0
+            t += step
+    motors.close()
+    return position, frames, worst_gap, gaps_over
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated coverage with and without the speed governor')
+    parser.add_argument('--profile', default='8:20,3:20,1:10,8:20',
+                        help='Analysed frames/s and seconds per phase, e.g. 8:20,3:20 for thermal throttling')
+    parser.add_argument('--footprint', type=float, default=0.3, help='Metres of track per analysed frame')
+    parser.add_argument('--overlap', type=float, default=0.3)
+    parser.add_argument('--fixed-duty', type=float, default=SPEEDS['medium'])
+    parser.add_argument('--speed-per-duty', type=float, default=0.015, help='m/s per percent duty above --min-duty')
+    parser.add_argument('--min-duty', type=float, default=20.0)
+    args = parser.parse_args()
+
+    calibration = DutyCalibration(args.speed_per_duty, args.min_duty)
+    profile = parse_profile(args.profile)
+    allowed = args.footprint * (1.0 - args.overlap)
+    print(f'Allowed advance per analysed frame: {allowed:.3f} m; '
+          f'max speed at 8 FPS: {max_ground_speed(args.footprint, args.overlap, 8):.2f} m/s')
+    print(f"{'mode':<10} {'distance m':>10} {'frames':>7} {'worst gap m':>12} {'gaps > allowed':>15}")
+    for name, governed in (('fixed', False), ('governed', True)):
+        distance, frames, worst_gap, gaps_over = simulate(profile, args.footprint, args.overlap, calibration,
+                                                          governed, args.fixed_duty)
+        print(f'{name:<10} {distance:>10.1f} {frames:>7} {worst_gap:>12.3f} {gaps_over:>15}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Starts yolo_detect.py from scratch several times per configuration and
+# reports how long it takes to be ready and to finish its first
+# detection, measured from process start. Extra arguments after -- are
+# passed through, e.g. -- --source synthetic on a machine without a camera.
+
+CONFIGS = (
+    ('serial, no warm-up', ['--serial-startup', '--warmup', '0']),
+    ('serial, warm-up', ['--serial-startup']),
+    ('concurrent, warm-up', []),
+)
+
+
+def run_once(script, extra, passthrough):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.json')
+        subprocess.run([sys.executable, script, '--startup-bench', path] + extra + passthrough,
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(path) as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time-to-first-detection of yolo_detect.py')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--script', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yolo_detect.py'))
+    parser.add_argument('passthrough', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    passthrough = [a for a in args.passthrough if a != '--']
+
+    print(f"{'startup':<22} {'imports s':>9} {'model s':>8} {'camera s':>9} {'ready s':>8} "
+          f"{'1st inf ms':>10} {'1st det s':>9}")
+    for name, extra in CONFIGS:
+        runs = [run_once(args.script, extra, passthrough) for _ in range(args.runs)]
+        def median(section, key, scale=1.0):
+            return statistics.median(r[section][key] for r in runs) * scale
+        print(f"{name:<22} {median('marks_s', 'imports'):>9.2f} {median('durations_s', 'model_load'):>8.2f} "
+              f"{median('durations_s', 'camera_open'):>9.2f} {median('marks_s', 'ready'):>8.2f} "
+              f"{median('durations_s', 'first_inference', 1000):>10.1f} {median('marks_s', 'first_detection'):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
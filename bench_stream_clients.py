@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import threading
+import time
+
+import cv2
+
+from async_stream import AsyncMjpegServer
+from frame_source import SyntheticSource
+from streaming import StreamingHandler, StreamingOutput, StreamingServer
+
+
+def make_frames(count=30, size=(640, 480), quality=70):
+    # Pre-encoded JPEGs so the benchmark measures serving, not encoding
+    source = SyntheticSource(size, fmt='RGB888')
+    return [cv2.imencode('.jpg', source.capture_array(), [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+            for _ in range(count)]
+
+
+def run_clients(port, clients, duration, results):
+    # Viewer side, in its own process so its CPU is not charged to the server
+    async def viewer(counts, i):
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /stream.mjpg HTTP/1.0\r\n\r\n')
+            await writer.drain()
+            end = time.monotonic() + duration
+            while time.monotonic() < end:
+                data = await asyncio.wait_for(reader.read(256 * 1024), timeout=max(end - time.monotonic(), 0.01))
+                if not data:
+                    break
+                counts[i] += data.count(b'--FRAME')
+            writer.close()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    async def main():
+        counts = [0] * clients
+        await asyncio.gather(*(viewer(counts, i) for i in range(clients)))
+        results.put(counts)
+
+    asyncio.run(main())
+
+
+def run_case(kind, clients, port, duration, fps, frames, results):
+    output = StreamingOutput()
+    if kind == 'threaded':
+        server = StreamingServer(('127.0.0.1', port), StreamingHandler, output)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server = AsyncMjpegServer(('127.0.0.1', port))
+        server.attach(output)
+        server.start()
+
+    stop = threading.Event()
+
+    def feed():
+        # Stand-in for the JpegEncoder thread writing into FileOutput
+        i = 0
+        while not stop.is_set():
+            output.write(frames[i % len(frames)])
+            i += 1
+            time.sleep(1.0 / fps)
+
+    threading.Thread(target=feed, daemon=True).start()
+
+    client_results = multiprocessing.Queue()
+    viewer_proc = multiprocessing.Process(target=run_clients, args=(port, clients, duration + 1.0, client_results))
+    viewer_proc.start()
+
+    # Measure once every viewer has connected
+    time.sleep(1.0)
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    t_start = time.perf_counter()
+    time.sleep(duration)
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    wall = time.perf_counter() - t_start
+
+    counts = client_results.get()
+    viewer_proc.join()
+    stop.set()
+    server.shutdown()
+
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    switches = (usage_end.ru_nvcsw - usage_start.ru_nvcsw) + (usage_end.ru_nivcsw - usage_start.ru_nivcsw)
+    results.put({
+        'cpu_percent': cpu / wall * 100,
+        'context_switches_per_s': switches / wall,
+        'client_fps': sum(counts) / len(counts) / (duration + 1.0),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server CPU use with 1/10/50 MJPEG viewers: threaded vs asyncio')
+    parser.add_argument('--clients', default='1,10,50')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--port', type=int, default=18000)
+    args = parser.parse_args()
+
+    frames = make_frames()
+    print(f'{len(frames)} JPEG frames of ~{sum(map(len, frames)) // len(frames) // 1024} KiB at {args.fps:.0f} FPS')
+    print(f"{'server':<9} {'clients':>7} {'CPU %':>7} {'ctx sw/s':>9} {'client FPS':>11}")
+    port = args.port
+    for clients in (int(c) for c in args.clients.split(',')):
+        for kind in ('threaded', 'asyncio'):
+            results = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=run_case,
+                                           args=(kind, clients, port, args.duration, args.fps, frames, results))
+            proc.start()
+            r = results.get()
+            proc.join()
+            port += 1
+            print(f"{kind:<9} {clients:>7} {r['cpu_percent']:>7.1f} {r['context_switches_per_s']:>9.0f} {r['client_fps']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+
+from backends import (BACKENDS, DEFAULT_CACHE, THREADED_BACKENDS, backend_available, backend_of, export_imgsz,
+                      find_models, fingerprint, save_config, set_threads)
+from frame_source import open_source
+
+# Finds the fastest way to run the detector on this machine. Every model
+# in --models (NCNN, OpenVINO, ONNX and PyTorch exports) is run on the
+# same sample frames at each input size it supports and, where the
+# backend lets us, each thread count. Every configuration gets its own
+# fresh process so one backend's thread pools and memory don't skew the
+# next. The fastest configuration is written to the backend cache, which
+# yolo_detect.py loads at startup.
+#
+#   python benchmark_backends.py --models . --source recordings/run1.mp4
+
+
+def parse_list(text):
+    return [int(v) for v in text.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark exported models and cache the fastest configuration')
+    parser.add_argument('--models', nargs='+', default=['.'],
+                        help='Model files/directories, or directories to search for them')
+    parser.add_argument('--source', default='synthetic',
+                        help='Where sample frames come from: synthetic, an image directory or a video file')
+    parser.add_argument('--resolution', default='320x240', metavar='WxH', help='Capture resolution of the samples')
+    parser.add_argument('--samples', type=int, default=16, help='Distinct sample frames')
+    parser.add_argument('--imgsz', type=parse_list, default=[320, 416, 640],
+                        help='Input sizes to try on models that accept any size')
+    parser.add_argument('--min-imgsz', type=int, default=320,
+                        help='Smallest input size allowed to win; smaller is faster but misses small defects')
+    parser.add_argument('--threads', type=parse_list, default=None,
+                        help='Thread counts to try (default: 1, 2, ... up to the core count)')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--cache', default=DEFAULT_CACHE)
+    parser.add_argument('--timeout', type=float, default=600.0,
+                        help='Seconds one configuration may take before it is recorded as failed')
+    return parser.parse_args()
+
+
+def candidates(args):
+    # (model, backend, imgsz, threads) for every configuration worth timing
+    paths = []
+    for path in args.models:
+        if backend_of(path) is not None:
+            paths.append(path)
+        elif os.path.isdir(path):
+            paths.extend(find_models(path))
+    threads = args.threads or sorted({1, 2, 4, os.cpu_count()} & set(range(1, os.cpu_count() + 1)))
+
+    configs = []
+    for path in paths:
+        backend = backend_of(path)
+        if not backend_available(backend):
+            print(f'Skipping {path}: {BACKENDS[backend][1]} is not installed')
+            continue
+        fixed = export_imgsz(path)
+        sizes = [fixed] if fixed else args.imgsz
+        counts = threads if backend in THREADED_BACKENDS else [None]
+        configs.extend((path, backend, imgsz, n) for imgsz in sizes for n in counts)
+    return configs
+
+
+def measure(path, imgsz, threads, frames, warmup, runs, results):
+    # Runs in a fresh process
+    try:
+        if threads:
+            os.environ['OMP_NUM_THREADS'] = str(threads)
+        from ultralytics import YOLO
+        t0 = time.perf_counter()
+        model = YOLO(path, task='detect')
+        model(frames[0], imgsz=imgsz, verbose=False)
+        load = time.perf_counter() - t0
+        if threads and not set_threads(model, threads):
+            threads = None
+        for i in range(warmup):
+            model(frames[i % len(frames)], imgsz=imgsz, verbose=False)
+        times = np.empty(runs)
+        t_start = time.perf_counter()
+        for i in range(runs):
+            t0 = time.perf_counter()
+            model(frames[i % len(frames)], imgsz=imgsz, verbose=False)
+            times[i] = time.perf_counter() - t0
+        total = time.perf_counter() - t_start
+        results.put({'load_s': load, 'p50_ms': float(np.percentile(times, 50)) * 1000,
+                     'p95_ms': float(np.percentile(times, 95)) * 1000, 'fps': runs / total,
+                     'threads_applied': threads is not None})
+    except Exception as e:
+        results.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def run_config(context, config, frames, args):
+    # Measures one configuration in its own process. A child that crashes
+    # (a segfault in a native backend, the OOM killer) never puts a result,
+    # so rather than block on the queue we poll it while the child lives
+    # and give up after --timeout, reporting what happened to it instead
+    path, backend, imgsz, threads = config
+    results = context.Queue()
+    proc = context.Process(target=measure, args=(path, imgsz, threads, frames, args.warmup, args.runs, results))
+    proc.start()
+    deadline = time.monotonic() + args.timeout
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1.0)
+        except queue.Empty:
+            if not proc.is_alive():
+                # It may have put its result just before exiting
+                try:
+                    result = results.get(timeout=1.0)
+                except queue.Empty:
+                    result = {'error': f'exited with code {proc.exitcode} without a result'}
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = {'error': f'no result after {args.timeout:g} s'}
+    proc.join(timeout=10)
+    if proc.is_alive():
+        proc.kill()
+        proc.join()
+    return result
+
+
+def main():
+    args = parse_args()
+    w, h = (int(v) for v in args.resolution.lower().split('x'))
+    source = open_source(args.source, (w, h), fmt='RGB888')
+    source.start()
+    frames = []
+    while len(frames) < args.samples:
+        frame = source.capture_array()
+        if frame is None:
+            break
+        frames.append(frame)
+    source.stop()
+    if not frames:
+        sys.exit(f'No sample frames from {args.source}')
+
+    configs = candidates(args)
+    if not configs:
+        sys.exit('No usable models found')
+    print(f'{len(configs)} configurations on {len(frames)} sample frames of {w}x{h}')
+    print(f"{'model':<32} {'backend':<9} {'imgsz':>5} {'threads':>7} {'load s':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'FPS':>6}")
+
+    context = multiprocessing.get_context('spawn')
+    measured = []
+    failed = []
+    for path, backend, imgsz, threads in configs:
+        result = run_config(context, (path, backend, imgsz, threads), frames, args)
+        name = os.path.basename(path.rstrip(os.sep))
+        if 'error' in result:
+            print(f"{name:<32} {backend:<9} {imgsz:>5} {threads or '-':>7} failed: {result['error']}")
+            failed.append(dict(model=path, backend=backend, imgsz=imgsz, threads=threads, error=result['error']))
+            continue
+        if threads and not result['threads_applied']:
+            threads = None
+        print(f"{name:<32} {backend:<9} {imgsz:>5} {threads or '-':>7} {result['load_s']:>7.2f} "
+              f"{result['p50_ms']:>7.1f} {result['p95_ms']:>7.1f} {result['fps']:>6.1f}")
+        measured.append(dict(result, model=path, backend=backend, imgsz=imgsz, threads=threads))
+
+    eligible = [m for m in measured if m['imgsz'] >= args.min_imgsz]
+    if not eligible:
+        sys.exit('Nothing ran successfully at or above --min-imgsz')
+    # Highest throughput wins; the tail latency breaks near-ties
+    best = max(eligible, key=lambda m: (round(m['fps'], 1), -m['p95_ms']))
+    config = {
+        'model': best['model'],
+        'backend': best['backend'],
+        'imgsz': best['imgsz'],
+        'threads': best['threads'],
+        'measured': {k: best[k] for k in ('p50_ms', 'p95_ms', 'fps')},
+        'measured_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'resolution': [w, h],
+        'fingerprint': fingerprint(best['model']),
+        'results': measured,
+        'failed': failed,
+    }
+    save_config(args.cache, config)
+    print(f"Fastest: {best['backend']} {best['model']} imgsz {best['imgsz']} "
+          f"threads {best['threads'] or 'default'} at {best['fps']:.1f} FPS; saved to {args.cache}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
-import io
+import argparse
 import logging
-import socketserver
 import sys
-import threading
-from threading import Condition
-from http import server
-import RPi.GPIO as GPIO
 from picamera2 import Picamera2
 from picamera2.encoders import JpegEncoder
 from picamera2.outputs import FileOutput
 import socket
 
+from async_stream import AsyncMjpegServer
+from motor import MotorApiServer, MotorController, load_gpio
+from metrics import attach_stream_metrics
+from quality_control import adapt_picamera_stream
+from streaming import StreamingHandler, StreamingOutput, StreamingServer
+
 # Get Raspberry Pi's IP dynamically
 hostname = socket.gethostname()
 ip_address = socket.gethostbyname(hostname)
@@ -19,116 +20,24 @@ ip_address = socket.gethostbyname(hostname)
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-PAGE = f"""
-<!DOCTYPE html>
-<html>
-  <head>
-    <title>Raspberry Pi Video Streaming</title>
-  </head>
-  <body>
-    <h1>Raspberry Pi Video Stream</h1>
-    <img src="stream.mjpg" width="640" height="480" />
-  </body>
-</html>
-"""
-
-# Streaming Output Class
-class StreamingOutput(io.BufferedIOBase):
-    def __init__(self):
-        self.frame = None
-        self.buffer = io.BytesIO()
-        self.condition = Condition()
-
-    def write(self, buf):
-        if buf.startswith(b'\xff\xd8'):
-            self.buffer.truncate()
-            with self.condition:
-                self.frame = self.buffer.getvalue()
-                self.condition.notify_all()
-            self.buffer.seek(0)
-        return self.buffer.write(buf)
-
-# HTTP Request Handler
-class StreamingHandler(server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/':
-            self.send_response(301)
-            self.send_header('Location', '/index.html')
-            self.end_headers()
-        elif self.path == '/index.html':
-            content = PAGE.encode('utf-8')
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html')
-            self.send_header('Content-Length', len(content))
-            self.end_headers()
-            self.wfile.write(content)
-        elif self.path == '/stream.mjpg':
-            self.send_response(200)
-            self.send_header('Age', 0)
-            self.send_header('Cache-Control', 'no-cache, private')
-            self.send_header('Pragma', 'no-cache')
-            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
-            self.end_headers()
-            try:
-                while True:
-                    with output.condition:
-                        output.condition.wait()
-                        frame = output.frame
-                    self.wfile.write(b'--FRAME\r\n')
-                    self.send_header('Content-Type', 'image/jpeg')
-                    self.send_header('Content-Length', len(frame))
-                    self.end_headers()
-                    self.wfile.write(frame)
-                    self.wfile.write(b'\r\n')
-            except Exception as e:
-                logging.warning('Removed streaming client %s: %s', self.client_address, str(e))
-        else:
-            self.send_error(404)
-            self.end_headers()
-
-# HTTP Server
-class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
-    allow_reuse_address = True
-    daemon_threads = True
-
-# Motor Control Function
-def motor_control():
-    # Define Motor A Pins
-    in1, in2, en1 = 24, 23, 25
-    # Define Motor B Pins
-    in3, in4, en2 = 17, 27, 22
-
-    # Setup GPIO
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setup(in1, GPIO.OUT)
-    GPIO.setup(in2, GPIO.OUT)
-    GPIO.setup(en1, GPIO.OUT)
-    GPIO.setup(in3, GPIO.OUT)
-    GPIO.setup(in4, GPIO.OUT)
-    GPIO.setup(en2, GPIO.OUT)
-
-    # Set Motors to Forward Motion
-    GPIO.output(in1, GPIO.HIGH)
-    GPIO.output(in2, GPIO.LOW)
-    GPIO.output(in3, GPIO.LOW)
-    GPIO.output(in4, GPIO.HIGH)
-
-    # Setup PWM for Speed Control
-    pwm1 = GPIO.PWM(en1, 1000)
-    pwm2 = GPIO.PWM(en2, 1000)
-    pwm1.start(50)  # Medium Speed
-    pwm2.start(50)  # Medium Speed
-    
-    logging.info("Motors running at medium speed...")
-    try:
-        while True:
-            pass  # Keep running indefinitely
-    except KeyboardInterrupt:
-        GPIO.cleanup()
-        logging.info("Motor Control Stopped.")
+def parse_args():
+    parser = argparse.ArgumentParser(description='MJPEG stream from the Pi camera while the motors run')
+    parser.add_argument('--threaded', action='store_true',
+                        help='Use the old thread-per-client server instead of the asyncio broadcaster')
+    parser.add_argument('--quality', type=int, default=70,
+                        help='JPEG quality; the starting point when adapting')
+    parser.add_argument('--fixed-quality', action='store_true',
+                        help="Don't adapt quality and frame rate to the viewers' throughput")
+    parser.add_argument('--motor-port', type=int, default=8001,
+                        help='Port of the HTTP motor command API')
+    parser.add_argument('--mock-gpio', action='store_true',
+                        help='Drive a simulated GPIO instead of the motor pins')
+    return parser.parse_args()
 
 # Main Function: Start Streaming & Motor in Parallel
 def main():
+    args = parse_args()
+    motors = None
     try:
         # Start Camera Streaming
         picam2 = Picamera2()
@@ -136,19 +45,32 @@ def main():
         picam2.configure(video_config)
         picam2.start()
         
-        # Set up the output
-        global output
+        # Set up the server and the output the encoder writes into
+        address = ('', 8000)
         output = StreamingOutput()
-        encoder = JpegEncoder(q=70)
+        if args.threaded:
+            server = StreamingServer(address, StreamingHandler, output)
+        else:
+            server = AsyncMjpegServer(address)
+            server.attach(output)
+        encoder = JpegEncoder(q=args.quality)
         picam2.start_encoder(encoder, FileOutput(output))
-
-        # Start Motor Control in a Separate Thread
-        motor_thread = threading.Thread(target=motor_control, daemon=True)
-        motor_thread.start()
+        if not args.fixed_quality:
+            adapt_picamera_stream(picam2, encoder, output, server)
+        # Frame, viewer and temperature counters for Prometheus at /metrics
+        attach_stream_metrics(server, output)
+
+        # Motors run on their own thread that sleeps until a command
+        # arrives; start them forward at medium speed as before
+        motors = MotorController(load_gpio(args.mock_gpio))
+        motors.start()
+        motors.submit('speed', 'medium')
+        motors.submit('forward')
+        motor_api = MotorApiServer(('', args.motor_port), motors)
+        motor_api.start()
+        logging.info(f"Motor API at http://{ip_address}:{args.motor_port}/motor")
 
         # Start Server for Camera Streaming
-        address = ('', 8000)
-        server = StreamingServer(address, StreamingHandler)
         logging.info(f"Server started. Access stream at http://{ip_address}:8000")
         server.serve_forever()
 
@@ -161,7 +83,9 @@ def main():
             picam2.stop()
         except:
             pass
-        GPIO.cleanup()
+        if motors is not None:
+            motors.close()
+            logging.info("Motor Control Stopped.")
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,29 @@
+import argparse
 import time
 import cv2
 import numpy as np
-from picamera2 import Picamera2
+
+from frame_convert import BgrConverter
+from frame_source import open_source
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Show the camera feed with an FPS counter')
+    parser.add_argument('--source', default='picamera0',
+                        help='picamera0, synthetic[:N], an image directory or a video file')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Pace file and synthetic sources to their frame rate')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     # Resolution - using a low resolution for better performance
     resW, resH = 320, 240
     
     # Set up picamera
-    cap = Picamera2()
-    cap.configure(cap.create_video_configuration(main={"format": 'XRGB8888', "size": (resW, resH)}))
+    cap = open_source(args.source, (resW, resH), realtime=args.realtime)
     cap.start()
+    converter = BgrConverter()
     
     # Initialize variables for FPS calculation
     fps_avg_len = 30  # Number of frames to average for FPS calculation
@@ -26,7 +39,10 @@ def main():
         
         # Capture frame from picamera
         frame_bgra = cap.capture_array()
-        frame = cv2.cvtColor(np.copy(frame_bgra), cv2.COLOR_BGRA2BGR)
+        if frame_bgra is None:
+            print("Source exhausted.")
+            break
+        frame = converter.convert(frame_bgra)
         
         if frame is None:
             print("Unable to read frames from the Picamera. Camera might be disconnected.")
@@ -1,12 +1,39 @@
+import argparse
+import logging
 import time
 import cv2
 import numpy as np
 import socket
-import pickle
-import struct
-from picamera2 import Picamera2
+
+from frame_bus import FrameBusWriter
+from frame_convert import BgrConverter
+from frame_protocol import FrameServer
+from frame_source import open_source
+from quality_control import QualityController, QualityLoop, build_ladder
+from startup import sd_notify
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Stream JPEG frames from the camera over TCP')
+    parser.add_argument('--source', default='picamera0',
+                        help='picamera0, synthetic[:N], an image directory or a video file')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Pace file and synthetic sources to their frame rate')
+    parser.add_argument('--quality', type=int, default=80,
+                        help='JPEG quality; the starting point when adapting')
+    parser.add_argument('--fixed-quality', action='store_true',
+                        help="Don't adapt quality, resolution and frame rate to the receivers' throughput")
+    parser.add_argument('--bus', metavar='NAME',
+                        help='Also publish every captured frame on a shared-memory frame bus for local '
+                             'consumers (e.g. yolo_detect.py --source bus:NAME)')
+    parser.add_argument('--bus-slots', type=int, default=8,
+                        help='Frames the bus keeps; a consumer further behind than this loses frames')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     # Get the Raspberry Pi's IP address (you'll need this for the client)
     hostname = socket.gethostname()
     server_ip = socket.gethostbyname(hostname)
@@ -16,29 +43,41 @@ def main():
     resW, resH = 320, 240
     
     # Set up picamera
-    cap = Picamera2()
-    cap.configure(cap.create_video_configuration(main={"format": 'XRGB8888', "size": (resW, resH)}))
+    cap = open_source(args.source, (resW, resH), realtime=args.realtime)
     cap.start()
+    converter = BgrConverter()
+    bus = None
+    if args.bus:
+        bus = FrameBusWriter(args.bus, (resH, resW, 3), slots=args.bus_slots)
+        print(f"Publishing frames on frame bus {args.bus}")
     
     # Initialize variables for FPS calculation
     fps_avg_len = 30
     frame_rate_buffer = []
     avg_frame_rate = 0
     
-    # Create socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Start the frame server; any number of receivers can connect and
+    # disconnect while we keep capturing
     port = 8485
-    socket_address = ('0.0.0.0', port)  # Listen on all available interfaces
-    
-    # Socket settings
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind(socket_address)
-    server_socket.listen(5)
+    frame_server = FrameServer(('0.0.0.0', port))  # Listen on all available interfaces
+    frame_server.start()
     print(f"Listening on port {port}...")
+    # Tell systemd (Type=notify) we're up; a no-op when run by hand
+    sd_notify('READY=1')
     
-    # Accept client connection
-    client_socket, addr = server_socket.accept()
-    print(f"Connection from: {addr}")
+    # Quality drops first, then resolution, then frame rate when the
+    # receivers fall behind or encoding can't keep up
+    encode_seconds = 0.0
+    if args.fixed_quality:
+        ladder = build_ladder(args.quality, args.quality)
+    else:
+        ladder = build_ladder(args.quality, 30, scales=(1.0, 0.75, 0.5), fps_steps=(None, 15, 10))
+    controller = QualityController(ladder)
+    control = QualityLoop(controller, frame_server.output, lambda: frame_server.clients,
+                          encode_seconds=lambda: encode_seconds)
+    if not args.fixed_quality:
+        control.start()
+    next_send = 0.0
     
     try:
         while True:
@@ -47,34 +86,43 @@ def main():
             
             # Capture frame from picamera
             frame_bgra = cap.capture_array()
-            frame = cv2.cvtColor(np.copy(frame_bgra), cv2.COLOR_BGRA2BGR)
+            t_capture = time.time()
+            if frame_bgra is None:
+                print("Source exhausted.")
+                break
+            frame = converter.convert(frame_bgra)
             
             if frame is None:
                 print("Unable to read frames from the Picamera. Camera might be disconnected.")
                 break
             
+            # Local consumers get the clean frame, before anything is drawn
+            if bus is not None:
+                bus.publish(frame, t_capture)
+            
             # Draw FPS on frame
-            cv2.putText(frame, f'FPS: {avg_frame_rate:.2f}', (10, 30), 
+            point = controller.point
+            cv2.putText(frame, f'FPS: {avg_frame_rate:.2f} Q{point.quality}', (10, 30), 
                         cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
             
             # Optional: Display frame locally on Raspberry Pi
             # cv2.imshow('Server Feed', frame)
             
-            # Compress the frame to save bandwidth (JPEG encoding)
-            ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-            
-            # Serialize frame
-            data = pickle.dumps(buffer)
-            
-            # Send message length first
-            message_size = struct.pack("L", len(data))
-            
-            # Send data
-            try:
-                client_socket.sendall(message_size + data)
-            except:
-                print("Connection lost")
-                break
+            # Compress the frame to save bandwidth (JPEG encoding), but
+            # only when someone is watching and the frame rate cap allows
+            if frame_server.client_count and t_start >= next_send:
+                if point.fps:
+                    next_send = t_start + 1.0 / point.fps
+                if point.scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=point.scale, fy=point.scale, interpolation=cv2.INTER_AREA)
+                t_encode = time.perf_counter()
+                ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), point.quality])
+                encode_seconds = time.perf_counter() - t_encode
+                
+                # Hand the encoded bytes to the per-client sender threads;
+                # they are sent as-is, with no serialization step
+                if ret:
+                    frame_server.publish(buffer, t_capture)
             
             # Calculate FPS
             t_stop = time.perf_counter()
@@ -99,8 +147,11 @@ def main():
         print(f'Average FPS: {avg_frame_rate:.2f}')
         cap.stop()
         # cv2.destroyAllWindows()
-        client_socket.close()
-        server_socket.close()
+        if control.is_alive():
+            control.close()
+        frame_server.close()
+        if bus is not None:
+            bus.close()
         print("Server shut down")
 
 if __name__ == "__main__":
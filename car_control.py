@@ -1,98 +1,76 @@
-import RPi.GPIO as GPIO          
-from time import sleep
-
-# Define Motor A Pins
-in1 = 24
-in2 = 23
-en1 = 25
-
-# Define Motor B Pins
-in3 = 17
-in4 = 27
-en2 = 22
-
-# Setup GPIO Mode
-GPIO.setmode(GPIO.BCM)
-
-# Setup Motor A Pins
-GPIO.setup(in1, GPIO.OUT)
-GPIO.setup(in2, GPIO.OUT)
-GPIO.setup(en1, GPIO.OUT)
-
-# Setup Motor B Pins
-GPIO.setup(in3, GPIO.OUT)
-GPIO.setup(in4, GPIO.OUT)
-GPIO.setup(en2, GPIO.OUT)
-
-# Initialize Motors as Stopped
-GPIO.output(in1, GPIO.LOW)
-GPIO.output(in2, GPIO.LOW)
-GPIO.output(in3, GPIO.LOW)
-GPIO.output(in4, GPIO.LOW)
-
-# Setup PWM for Speed Control
-pwm1 = GPIO.PWM(en1, 1000)  # Motor A Speed
-pwm2 = GPIO.PWM(en2, 1000)  # Motor B Speed
-
-# Start PWM with 25% duty cycle (Low Speed)
-pwm1.start(25)
-pwm2.start(25)
-
-print("\n")
-print("Two Motor Control")
-print("Commands: r-run | s-stop | f-forward | b-backward | l-low | m-medium | h-high | e-exit")
-print("\n")
-
-while True:
-    x = input("Enter Command: ").lower()
-    
-    if x == 'r':  # Run in last direction
-        print("Run Motors")
-        GPIO.output(in1, GPIO.HIGH)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.LOW)  # Swapped for correction
-        GPIO.output(in4, GPIO.HIGH)  # Swapped for correction
-
-    elif x == 's':  # Stop Both Motors
-        print("Stop")
-        GPIO.output(in1, GPIO.LOW)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.LOW)
-        GPIO.output(in4, GPIO.LOW)
-
-    elif x == 'f':  # Move Forward
-        print("Moving Forward")
-        GPIO.output(in1, GPIO.HIGH)
-        GPIO.output(in2, GPIO.LOW)
-        GPIO.output(in3, GPIO.LOW)  # Swapped for correction
-        GPIO.output(in4, GPIO.HIGH) # Swapped for correction
-
-    elif x == 'b':  # Move Backward
-        print("Moving Backward")
-        GPIO.output(in1, GPIO.LOW)
-        GPIO.output(in2, GPIO.HIGH)
-        GPIO.output(in3, GPIO.HIGH)  # Swapped for correction
-        GPIO.output(in4, GPIO.LOW)   # Swapped for correction
-
-    elif x == 'l':  # Low Speed
-        print("Setting Speed: Low")
-        pwm1.ChangeDutyCycle(25)
-        pwm2.ChangeDutyCycle(25)
-
-    elif x == 'm':  # Medium Speed
-        print("Setting Speed: Medium")
-        pwm1.ChangeDutyCycle(50)
-        pwm2.ChangeDutyCycle(50)
-
-    elif x == 'h':  # High Speed
-        print("Setting Speed: High")
-        pwm1.ChangeDutyCycle(75)
-        pwm2.ChangeDutyCycle(75)
-
-    elif x == 'e':  # Exit
-        GPIO.cleanup()
+import argparse
+import logging
+import threading
+
+from motor import MotorApiServer, MotorController, load_gpio
+
+# Console keys and the motor commands they queue
+KEYS = {
+    'r': ('run', None),        # Run in last direction
+    's': ('stop', None),       # Stop Both Motors
+    'f': ('forward', None),    # Move Forward
+    'b': ('backward', None),   # Move Backward
+    'l': ('speed', 'low'),     # Low Speed
+    'm': ('speed', 'medium'),  # Medium Speed
+    'h': ('speed', 'high'),    # High Speed
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Drive the two motors from the console or over HTTP')
+    parser.add_argument('--port', type=int,
+                        help='Also accept commands over HTTP on this port (POST /motor/<command>)')
+    parser.add_argument('--no-console', action='store_true',
+                        help='Only take commands over HTTP; needs --port')
+    parser.add_argument('--mock-gpio', action='store_true',
+                        help='Drive a simulated GPIO instead of the motor pins')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.no_console and args.port is None:
+        raise SystemExit('--no-console needs --port')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Motors start stopped at 25% duty cycle (Low Speed)
+    motors = MotorController(load_gpio(args.mock_gpio))
+    motors.start()
+
+    api = None
+    if args.port is not None:
+        api = MotorApiServer(('', args.port), motors)
+        api.start()
+        print(f"Motor API listening on port {args.port}")
+
+    try:
+        if args.no_console:
+            # Nothing to do here but wait; the API and motor threads sleep
+            # until a request or command arrives
+            threading.Event().wait()
+
+        print("\n")
+        print("Two Motor Control")
+        print("Commands: r-run | s-stop | f-forward | b-backward | l-low | m-medium | h-high | e-exit")
+        print("\n")
+
+        while True:
+            x = input("Enter Command: ").lower()
+            if x == 'e':  # Exit
+                break
+            if x not in KEYS:
+                print("Invalid Command! Please enter a valid command.")
+                continue
+            command, value = KEYS[x]
+            motors.submit(command, value).wait(timeout=1)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        if api is not None:
+            api.shutdown()
+        motors.close()
         print("GPIO Cleaned Up, Exiting...")
-        break
 
-    else:
-        print("Invalid Command! Please enter a valid command.")
+
+if __name__ == "__main__":
+    main()
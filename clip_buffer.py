@@ -0,0 +1,208 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+
+# Recent encoded frames in one preallocated buffer, bounded by bytes
+# rather than frame count so a burst of detailed (large) frames can't
+# blow the memory budget. Frames are laid end to end and wrap to the
+# start when they don't fit; the oldest frames are evicted as their
+# bytes are overwritten. Not thread-safe on its own; ClipRecorder holds a
+# lock around it.
+class JpegRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.index = collections.deque()  # (seq, timestamp, offset, length), oldest first
+        self.bytes_used = 0
+        self.evicted = 0
+        self.too_large = 0
+        self._head = 0
+
+    def append(self, seq, timestamp, frame):
+        n = len(frame)
+        if n > self.capacity:
+            self.too_large += 1
+            return False
+        wrapped = self._head + n > self.capacity
+        offset = 0 if wrapped else self._head
+        end = offset + n
+        if wrapped:
+            # Frames from the old head to the end of the buffer are the
+            # oldest left, and they're no longer contiguous with the write
+            # head; drop them with everything the new frame overwrites
+            head = self._head
+            keep = collections.deque()
+            for entry in self.index:
+                o, length = entry[2], entry[3]
+                if o >= head or (o < end and offset < o + length):
+                    self.bytes_used -= length
+                    self.evicted += 1
+                else:
+                    keep.append(entry)
+            self.index = keep
+        else:
+            # Without a wrap the frames ahead of the head are the oldest,
+            # in buffer order, so the overlapping ones are at the front
+            while self.index:
+                _, _, o, length = self.index[0]
+                if o < end and offset < o + length:
+                    self.index.popleft()
+                    self.bytes_used -= length
+                    self.evicted += 1
+                else:
+                    break
+        self.buffer[offset:end] = frame
+        self.index.append((seq, timestamp, offset, n))
+        self.bytes_used += n
+        self._head = end
+        return True
+
+    def frames_after(self, seq, until=None):
+        # Copies of (seq, timestamp, jpeg) newer than seq, up to `until`
+        out = []
+        for s, ts, offset, n in self.index:
+            if s <= seq:
+                continue
+            if until is not None and ts > until:
+                break
+            out.append((s, ts, bytes(self.buffer[offset:offset + n])))
+        return out
+
+    @property
+    def oldest(self):
+        return self.index[0][1] if self.index else None
+
+    def __len__(self):
+        return len(self.index)
+
+
+# Saves clips around defects from a stream of JPEG frames. attach() it to
+# a StreamingOutput (the same one the MJPEG servers read); every frame is
+# copied into a JpegRing, so nothing touches the SD card until trigger()
+# is called. A trigger at time t asks for [t - pre_roll, t + post_roll];
+# a trigger that lands while a clip is still open, or whose pre-roll
+# reaches back into it, extends that clip instead of starting another.
+#
+# A background thread writes each clip as concatenated JPEGs (.mjpeg,
+# playable by ffplay/VLC without re-encoding) plus a .json sidecar with
+# per-frame timestamps and the triggers it covers. Frames the ring
+# evicted before the writer got to them are counted in frames_lost.
+class ClipRecorder(threading.Thread):
+    def __init__(self, directory='clips', capacity=32 * 1024 * 1024, pre_roll=5.0, post_roll=5.0):
+        super().__init__(name='clip-recorder', daemon=True)
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.ring = JpegRing(capacity)
+        self.clips_written = 0
+        self.triggers = 0
+        self.frames_lost = 0
+        self.last_clip = None
+        self._output = None
+        self._condition = threading.Condition()
+        self._clips = collections.deque()  # the writer works on [0]
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def attach(self, output):
+        self._output = output
+        output.subscribers.append(self._on_frame)
+        return output
+
+    def _on_frame(self, seq, frame):
+        # Runs on the encoder/publisher thread: one memcpy, no I/O
+        timestamp = self._output.timestamp if self._output is not None else time.time()
+        with self._condition:
+            self.ring.append(seq, timestamp, frame)
+            if self._clips:
+                self._condition.notify()
+
+    def trigger(self, timestamp=None, reason='detection'):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._condition:
+            self.triggers += 1
+            # Merge into the newest clip if the windows touch, otherwise
+            # queue a new one behind it
+            clip = self._clips[-1] if self._clips else None
+            if clip is not None and timestamp - self.pre_roll <= clip['end']:
+                clip['end'] = max(clip['end'], timestamp + self.post_roll)
+                clip['triggers'].append({'time': timestamp, 'reason': reason})
+            else:
+                self._clips.append({'start': timestamp - self.pre_roll, 'end': timestamp + self.post_roll,
+                                    'triggers': [{'time': timestamp, 'reason': reason}], 'last_seq': 0})
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._clips and not self._closed:
+                    self._condition.wait()
+                if not self._clips:
+                    break
+                clip = self._clips[0]
+                frames = self.ring.frames_after(clip['last_seq'], clip['end'])
+                frames = [f for f in frames if f[1] >= clip['start']]
+                newest = self.ring.index[-1][1] if self.ring.index else None
+                done = self._closed or (newest is not None and newest > clip['end'])
+                if not frames and not done:
+                    self._condition.wait(timeout=1.0)
+                    continue
+                if done:
+                    # Off the queue before the lock is released, so a
+                    # trigger from now on starts a new clip rather than
+                    # extending one that is being closed
+                    self._clips.popleft()
+            self._write(clip, frames)
+            if done:
+                self._finish(clip)
+
+    def _write(self, clip, frames):
+        if not frames:
+            return
+        if 'file' not in clip:
+            name = time.strftime('clip-%Y%m%d-%H%M%S', time.localtime(clip['triggers'][0]['time']))
+            path = os.path.join(self.directory, name)
+            n = 1
+            while os.path.exists(path + '.mjpeg'):
+                n += 1
+                path = os.path.join(self.directory, f'{name}-{n}')
+            clip['path'] = path
+            clip['file'] = open(path + '.mjpeg', 'wb')
+            clip['timestamps'] = []
+        for seq, timestamp, jpeg in frames:
+            if clip['last_seq'] and seq != clip['last_seq'] + 1:
+                self.frames_lost += seq - clip['last_seq'] - 1
+            clip['file'].write(jpeg)
+            clip['timestamps'].append(timestamp)
+            clip['last_seq'] = seq
+
+    def _finish(self, clip):
+        if 'file' not in clip:
+            logging.warning('Clip around %.3f had no frames in the ring', clip['triggers'][0]['time'])
+            return
+        clip['file'].close()
+        with open(clip['path'] + '.json', 'w') as f:
+            json.dump({'start': clip['start'], 'end': clip['end'], 'frames': len(clip['timestamps']),
+                       'timestamps': clip['timestamps'], 'triggers': clip['triggers']}, f)
+        self.clips_written += 1
+        self.last_clip = clip['path'] + '.mjpeg'
+        logging.info('Saved clip %s (%d frames, %d triggers)', self.last_clip,
+                     len(clip['timestamps']), len(clip['triggers']))
+
+    def stats(self):
+        with self._condition:
+            return {'clips': self.clips_written, 'triggers': self.triggers, 'frames_lost': self.frames_lost,
+                    'ring_frames': len(self.ring), 'ring_bytes': self.ring.bytes_used,
+                    'ring_seconds': time.time() - self.ring.oldest if self.ring.oldest else 0.0,
+                    'last_clip': self.last_clip}
+
+    def close(self):
+        # Finishes the open clip with whatever post-roll has arrived
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.join(timeout=5)
@@ -0,0 +1,193 @@
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+# Bumped whenever phash() or hash_window() change, so a saved index of
+# hashes made the old way isn't matched against new ones
+HASH_VERSION = 2
+# hash_window() side as a multiple of the box's longer side
+HASH_CONTEXT = 1.5
+
+
+def phash(crop):
+    # 64-bit DCT perceptual hash: the 8x8 lowest frequencies of a 32x32
+    # grey thumbnail, one bit each for above/below their median. JPEG
+    # noise and lighting changes flip few bits. The thumbnail is blurred
+    # by about one of its pixels (at twice its size, where that's cheap)
+    # so fine texture (ballast, grain) that moves with the box doesn't
+    # decide the bits.
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    gray = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+    gray = cv2.GaussianBlur(gray, (0, 0), 2)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term is the average brightness; leave it out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_window(box, size, context=HASH_CONTEXT):
+    # The part of the frame to hash for a detection box: a square
+    # `context` times the box's longer side, centred on the box and
+    # clipped to the frame, as (x0, y0, x1, y1). Hashing box + a fixed
+    # margin made the hash follow every pixel of box jitter; centring
+    # halves the shift a moved corner causes, and the context around the
+    # box keeps a few pixels of it from being a large part of the hash.
+    # bench_crop_dedup.py measures the recall this gives.
+    x0, y0, x1, y1 = box
+    w, h = size
+    half = context * max(x1 - x0, y1 - y0, 1) / 2
+    cx = (x0 + x1) / 2
+    cy = (y0 + y1) / 2
+    return (max(round(cx - half), 0), max(round(cy - half), 0),
+            min(round(cx + half), w), min(round(cy + half), h))
+
+
+def flip_masks(bits, radius):
+    # XOR masks flipping every combination of up to `radius` of `bits` bits
+    masks = [0]
+    frontier = [(0, -1)]
+    for _ in range(radius):
+        nxt = []
+        for mask, last in frontier:
+            for b in range(last + 1, bits):
+                nxt.append((mask | (1 << b), b))
+        masks.extend(mask for mask, _ in nxt)
+        frontier = nxt
+    return masks
+
+
+# In-memory index of crop hashes answering "is there a stored hash within
+# `radius` bits of this one?" with multi-index hashing: each 64-bit hash
+# is cut into `tables` substrings, each indexed in its own dict. Two
+# hashes within `radius` bits must agree to within radius // tables bits
+# on at least one substring (pigeonhole), so a query only probes those
+# few nearby substrings per table and checks the candidates' full
+# distance, instead of scanning every stored hash.
+#
+# Entries are (id, hash, class, first_seen, last_seen, count). A crop
+# matches an entry of the same class seen within `window` seconds (None:
+# any time); the match refreshes last_seen so a defect that stays in
+# view keeps matching. The index is saved to an .npz file and loaded
+# again on the next run; past `max_entries` the least recently seen
+# tenth is forgotten.
+class CropIndex:
+    def __init__(self, radius=8, window=60.0, tables=4, max_entries=200_000, path=None):
+        if HASH_BITS % tables:
+            raise ValueError(f'tables must divide {HASH_BITS}')
+        self.radius = radius
+        self.window = window
+        self.tables = tables
+        self.max_entries = max_entries
+        self.path = path
+        self.sub_bits = HASH_BITS // tables
+        self.sub_radius = radius // tables
+        self.next_id = 1
+        self.entries = {}  # id -> [hash, cls, first_seen, last_seen, count]
+        self.lookups = 0
+        self.matches = 0
+        self._tables = [{} for _ in range(tables)]
+        self._mask = (1 << self.sub_bits) - 1
+        self._probes = flip_masks(self.sub_bits, self.sub_radius)
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _substrings(self, h):
+        return [(h >> (i * self.sub_bits)) & self._mask for i in range(self.tables)]
+
+    def _add(self, entry_id, h):
+        # Buckets hold (hash, id) so most candidates are rejected on the
+        # distance alone, without looking the entry up
+        for table, sub in zip(self._tables, self._substrings(h)):
+            table.setdefault(sub, []).append((h, entry_id))
+
+    def find(self, h, cls=None, timestamp=None):
+        # Closest live entry within radius, as (id, distance), or None
+        best = None
+        radius = self.radius
+        for table, sub in zip(self._tables, self._substrings(h)):
+            get = table.get
+            for mask in self._probes:
+                bucket = get(sub ^ mask)
+                if bucket is None:
+                    continue
+                for stored, entry_id in bucket:
+                    distance = (stored ^ h).bit_count()
+                    if distance > radius or (best is not None and distance >= best[1]):
+                        continue
+                    _, entry_cls, _, last_seen, _ = self.entries[entry_id]
+                    if cls is not None and entry_cls != cls:
+                        continue
+                    if self.window is not None and timestamp is not None and timestamp - last_seen > self.window:
+                        continue
+                    best = (entry_id, distance)
+        return best
+
+    def check(self, h, cls, timestamp=None):
+        # Returns (id, duplicate): the matching entry (refreshed), or a new
+        # entry for this hash
+        timestamp = time.time() if timestamp is None else timestamp
+        self.lookups += 1
+        match = self.find(h, cls, timestamp)
+        if match is not None:
+            entry = self.entries[match[0]]
+            entry[3] = timestamp
+            entry[4] += 1
+            self.matches += 1
+            return match[0], True
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = [h, cls, timestamp, timestamp, 1]
+        self._add(entry_id, h)
+        if len(self.entries) > self.max_entries:
+            self._evict()
+        return entry_id, False
+
+    def _evict(self):
+        keep = sorted(self.entries.items(), key=lambda item: item[1][3])[len(self.entries) // 10:]
+        self._rebuild(dict(keep))
+
+    def _rebuild(self, entries):
+        self.entries = entries
+        self._tables = [{} for _ in range(self.tables)]
+        for entry_id, (h, *_) in entries.items():
+            self._add(entry_id, h)
+
+    def save(self, path=None):
+        path = path or self.path
+        ids = np.fromiter(self.entries, dtype=np.int64, count=len(self.entries))
+        values = list(self.entries.values())
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, ids=ids,
+                 hashes=np.array([v[0] for v in values], dtype=np.uint64),
+                 cls=np.array([v[1] for v in values], dtype=np.int32),
+                 first_seen=np.array([v[2] for v in values], dtype=np.float64),
+                 last_seen=np.array([v[3] for v in values], dtype=np.float64),
+                 count=np.array([v[4] for v in values], dtype=np.int64),
+                 next_id=np.int64(self.next_id), radius=np.int64(self.radius),
+                 hash_version=np.int64(HASH_VERSION))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            if 'hash_version' not in data.files or int(data['hash_version']) != HASH_VERSION:
+                # Hashes made another way can't be compared with ours.
+                # Keep counting ids from where the old index stopped, as
+                # crop_ids already in the log refer to them.
+                logging.warning('%s holds hashes from an older phash(), starting a new index', path)
+                self.next_id = int(data['next_id'])
+                return
+            columns = [data[k].tolist() for k in ('ids', 'hashes', 'cls', 'first_seen', 'last_seen', 'count')]
+            self.next_id = int(data['next_id'])
+        self._rebuild({i: [h, c, f, l, n] for i, h, c, f, l, n in zip(*columns)})
+
+    def stats(self):
+        return {'entries': len(self.entries), 'lookups': self.lookups, 'matches': self.matches,
+                'radius': self.radius, 'window_s': self.window}
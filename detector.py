@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from backends import DEFAULT_CACHE, load_config
+from postprocess import empty_detections, extract_detections
+from roi import nms
+
+# The NCNN export used when nothing else is asked for or benchmarked
+DEFAULT_MODEL = "yolo11n_ncnn_model"
+
+
+def choose_model(model=None, backend_cache=DEFAULT_CACHE):
+    # An explicit model wins, then the benchmark's cached choice for this
+    # board, then the default NCNN export. Returns (path, imgsz, threads).
+    if model is not None:
+        return model, None, None
+    config, reason = load_config(backend_cache)
+    print(f'Backend: {reason}')
+    if config is None:
+        return DEFAULT_MODEL, None, None
+    return config['model'], config['imgsz'], config['threads']
+
+
+def load_model(path=DEFAULT_MODEL):
+    # Check if model file exists and is valid
+    if (not os.path.exists(path)):
+        print('ERROR: Model path is invalid or model was not found. Make sure the model filename was entered correctly.')
+        sys.exit(0)
+
+    # Load the model into memory and get labelmap. ultralytics (and torch
+    # behind it) is only imported here, so callers can overlap it with
+    # opening the camera
+    from ultralytics import YOLO
+    model = YOLO(path, task='detect')
+    return model, model.names
+
+
+# Runs the model on a frame, or on the rail-band tiles of a frame when a
+# RailRoi is given, and turns the output into a detection array in
+# full-frame coordinates. infer() and postprocess() are separate so the
+# capture loops can time them as separate stages. imgsz overrides the
+# model's input size (e.g. the one benchmark_backends.py picked).
+class Detector:
+    def __init__(self, model, min_thresh, roi=None, iou_thresh=0.5, imgsz=None):
+        self.model = model
+        self.min_thresh = min_thresh
+        self.roi = roi
+        self.iou_thresh = iou_thresh
+        self.predict_args = {'verbose': False}
+        if imgsz:
+            self.predict_args['imgsz'] = imgsz
+
+    def infer(self, frame):
+        if self.roi is None:
+            return self.model(frame, **self.predict_args), [(0, 0)]
+        crops, offsets = self.roi.split(frame)
+        # One call per tile: exported backends such as NCNN only run the
+        # first image of a batch
+        results = [self.model(crop, **self.predict_args)[0] for crop in crops]
+        return results, offsets
+
+    def postprocess(self, raw):
+        results, offsets = raw
+        if len(results) == 1 and offsets[0] == (0, 0):
+            return extract_detections(results[0].boxes, self.min_thresh)
+
+        parts = []
+        for result, (x0, y0) in zip(results, offsets):
+            dets = extract_detections(result.boxes, self.min_thresh)
+            if len(dets):
+                dets['xyxy'] += np.array([x0, y0, x0, y0], dtype=np.float32)
+                parts.append(dets)
+        if not parts:
+            return empty_detections()
+        dets = np.concatenate(parts)
+        if len(parts) > 1:
+            dets = nms(dets, self.iou_thresh)
+        return dets
+
+    def __call__(self, frame):
+        return self.postprocess(self.infer(frame))
+
+    def warm_up(self, size, runs=3):
+        # The first calls pay for lazy set-up inside the backend (graph
+        # build, memory pools, thread pools); get that out of the way on a
+        # blank frame before real ones arrive. Returns each run's seconds.
+        frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            self(frame)
+            times.append(time.perf_counter() - t0)
+        return times
+
+    def detect_batch(self, frames):
+        # One model call for several frames (and all their tiles), for
+        # backends that take a list of images (PyTorch, ONNX, OpenVINO).
+        # Returns one detection array per frame.
+        if self.roi is None:
+            results = self.model(list(frames), **self.predict_args)
+            return [self.postprocess(([result], [(0, 0)])) for result in results]
+        splits = [self.roi.split(frame) for frame in frames]
+        results = self.model([crop for crops, _ in splits for crop in crops], **self.predict_args)
+        dets = []
+        i = 0
+        for crops, offsets in splits:
+            dets.append(self.postprocess((results[i:i + len(crops)], offsets)))
+            i += len(crops)
+        return dets
@@ -0,0 +1,214 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from crop_dedup import CropIndex, hash_window, phash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS defects (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    label TEXT,
+    conf REAL NOT NULL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL,
+    track_id INTEGER,
+    phash INTEGER,
+    crop_id INTEGER,
+    crop BLOB
+)
+"""
+
+INSERT = ('INSERT INTO defects (ts, seq, cls, label, conf, x0, y0, x1, y1, track_id, phash, crop_id, crop) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+
+def _signed64(h):
+    # SQLite integers are signed 64-bit
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+# Append-only defect log. log() only copies the detection crops and puts
+# them on a bounded queue, so it never blocks the inference loop; if the
+# writer falls behind, records are dropped and counted rather than
+# stalling detection. A background thread JPEG-encodes the crops and
+# inserts them in batches into SQLite segment files (WAL mode), flushing
+# every `batch_size` records or `flush_interval` seconds, and starts a new
+# segment once the current one exceeds `max_bytes`.
+#
+# With a crop_dedup.CropIndex as `dedup`, log() also copies the region
+# crop_dedup.hash_window() picks around each box, and the writer hashes
+# that first and only stores the JPEG for crops the index hasn't seen.
+# Every row's crop_id is the index entry its crop matched (or started); a
+# near-duplicate still gets its row (time, box, confidence) but with a
+# NULL crop. Its image is in the row with the same crop_id and a non-NULL
+# crop, which may be in an earlier segment or an earlier run's segment
+# in this directory, since the index persists. The index is saved every
+# `dedup_save_interval` seconds and on close.
+class DefectLogger(threading.Thread):
+    def __init__(self, directory='defect_log', labels=None, max_bytes=64 * 1024 * 1024,
+                 batch_size=64, flush_interval=1.0, queue_size=2048, jpeg_quality=85, crop_margin=8,
+                 dedup=None, dedup_save_interval=60.0):
+        super().__init__(name='defect-logger', daemon=True)
+        self.directory = directory
+        self.labels = labels or {}
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.jpeg_quality = jpeg_quality
+        self.crop_margin = crop_margin
+        self.dedup = dedup
+        self.dedup_save_interval = dedup_save_interval
+        self.queue = queue.Queue(queue_size)
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.duplicates = 0
+        self.segment_path = None
+        self._conn = None
+        self._segment = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def log(self, frame, seq, dets, timestamp=None):
+        # Copy out the crops now: the frame buffer may be reused or drawn on
+        if not len(dets):
+            return 0
+        timestamp = time.time() if timestamp is None else timestamp
+        h, w = frame.shape[:2]
+        m = self.crop_margin
+        boxes = dets['xyxy'].astype(int)
+        track_ids = dets['track_id'].tolist() if 'track_id' in dets.dtype.names else [None] * len(dets)
+        for (x0, y0, x1, y1), conf, cls, track_id in zip(boxes.tolist(), dets['conf'].tolist(),
+                                                          dets['cls'].tolist(), track_ids):
+            crop = np.array(frame[max(y0 - m, 0):min(y1 + m, h), max(x0 - m, 0):min(x1 + m, w)])
+            region = None
+            if self.dedup is not None:
+                hx0, hy0, hx1, hy1 = hash_window((x0, y0, x1, y1), (w, h))
+                region = np.array(frame[hy0:hy1, hx0:hx1])
+            record = (timestamp, seq, cls, conf, (x0, y0, x1, y1), track_id, crop, region)
+            try:
+                self.queue.put_nowait(record)
+                self.logged += 1
+            except queue.Full:
+                self.dropped += 1
+        return len(dets)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def _open_segment(self):
+        if self._conn is not None:
+            self._conn.close()
+        stamp = time.strftime('defects-%Y%m%d-%H%M%S')
+        while True:
+            self._segment += 1
+            self.segment_path = os.path.join(self.directory, f'{stamp}-{self._segment:03d}.db')
+            if not os.path.exists(self.segment_path):
+                break
+        self._conn = sqlite3.connect(self.segment_path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def _segment_size(self):
+        size = 0
+        for suffix in ('', '-wal'):
+            try:
+                size += os.path.getsize(self.segment_path + suffix)
+            except OSError:
+                pass
+        return size
+
+    def _flush(self, batch):
+        rows = []
+        for timestamp, seq, cls, conf, (x0, y0, x1, y1), track_id, crop, region in batch:
+            blob = h = crop_id = None
+            duplicate = False
+            if region is not None and region.size:
+                h = phash(region)
+                crop_id, duplicate = self.dedup.check(h, cls, timestamp)
+                self.duplicates += duplicate
+                h = _signed64(h)
+            if crop.size and not duplicate:
+                ok, buf = cv2.imencode('.jpg', crop, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+                if ok:
+                    blob = buf.tobytes()
+            rows.append((timestamp, seq, cls, self.labels.get(cls), conf, x0, y0, x1, y1, track_id, h, crop_id, blob))
+        self._conn.executemany(INSERT, rows)
+        self._conn.commit()
+        self.written += len(rows)
+        self.batches += 1
+        if self._segment_size() >= self.max_bytes:
+            # Fold the WAL into the segment before moving on to a new one
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self._open_segment()
+
+    def _save_index(self):
+        try:
+            self.dedup.save()
+        except OSError as e:
+            logging.error('Saving the crop index failed: %s', e)
+
+    def run(self):
+        self._open_segment()
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        save_at = time.monotonic() + self.dedup_save_interval
+        done = False
+        while not done:
+            try:
+                record = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                if record is None:
+                    done = True
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+            if batch and (done or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self._flush(batch)
+                except sqlite3.Error as e:
+                    logging.error('Defect log write failed, %d records lost: %s', len(batch), e)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            if self.dedup is not None and self.dedup.path and time.monotonic() >= save_at:
+                self._save_index()
+                save_at = time.monotonic() + self.dedup_save_interval
+        self._conn.close()
+        if self.dedup is not None and self.dedup.path:
+            self._save_index()
+
+    def stats(self):
+        return {
+            'logged': self.logged,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'duplicates': self.duplicates,
+            'queue_depth': self.queue.qsize(),
+            'segment': self.segment_path,
+        }
+
+
+def open_defect_log(directory, labels, max_mb=64, dedup_radius=None, dedup_window=60.0, dedup_index=None):
+    # A DefectLogger writing to `directory`, with a crop dedup index (kept
+    # in dedup_index, by default directory/crop_index.npz) when
+    # dedup_radius is given. dedup_window 0 matches crops of any age.
+    dedup = None
+    if dedup_radius is not None:
+        path = dedup_index or os.path.join(directory, 'crop_index.npz')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        dedup = CropIndex(radius=dedup_radius, window=dedup_window or None, path=path)
+        print(f'Crop index {path}: {len(dedup)} hashes, radius {dedup.radius} bits')
+    return DefectLogger(directory, labels, max_bytes=int(max_mb * 1024 * 1024), dedup=dedup)
@@ -0,0 +1,221 @@
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Header fields (int64 each) at the start of the block
+MAGIC = 0x46524d42555331  # "FRMBUS1"
+_MAGIC, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _WRITE_SEQ, _CLOSED = range(7)
+HEADER_FIELDS = 8
+ALIGN = 64
+
+
+def _layout(slots, shape):
+    # Byte offsets of the slot table and the frame data, and the total size
+    meta = HEADER_FIELDS * 8
+    data = -(-(meta + slots * 3 * 8) // ALIGN) * ALIGN
+    frame_bytes = int(np.prod(shape))
+    slot_bytes = -(-frame_bytes // ALIGN) * ALIGN
+    return meta, data, slot_bytes, data + slots * slot_bytes
+
+
+def _open(name):
+    # Attach without registering with the resource tracker, which would
+    # otherwise unlink the producer's block when a consumer exits. Before
+    # Python 3.13 there's no track=False, and unregistering afterwards
+    # isn't safe either: spawned children share their parent's tracker,
+    # so it would drop the producer's own registration.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+# Fixed-size frame slots in one shared-memory block, written by a single
+# producer and read by any number of consumer processes that attach by
+# name. Frames are numbered from 1; frame `seq` lives in slot
+# seq % slots, so the ring holds the newest `slots` frames.
+#
+# Every slot carries a pair of sequence numbers used as a seqlock: the
+# producer stores `begin` before touching the pixels and `end` after, so
+# a slot whose begin and end both equal the wanted seq holds that frame
+# complete, and a reader that finds begin unchanged after it is done
+# knows the producer didn't start overwriting the slot underneath it.
+# Consumers get numpy views straight onto the shared pixels: nothing is
+# copied or pickled.
+#
+# The checks rely on the producer's stores becoming visible in order.
+# That holds in practice on the Pi (each store is a separate interpreter
+# step, far apart compared to the CPU's store buffer), but it isn't
+# guaranteed by Python, so readers that must never see a torn frame
+# should copy with read() rather than work on the view.
+class FrameBus:
+    def __init__(self, shm):
+        self.shm = shm
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if header[_MAGIC] != MAGIC:
+            raise ValueError(f'{shm.name} is not a frame bus')
+        self.header = header
+        self.slots = int(header[_SLOTS])
+        self.shape = (int(header[_HEIGHT]), int(header[_WIDTH]), int(header[_CHANNELS]))
+        meta, data, slot_bytes, _ = _layout(self.slots, self.shape)
+        self.seqs = np.ndarray((self.slots, 2), dtype=np.int64, buffer=shm.buf, offset=meta)
+        self.timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf,
+                                     offset=meta + self.slots * 2 * 8)
+        frames = np.ndarray((self.slots, slot_bytes), dtype=np.uint8, buffer=shm.buf, offset=data)
+        self.frames = [frames[i, :int(np.prod(self.shape))].reshape(self.shape) for i in range(self.slots)]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self.header[_WRITE_SEQ])
+
+    @property
+    def closed(self):
+        return bool(self.header[_CLOSED])
+
+    def close(self):
+        self.header = self.seqs = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping goes with it
+            pass
+
+
+# Producer side. publish() copies a frame into the next slot; for no
+# copy at all, write the frame straight into begin()'s view (e.g.
+# cv2.cvtColor(src, ..., dst=writer.begin())) and then commit().
+class FrameBusWriter(FrameBus):
+    def __init__(self, name, shape, slots=8):
+        if len(shape) == 2:
+            shape = (*shape, 1)
+        _, _, _, size = _layout(slots, shape)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[[_SLOTS, _HEIGHT, _WIDTH, _CHANNELS]] = (slots, *shape)
+        header[_MAGIC] = MAGIC
+        super().__init__(shm)
+        self.seqs[:] = 0
+        self._pending = None
+
+    def begin(self):
+        seq = self.write_seq + 1
+        slot = seq % self.slots
+        self.seqs[slot, 0] = seq
+        self._pending = seq
+        return self.frames[slot]
+
+    def commit(self, timestamp=None):
+        seq = self._pending
+        slot = seq % self.slots
+        self.timestamps[slot] = time.time() if timestamp is None else timestamp
+        self.seqs[slot, 1] = seq
+        self.header[_WRITE_SEQ] = seq
+        self._pending = None
+        return seq
+
+    def publish(self, frame, timestamp=None):
+        np.copyto(self.begin(), frame.reshape(self.shape))
+        return self.commit(timestamp)
+
+    def close(self):
+        # Readers see `closed` and stop once they've caught up
+        self.header[_CLOSED] = 1
+        self.shm.unlink()
+        super().close()
+
+
+# Consumer side. next() returns every frame in order and latest() skips
+# to the newest; both return (seq, timestamp, view), or None on timeout
+# or once the producer has closed and everything has been read. A reader
+# that falls more than a ring behind has lost frames: next() jumps to
+# the oldest frame still in the ring and counts what it skipped in
+# `overrun`. Call valid(seq) after using a view to check it wasn't
+# overwritten meanwhile; failures are counted in `torn`.
+class FrameBusReader(FrameBus):
+    def __init__(self, name, poll=0.001):
+        super().__init__(_open(name))
+        self.poll = poll
+        self.last_seq = self.write_seq
+        self.delivered = 0
+        self.overrun = 0
+        self.torn = 0
+
+    def _wait(self, seq, timeout):
+        # Polls the write counter; there's no cross-process condition
+        # variable that unrelated processes can attach to by name
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.write_seq < seq:
+            if self.closed or (deadline is not None and time.perf_counter() >= deadline):
+                return False
+            time.sleep(self.poll)
+        return True
+
+    def _take(self, seq):
+        slot = seq % self.slots
+        # begin == end == seq: written completely and not being rewritten
+        if self.seqs[slot, 1] != seq or self.seqs[slot, 0] != seq:
+            return None
+        self.last_seq = seq
+        self.delivered += 1
+        return seq, float(self.timestamps[slot]), self.frames[slot]
+
+    def next(self, timeout=None):
+        while True:
+            seq = self.last_seq + 1
+            if not self._wait(seq, timeout):
+                return None
+            oldest = self.write_seq - self.slots + 2  # the slot after the one being written
+            if seq < oldest:
+                self.overrun += oldest - seq
+                self.last_seq = oldest - 1
+                continue
+            item = self._take(seq)
+            if item is not None:
+                return item
+            # Overwritten between the checks; go round again
+            self.overrun += 1
+            self.last_seq = seq
+
+    def latest(self, timeout=None):
+        while True:
+            if not self._wait(self.last_seq + 1, timeout):
+                return None
+            item = self._take(self.write_seq)
+            if item is not None:
+                return item
+
+    def valid(self, seq):
+        ok = self.seqs[seq % self.slots, 0] == seq
+        if not ok:
+            self.torn += 1
+        return ok
+
+    def read(self, out=None, timeout=None, latest=True):
+        # Copying read: the newest (or next) frame copied into `out`, and
+        # only returned if the producer left it alone during the copy
+        while True:
+            item = self.latest(timeout) if latest else self.next(timeout)
+            if item is None:
+                return None
+            seq, timestamp, view = item
+            if out is None:
+                out = np.empty(self.shape, dtype=np.uint8)
+            np.copyto(out, view)
+            if self.valid(seq):
+                return seq, timestamp, out
+
+    def stats(self):
+        return {'delivered': self.delivered, 'overrun': self.overrun, 'torn': self.torn,
+                'behind': self.write_seq - self.last_seq}
@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+
+
+# Converts camera frames to the 3-channel BGR the model expects without
+# allocating per frame. cvtColor reads the source and writes into one of a
+# small ring of preallocated buffers, so the camera may reuse its own
+# buffer as soon as convert() returns; the old np.copy() before cvtColor
+# only added a second full-frame copy.
+#
+# A buffer is handed out again after `pool_size` further frames, so
+# pool_size must cover every frame that can still be in flight downstream.
+# That holds for a sequential loop (pool_size=1); when a producer can run
+# ahead of a slow consumer, as in the pipelined mode, pass pool_size=None
+# to get a fresh output array per frame instead. Frames that are already
+# 3-channel (RGB888 camera format) pass straight through.
+class BgrConverter:
+    def __init__(self, pool_size=1):
+        self.pool_size = pool_size
+        self._pool = []
+        self._pos = 0
+        self._shape = None
+
+    def _next_buffer(self, shape):
+        if shape != self._shape:
+            self._pool = [np.empty(shape, dtype=np.uint8) for _ in range(self.pool_size)]
+            self._shape = shape
+            self._pos = 0
+        buf = self._pool[self._pos]
+        self._pos = (self._pos + 1) % self.pool_size
+        return buf
+
+    def convert(self, frame):
+        if frame.ndim == 3 and frame.shape[2] == 3:
+            return frame
+        if not self.pool_size:
+            return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        dst = self._next_buffer(frame.shape[:2] + (3,))
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=dst)
@@ -0,0 +1,141 @@
+import logging
+import socket
+import struct
+import threading
+
+from streaming import ClientStats, StreamingOutput
+
+# Every frame on the wire is a fixed 24-byte big-endian header followed by
+# the raw JPEG bytes:
+#   magic      4s  b'RTF1', lets a receiver detect a desynchronised stream
+#   length     u32 JPEG payload size in bytes
+#   seq        u64 frame sequence number; gaps are frames this client missed
+#   timestamp  f64 capture time, seconds since the epoch
+MAGIC = b'RTF1'
+HEADER = struct.Struct('!4sIQd')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def send_frame(sock, seq, timestamp, frame):
+    # Header and payload go out in one scatter/gather sendmsg without
+    # concatenating them; loop on partial sends
+    header = HEADER.pack(MAGIC, len(frame), seq, timestamp)
+    buffers = [memoryview(header), memoryview(frame)]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers and sent:
+            buffers[0] = buffers[0][sent:]
+
+
+def recv_exactly(sock, view):
+    # Fill a memoryview from the socket; returns False on a clean EOF
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
+            return False
+        view = view[n:]
+    return True
+
+
+# Reads frames from a connected socket into reused buffers. Each call to
+# read() returns (seq, timestamp, payload) where payload is a memoryview
+# that stays valid until the next read(), or None at end of stream.
+class FrameReader:
+    def __init__(self, sock, max_frame=16 * 1024 * 1024):
+        self.sock = sock
+        self.max_frame = max_frame
+        self._header = bytearray(HEADER.size)
+        self._payload = bytearray(256 * 1024)
+
+    def read(self):
+        if not recv_exactly(self.sock, memoryview(self._header)):
+            return None
+        magic, length, seq, timestamp = HEADER.unpack(self._header)
+        if magic != MAGIC:
+            raise ProtocolError(f'Bad frame magic {magic!r}')
+        if length > self.max_frame:
+            raise ProtocolError(f'Frame of {length} bytes exceeds the {self.max_frame} byte limit')
+        if length > len(self._payload):
+            self._payload = bytearray(length)
+        view = memoryview(self._payload)[:length]
+        if not recv_exactly(self.sock, view):
+            raise ProtocolError('Connection closed mid-frame')
+        return seq, timestamp, view
+
+
+# TCP frame server for many concurrent receivers. publish() stores the
+# newest encoded frame in a StreamingOutput; each client has its own
+# sender thread that always sends the newest frame it hasn't sent yet, so
+# a slow link only drops frames for that client (per-client backpressure)
+# and never blocks the capture loop or the other clients.
+class FrameServer:
+    def __init__(self, address=('0.0.0.0', 8485), frame_timeout=1.0):
+        self.address = address
+        self.frame_timeout = frame_timeout
+        self.output = StreamingOutput()
+        self.clients = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sock = None
+
+    @property
+    def client_count(self):
+        return len(self.clients)
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(self.address)
+        self._sock.listen(16)
+        self.address = self._sock.getsockname()
+        threading.Thread(target=self._accept, name='frame-accept', daemon=True).start()
+
+    def publish(self, frame, timestamp=None):
+        self.output.publish(frame, timestamp)
+
+    def _accept(self):
+        while not self._stop.is_set():
+            try:
+                conn, addr = self._sock.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            logging.info('Connection from: %s', addr)
+            threading.Thread(target=self._serve, args=(conn, addr), daemon=True).start()
+
+    def _serve(self, conn, addr):
+        stats = ClientStats(addr)
+        with self._lock:
+            self.clients.add(stats)
+        last_seq = self.output.seq
+        try:
+            while not self._stop.is_set():
+                item = self.output.wait_for_frame(last_seq, self.frame_timeout)
+                if item is None:
+                    continue
+                seq, frame, timestamp = item
+                send_frame(conn, seq, timestamp, frame)
+                stats.record(seq, last_seq, HEADER.size + len(frame))
+                last_seq = seq
+        except OSError as e:
+            logging.info('Client %s disconnected: %s', addr, e)
+        finally:
+            conn.close()
+            with self._lock:
+                self.clients.discard(stats)
+            logging.info('Client %s: %d frames sent, %d dropped', addr, stats.frames_sent, stats.frames_dropped)
+
+    def close(self):
+        self._stop.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
@@ -0,0 +1,72 @@
+import argparse
+import socket
+import time
+
+import cv2
+import numpy as np
+
+from frame_protocol import FrameReader
+from instrumentation import FpsMeter
+
+# Reference receiver for camera_stream.py: connects, decodes and shows
+# frames, and reports frame rate, missed frames and capture-to-display
+# latency (only meaningful when both clocks are NTP-synced)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Receive and display frames from camera_stream.py')
+    parser.add_argument('host', help="The Raspberry Pi's IP address")
+    parser.add_argument('--port', type=int, default=8485)
+    parser.add_argument('--no-display', action='store_true', help='Decode only, no window')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    sock = socket.create_connection((args.host, args.port))
+    reader = FrameReader(sock)
+    fps_meter = FpsMeter(window=30)
+    print(f"Connected to {args.host}:{args.port}. Press 'q' to quit.")
+
+    frames = 0
+    missed = 0
+    last_seq = None
+    t_last = time.perf_counter()
+    try:
+        while True:
+            item = reader.read()
+            if item is None:
+                print("Server closed the connection")
+                break
+            seq, timestamp, payload = item
+            if last_seq is not None:
+                missed += seq - last_seq - 1
+            last_seq = seq
+
+            frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+            latency_ms = (time.time() - timestamp) * 1000
+            frames += 1
+
+            now = time.perf_counter()
+            fps_meter.add(now - t_last)
+            t_last = now
+
+            if args.no_display:
+                if frames % 100 == 0:
+                    print(f'{fps_meter.fps():.1f} FPS, {missed} missed, latency {latency_ms:.0f} ms')
+                continue
+
+            cv2.putText(frame, f'RX FPS: {fps_meter.fps():.1f}  missed: {missed}', (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+            cv2.imshow('Client Feed', frame)
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+    except KeyboardInterrupt:
+        print("Interrupted by user")
+    finally:
+        sock.close()
+        cv2.destroyAllWindows()
+        print(f'Received {frames} frames, missed {missed}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Picamera2 format names; both are BGR byte order in memory
+FORMATS = ('XRGB8888', 'RGB888')
+
+
+# Base class for everything that can stand in for Picamera2 in the
+# capture loops. capture_array() returns an XRGB8888 frame (BGRA byte
+# order, shape (h, w, 4)) of the configured size, or None once the source
+# is exhausted. With fmt='RGB888' frames are 3-channel BGR instead, which
+# lets the loop skip colour conversion entirely. With realtime=True frames
+# are paced to `fps`; otherwise they are returned as fast as possible.
+class FrameSource:
+    def __init__(self, size, realtime=False, fps=30.0, fmt='XRGB8888'):
+        if fmt not in FORMATS:
+            raise ValueError(f'Unsupported frame format {fmt}')
+        self.size = tuple(size)
+        self.fmt = fmt
+        self.realtime = realtime
+        self.fps = fps
+        self.frame_index = 0
+        self._next_due = None
+
+    def start(self):
+        self._next_due = time.perf_counter()
+
+    def stop(self):
+        pass
+
+    def read_frame(self):
+        raise NotImplementedError
+
+    def capture_array(self):
+        frame = self.read_frame()
+        if frame is None:
+            return None
+        self.frame_index += 1
+        if self.realtime and self.fps:
+            self._pace()
+        return frame
+
+    def _pace(self):
+        if self._next_due is None:
+            self._next_due = time.perf_counter()
+        self._next_due += 1.0 / self.fps
+        delay = self._next_due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Running behind; don't try to catch up with a burst
+            self._next_due = time.perf_counter()
+
+    def _to_format(self, frame_bgr):
+        if (frame_bgr.shape[1], frame_bgr.shape[0]) != self.size:
+            frame_bgr = cv2.resize(frame_bgr, self.size, interpolation=cv2.INTER_AREA)
+        if self.fmt == 'RGB888':
+            return frame_bgr
+        return cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2BGRA)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class PicameraSource(FrameSource):
+    def __init__(self, size, camera_num=0, fmt='XRGB8888'):
+        super().__init__(size, realtime=False, fmt=fmt)
+        from picamera2 import Picamera2
+        self.picam2 = Picamera2(camera_num)
+        self.picam2.configure(self.picam2.create_video_configuration(main={"format": fmt, "size": self.size}))
+
+    def start(self):
+        super().start()
+        self.picam2.start()
+
+    def stop(self):
+        self.picam2.stop()
+
+    def read_frame(self):
+        # The camera paces itself. capture_array() copies out of the
+        # request buffer, so the array we return is ours to keep.
+        return self.picam2.capture_array()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, size, realtime=False, fps=None, loop=False, fmt='XRGB8888'):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f'Unable to open video file {path}')
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(size, realtime, fps or file_fps, fmt)
+        self.path = path
+        self.loop = loop
+
+    def stop(self):
+        self.cap.release()
+
+    def read_frame(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            return None
+        return self._to_format(frame)
+
+
+class ImageDirSource(FrameSource):
+    def __init__(self, path, size, realtime=False, fps=30.0, loop=False, fmt='XRGB8888'):
+        super().__init__(size, realtime, fps, fmt)
+        self.files = sorted(f for f in glob.glob(os.path.join(path, '*'))
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise IOError(f'No images found in {path}')
+        self.loop = loop
+        self._pos = 0
+
+    def read_frame(self):
+        if self._pos >= len(self.files):
+            if not self.loop:
+                return None
+            self._pos = 0
+        frame = cv2.imread(self.files[self._pos])
+        self._pos += 1
+        if frame is None:
+            raise IOError(f'Unable to read image {self.files[self._pos - 1]}')
+        return self._to_format(frame)
+
+
+# Frames another process publishes on a FrameBus (camera_stream.py
+# --bus NAME), so the detector can run in its own process next to the
+# streamer without opening the camera itself. Each capture is the newest
+# frame, copied once out of the shared ring with no pickling; the copy
+# is the loop's to draw on. Frames are 3-channel BGR whatever fmt says,
+# which the loops' BgrConverter passes straight through.
+class BusSource(FrameSource):
+    def __init__(self, name, size, fmt='XRGB8888', timeout=5.0):
+        super().__init__(size, realtime=False, fmt=fmt)
+        from frame_bus import FrameBusReader
+        self.reader = FrameBusReader(name)
+        self.timeout = timeout
+
+    def stop(self):
+        self.reader.close()
+
+    def read_frame(self):
+        # None once the publisher has gone or stalled for `timeout`
+        item = self.reader.read(timeout=self.timeout)
+        if item is None:
+            return None
+        frame = item[2]
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+
+# Deterministic stand-in for the track camera: ballast noise, two rails
+# and sleepers scrolling past, with the occasional dark "defect" patch.
+# The same seed always produces the same sequence, and all the texture is
+# generated up front so the source itself costs almost nothing per frame.
+class SyntheticSource(FrameSource):
+    def __init__(self, size, realtime=False, fps=30.0, frames=None, seed=0, speed=4, fmt='XRGB8888'):
+        super().__init__(size, realtime, fps, fmt)
+        self.frames = frames
+        self.speed = speed
+        w, h = self.size
+        rng = np.random.default_rng(seed)
+
+        # Texture twice the frame height so any scroll offset is one slice
+        tex_h = h * 2
+        ballast = rng.integers(70, 150, size=(tex_h, w, 1), dtype=np.uint8)
+        texture = np.repeat(ballast, 3, axis=2)
+        for y in range(0, tex_h, max(h // 4, 1)):
+            cv2.rectangle(texture, (w // 8, y), (w - w // 8, y + max(h // 24, 2)), (60, 80, 100), cv2.FILLED)
+        for x in (w // 3, 2 * w // 3):
+            cv2.rectangle(texture, (x - w // 40, 0), (x + w // 40, tex_h), (180, 180, 185), cv2.FILLED)
+        for _ in range(4):
+            x = int(rng.integers(w // 4, 3 * w // 4))
+            y = int(rng.integers(0, tex_h - h // 10))
+            cv2.rectangle(texture, (x, y), (x + w // 30 + 2, y + h // 20 + 2), (20, 20, 20), cv2.FILLED)
+        if fmt == 'XRGB8888':
+            texture = cv2.cvtColor(texture, cv2.COLOR_BGR2BGRA)
+        self.texture = texture
+        # Repeat the first frame's rows at the bottom so the scroll wraps cleanly
+        self.texture = np.concatenate([self.texture, self.texture[:h]])
+        self._tex_h = tex_h
+
+    def read_frame(self):
+        if self.frames is not None and self.frame_index >= self.frames:
+            return None
+        h = self.size[1]
+        offset = (self.frame_index * self.speed) % self._tex_h
+        # Return a copy, like a camera buffer the caller may keep
+        return self.texture[offset:offset + h].copy()
+
+
+def parse_resolution(text):
+    # 'WxH' as given on the command line -> (w, h)
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+
+def open_source(spec, size, realtime=False, fps=None, loop=False, fmt='XRGB8888'):
+    # spec is one of:
+    #   picamera0, picamera1  - a Pi camera
+    #   synthetic[:N]         - deterministic synthetic frames (N frames, default unlimited)
+    #   bus:NAME              - frames published on a shared-memory FrameBus
+    #   <directory>           - images in the directory, in sorted order
+    #   <file>                - a video file
+    if spec.startswith('picamera'):
+        return PicameraSource(size, camera_num=int(spec[len('picamera'):] or 0), fmt=fmt)
+    if spec.startswith('bus:'):
+        return BusSource(spec[len('bus:'):], size, fmt=fmt)
+    if spec.startswith('synthetic'):
+        frames = int(spec.split(':', 1)[1]) if ':' in spec else None
+        return SyntheticSource(size, realtime, fps or 30.0, frames=frames, fmt=fmt)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, size, realtime, fps or 30.0, loop, fmt)
+    if os.path.isfile(spec):
+        return VideoFileSource(spec, size, realtime, fps, loop, fmt)
+    raise ValueError(f'Unknown frame source {spec}')
@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
-import io
+import argparse
 import logging
-import socketserver
-import time
 import sys
-from threading import Condition
-from http import server
 
 # Import Picamera2 libraries
 from picamera2 import Picamera2
 from picamera2.encoders import JpegEncoder
 from picamera2.outputs import FileOutput
 
+from async_stream import AsyncMjpegServer
+from metrics import attach_stream_metrics
+from quality_control import adapt_picamera_stream
+from streaming import StreamingHandler, StreamingOutput, StreamingServer
+
 # Determine the Raspberry Pi's IP address dynamically
 import socket
 hostname = socket.gethostname()
@@ -23,80 +24,18 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-PAGE = f"""\
-<!DOCTYPE html>
-<html>
-  <head>
-    <title>Raspberry Pi Video Streaming</title>
-  </head>
-  <body>
-    <h1>Raspberry Pi Video Stream</h1>
-    <img src="stream.mjpg" width="640" height="480" />
-  </body>
-</html>
-"""
-
-class StreamingOutput(io.BufferedIOBase):
-    def __init__(self):
-        self.frame = None
-        self.buffer = io.BytesIO()
-        self.condition = Condition()
-    
-    def write(self, buf):
-        if buf.startswith(b'\xff\xd8'):
-            # New frame, copy the existing buffer's content and notify all
-            # clients it's available
-            self.buffer.truncate()
-            with self.condition:
-                self.frame = self.buffer.getvalue()
-                self.condition.notify_all()
-            self.buffer.seek(0)
-        return self.buffer.write(buf)
-
-class StreamingHandler(server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/':
-            self.send_response(301)
-            self.send_header('Location', '/index.html')
-            self.end_headers()
-        elif self.path == '/index.html':
-            content = PAGE.encode('utf-8')
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html')
-            self.send_header('Content-Length', len(content))
-            self.end_headers()
-            self.wfile.write(content)
-        elif self.path == '/stream.mjpg':
-            self.send_response(200)
-            self.send_header('Age', 0)
-            self.send_header('Cache-Control', 'no-cache, private')
-            self.send_header('Pragma', 'no-cache')
-            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
-            self.end_headers()
-            try:
-                while True:
-                    with output.condition:
-                        output.condition.wait()
-                        frame = output.frame
-                    self.wfile.write(b'--FRAME\r\n')
-                    self.send_header('Content-Type', 'image/jpeg')
-                    self.send_header('Content-Length', len(frame))
-                    self.end_headers()
-                    self.wfile.write(frame)
-                    self.wfile.write(b'\r\n')
-            except Exception as e:
-                logging.warning(
-                    'Removed streaming client %s: %s',
-                    self.client_address, str(e))
-        else:
-            self.send_error(404)
-            self.end_headers()
-
-class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
-    allow_reuse_address = True
-    daemon_threads = True
+def parse_args():
+    parser = argparse.ArgumentParser(description='MJPEG stream from the Pi camera')
+    parser.add_argument('--threaded', action='store_true',
+                        help='Use the old thread-per-client server instead of the asyncio broadcaster')
+    parser.add_argument('--quality', type=int, default=70,
+                        help='JPEG quality; the starting point when adapting')
+    parser.add_argument('--fixed-quality', action='store_true',
+                        help="Don't adapt quality and frame rate to the viewers' throughput")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     try:
         # Initialize and configure the camera
         picam2 = Picamera2()
@@ -104,17 +43,27 @@ def main():
         picam2.configure(video_config)
         picam2.start()
         
-        # Set up the output
-        global output
+        # Set up the server and the output the encoder writes into
+        address = ('', 8000)
         output = StreamingOutput()
-        encoder = JpegEncoder(q=70)  # Quality set to 70 for better performance
+        if args.threaded:
+            server = StreamingServer(address, StreamingHandler, output)
+        else:
+            server = AsyncMjpegServer(address)
+            server.attach(output)
+        encoder = JpegEncoder(q=args.quality)
         
         # Start recording
         picam2.start_encoder(encoder, FileOutput(output))
         
+        # Step quality (then frame rate) down when viewers fall behind,
+        # and back up when they catch up; see /status.json
+        if not args.fixed_quality:
+            adapt_picamera_stream(picam2, encoder, output, server)
+        # Frame, viewer and temperature counters for Prometheus at /metrics
+        attach_stream_metrics(server, output)
+        
         # Start server
-        address = ('', 8000)
-        server = StreamingServer(address, StreamingHandler)
         logging.info(f"Server started. Access stream at http://{ip_address}:8000")
         server.serve_forever()
     except Exception as e:
@@ -0,0 +1,126 @@
+import json
+import platform
+import time
+
+import numpy as np
+
+
+# Fixed-size ring of float samples. Adding is O(1) and never allocates;
+# the running sum keeps mean() O(1) as well.
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self.total = 0
+        self._pos = 0
+        self._sum = 0.0
+
+    def add(self, value):
+        if self.count == self.capacity:
+            self._sum -= self.data[self._pos]
+        else:
+            self.count += 1
+        self.data[self._pos] = value
+        self._sum += value
+        self._pos = (self._pos + 1) % self.capacity
+        self.total += 1
+
+    def values(self):
+        return self.data[:self.count] if self.count < self.capacity else self.data
+
+    def mean(self):
+        return self._sum / self.count if self.count else 0.0
+
+
+# Average frame rate over the last `window` frames, replacing the
+# list + pop(0) + np.mean buffer the capture loops used to keep
+class FpsMeter:
+    def __init__(self, window=200):
+        self.durations = RingBuffer(window)
+
+    def add(self, seconds):
+        self.durations.add(seconds)
+
+    def fps(self):
+        mean = self.durations.mean()
+        return 1.0 / mean if mean > 0 else 0.0
+
+
+# Per-stage latency samples. Call start() at the top of a frame and
+# lap(stage) after each step; the time since the previous mark is
+# recorded against that stage. record() can be used directly when the
+# stage runs on another thread. A stage can also feed a cumulative
+# histogram (metrics.Histogram) kept in `histograms`.
+class StageTimer:
+    def __init__(self, stages, capacity=1024):
+        self.stages = {name: RingBuffer(capacity) for name in stages}
+        self.histograms = {}
+        self.capacity = capacity
+        self._mark = 0.0
+
+    def start(self):
+        self._mark = time.perf_counter()
+        return self._mark
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.record(stage, now - self._mark)
+        self._mark = now
+        return now
+
+    def record(self, stage, seconds):
+        if stage not in self.stages:
+            self.stages[stage] = RingBuffer(self.capacity)
+        self.stages[stage].add(seconds)
+        histogram = self.histograms.get(stage)
+        if histogram is not None:
+            histogram.observe(seconds)
+
+    def summary(self):
+        # Latency percentiles in milliseconds for each stage that has samples
+        summary = {}
+        for name, ring in self.stages.items():
+            if not ring.count:
+                continue
+            values = ring.values() * 1000.0
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            summary[name] = {
+                'samples': ring.total,
+                'mean_ms': round(float(values.mean()), 3),
+                'p50_ms': round(float(p50), 3),
+                'p95_ms': round(float(p95), 3),
+                'p99_ms': round(float(p99), 3),
+                'max_ms': round(float(values.max()), 3),
+            }
+        return summary
+
+    def format_summary(self):
+        lines = [f"{'stage':<12} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)"]
+        for name, s in self.summary().items():
+            lines.append(f"{name:<12} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}")
+        return '\n'.join(lines)
+
+
+def board_model():
+    # "Raspberry Pi 5 Model B Rev 1.0" on a Pi, the CPU architecture elsewhere
+    try:
+        with open('/proc/device-tree/model') as f:
+            return f.read().strip('\x00\n ')
+    except OSError:
+        return platform.machine()
+
+
+def write_report(path, timer, frames, elapsed, **extra):
+    report = {
+        'board': board_model(),
+        'python': platform.python_version(),
+        'frames': frames,
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        **extra,
+        'stages': timer.summary(),
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,188 @@
+import bisect
+import numbers
+import threading
+from http import server
+
+# Latency buckets in seconds, from a fast capture (1 ms) to a stalled
+# inference (2 s)
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .075, .1, .15, .2, .3, .5, 1.0, 2.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Cumulative latency histogram in the Prometheus layout. observe() is a
+# bisect and two additions, cheap enough for every frame. Each histogram
+# is only observed from one thread, so it takes no lock; a scrape may see
+# a count one sample ahead of the sum, which Prometheus tolerates.
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    # Full precision: %g's six digits would freeze large counters
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _bucket_names(histogram):
+    return [_number(b) for b in histogram.buckets] + ['+Inf']
+
+
+# Registry rendered in the Prometheus text format. Nothing is counted
+# here: every family is a callable that reads a value the servers and
+# loops already keep (frame counters, ClientStats, queue sizes, ...), so
+# a scrape costs a handful of attribute reads and the hot paths pay
+# nothing unless a Histogram is attached to them.
+#
+# A family's callable returns a number, a Histogram, or a list of
+# (labels dict, number or Histogram) for labelled series. Returning None
+# (or raising OSError, e.g. for a sensor that isn't there) leaves the
+# family out of that scrape.
+class Metrics:
+    def __init__(self, prefix='raildet_'):
+        self.prefix = prefix
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, kind, help_text, fn):
+        with self._lock:
+            self._families[self.prefix + name] = (kind, help_text, fn)
+
+    def counter(self, name, help_text, fn):
+        self.add(name, 'counter', help_text, fn)
+
+    def gauge(self, name, help_text, fn):
+        self.add(name, 'gauge', help_text, fn)
+
+    def histogram(self, name, help_text, fn):
+        self.add(name, 'histogram', help_text, fn)
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.items())
+        lines = []
+        for name, (kind, help_text, fn) in families:
+            try:
+                value = fn()
+            except OSError:
+                value = None
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            series = value if isinstance(value, list) else [({}, value)]
+            for labels, v in series:
+                if isinstance(v, Histogram):
+                    cumulative = 0
+                    for bound, count in zip(_bucket_names(v), v.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(v.sum)}')
+                    lines.append(f'{name}_count{_labels(labels)} {v.count}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {_number(v)}')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def cpu_temperature():
+    # SoC temperature in degrees C from the kernel's thermal zone; None
+    # where there isn't one
+    try:
+        with open('/sys/class/thermal/thermal_zone0/temp') as f:
+            return int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def register_system(metrics):
+    metrics.gauge('cpu_temperature_celsius', 'SoC temperature', cpu_temperature)
+
+
+def register_stream(metrics, stream_server, output=None):
+    # Works with StreamingServer and AsyncMjpegServer; both keep a set of
+    # ClientStats. Clients are labelled by address and disappear from the
+    # scrape when they disconnect.
+    def clients():
+        return [({'client': f'{c.address[0]}:{c.address[1]}' if isinstance(c.address, tuple) else str(c.address)}, c)
+                for c in list(stream_server.clients)]
+
+    if output is not None:
+        metrics.counter('stream_frames_encoded_total', 'JPEG frames produced by the encoder', lambda: output.seq)
+    metrics.gauge('stream_clients', 'Connected stream viewers', lambda: len(stream_server.clients))
+    metrics.counter('stream_client_frames_sent_total', 'Frames sent to each viewer',
+                    lambda: [(labels, c.frames_sent) for labels, c in clients()])
+    metrics.counter('stream_client_frames_dropped_total', 'Frames a viewer skipped because it fell behind',
+                    lambda: [(labels, c.frames_dropped) for labels, c in clients()])
+    metrics.counter('stream_client_bytes_sent_total', 'Bytes sent to each viewer',
+                    lambda: [(labels, c.bytes_sent) for labels, c in clients()])
+    metrics.gauge('stream_client_backlog_bytes', 'Bytes queued for each viewer but not yet sent',
+                  lambda: [(labels, c.backlog) for labels, c in clients()])
+
+
+def attach_stream_metrics(stream_server, output=None):
+    # /metrics on a stream server with the stream and system families
+    metrics = Metrics()
+    register_system(metrics)
+    register_stream(metrics, stream_server, output)
+    stream_server.metrics = metrics
+    return metrics
+
+
+def register_timer(metrics, timer, stages=('capture', 'inference')):
+    # Per-stage latency histograms fed by StageTimer.record(); the counts
+    # double as frame counters (rate() of the capture count is the
+    # capture FPS)
+    histograms = {stage: timer.histograms.setdefault(stage, Histogram()) for stage in stages}
+    metrics.histogram('stage_seconds', 'Time spent in each stage of the detection loop',
+                      lambda: [({'stage': stage}, h) for stage, h in histograms.items()])
+    if 'capture' in histograms:
+        metrics.counter('frames_captured_total', 'Frames read from the camera', lambda: histograms['capture'].count)
+    if 'inference' in histograms:
+        metrics.counter('inferences_total', 'Detector runs', lambda: histograms['inference'].count)
+
+
+class MetricsHandler(server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        content = self.server.metrics.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', len(content))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # One line per scrape every few seconds is noise
+        pass
+
+
+# Stand-alone /metrics endpoint for processes without a stream server
+class MetricsServer(server.ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, metrics):
+        self.metrics = metrics
+        super().__init__(address, MetricsHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='metrics-server', daemon=True).start()
@@ -0,0 +1,242 @@
+import json
+import logging
+import queue
+import socketserver
+import threading
+from http import server
+from urllib.parse import parse_qs, urlparse
+
+# L298N pin map (BCM numbering): (in_a, in_b, enable) per motor
+MOTOR_A = (24, 23, 25)
+MOTOR_B = (17, 27, 22)
+
+# Named duty cycles used by car_control.py's l/m/h keys
+SPEEDS = {'low': 25, 'medium': 50, 'high': 75}
+
+COMMANDS = ('run', 'stop', 'forward', 'backward', 'speed')
+
+
+# Stand-in for RPi.GPIO with just the calls the controller makes. It
+# records pin levels and duty cycles so the controller can be exercised
+# on a laptop or in CI.
+class MockGPIO:
+    BCM = 'BCM'
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+
+    class PWM:
+        def __init__(self, pin, frequency):
+            self.pin = pin
+            self.frequency = frequency
+            self.duty = None
+
+        def start(self, duty):
+            self.duty = duty
+
+        def ChangeDutyCycle(self, duty):
+            self.duty = duty
+
+        def stop(self):
+            self.duty = None
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.history = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction):
+        self.pins[pin] = self.LOW
+
+    def output(self, pin, level):
+        self.pins[pin] = level
+        self.history.append((pin, level))
+
+    def cleanup(self):
+        self.pins.clear()
+
+
+def load_gpio(mock=False):
+    if mock:
+        return MockGPIO()
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+# Owns the motor GPIO pins and applies commands from a queue on its own
+# thread. The thread blocks in queue.get() between commands, so an idle
+# car costs no CPU (the old motor_control() spun in `while True: pass`).
+#
+# submit() validates a command, queues it and returns an Event that is
+# set once the pins have been driven. 'run' resumes the last direction,
+# 'speed' takes a duty cycle 0-100 or one of SPEEDS.
+#
+# set_limit() caps the duty cycle actually applied without touching the
+# commanded speed, so an automatic governor (speed_control.py) and an
+# operator can both drive the car: the motors get min(speed, limit).
+class MotorController(threading.Thread):
+    def __init__(self, gpio, motor_a=MOTOR_A, motor_b=MOTOR_B, pwm_frequency=1000, speed=SPEEDS['low']):
+        super().__init__(name='motor-control', daemon=True)
+        self.gpio = gpio
+        self.motor_a = motor_a
+        self.motor_b = motor_b
+        self.direction = 'forward'
+        self.moving = False
+        self.speed = speed
+        self.limit = None
+        self.commands = 0
+        self._queue = queue.Queue()
+
+        gpio.setmode(gpio.BCM)
+        for pin in motor_a + motor_b:
+            gpio.setup(pin, gpio.OUT)
+        self._drive(False)
+        self._pwm = [gpio.PWM(motor_a[2], pwm_frequency), gpio.PWM(motor_b[2], pwm_frequency)]
+        for pwm in self._pwm:
+            pwm.start(speed)
+
+    def submit(self, command, value=None):
+        if command not in COMMANDS:
+            raise ValueError(f'Unknown motor command {command!r}')
+        if command == 'speed':
+            value = parse_speed(value)
+        done = threading.Event()
+        self._queue.put((command, value, done))
+        return done
+
+    def set_limit(self, duty):
+        # None lifts the limit
+        done = threading.Event()
+        self._queue.put(('limit', duty, done))
+        return done
+
+    @property
+    def duty(self):
+        return self.speed if self.limit is None else min(self.speed, self.limit)
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            command, value, done = item
+            try:
+                self._apply(command, value)
+            except Exception as e:
+                logging.error('Motor command %s failed: %s', command, e)
+            finally:
+                done.set()
+
+    def _apply(self, command, value):
+        if command == 'limit':
+            self.limit = value
+            for pwm in self._pwm:
+                pwm.ChangeDutyCycle(self.duty)
+            return
+        self.commands += 1
+        if command == 'speed':
+            self.speed = value
+            for pwm in self._pwm:
+                pwm.ChangeDutyCycle(self.duty)
+        elif command == 'stop':
+            self._drive(False)
+        else:
+            if command in ('forward', 'backward'):
+                self.direction = command
+            self._drive(True)
+        logging.info('Motors: %s (%s, speed %d)', command,
+                     self.direction if self.moving else 'stopped', self.speed)
+
+    def _drive(self, moving):
+        # Motor B is wired reversed, so forward is A high/low, B low/high
+        gpio = self.gpio
+        self.moving = moving
+        if not moving:
+            levels = (gpio.LOW, gpio.LOW, gpio.LOW, gpio.LOW)
+        elif self.direction == 'forward':
+            levels = (gpio.HIGH, gpio.LOW, gpio.LOW, gpio.HIGH)
+        else:
+            levels = (gpio.LOW, gpio.HIGH, gpio.HIGH, gpio.LOW)
+        for pin, level in zip(self.motor_a[:2] + self.motor_b[:2], levels):
+            gpio.output(pin, level)
+
+    def state(self):
+        return {'moving': self.moving, 'direction': self.direction, 'speed': self.speed,
+                'limit': self.limit, 'duty': self.duty, 'commands': self.commands,
+                'pending': self._queue.qsize()}
+
+    def close(self):
+        # Stops the motors and releases the pins
+        if self.is_alive():
+            self.submit('stop').wait(timeout=1)
+            self._queue.put(None)
+            self.join(timeout=2)
+        else:
+            self._drive(False)
+        for pwm in self._pwm:
+            pwm.stop()
+        self.gpio.cleanup()
+
+
+def parse_speed(value):
+    if isinstance(value, str) and value in SPEEDS:
+        return SPEEDS[value]
+    try:
+        speed = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Speed must be 0-100 or one of {", ".join(SPEEDS)}, got {value!r}')
+    if not 0 <= speed <= 100:
+        raise ValueError(f'Speed must be between 0 and 100, got {speed}')
+    return speed
+
+
+# Local HTTP command API, meant to run next to the MJPEG stream server:
+#   GET  /motor                    current state as JSON
+#   POST /motor/<command>          run, stop, forward, backward
+#   POST /motor/speed?value=50     duty cycle 0-100 or low/medium/high
+# Replies with the state after the command has been applied.
+class MotorApiHandler(server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlparse(self.path).path.rstrip('/') == '/motor':
+            self._reply(200, self.server.motors.state())
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'motor':
+            self._reply(404, {'error': 'not found'})
+            return
+        value = parse_qs(url.query).get('value', [None])[0]
+        try:
+            done = self.server.motors.submit(parts[1], value)
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        done.wait(timeout=1)
+        self._reply(200, self.server.motors.state())
+
+    def _reply(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', len(content))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class MotorApiServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, motors):
+        self.motors = motors
+        super().__init__(address, MotorApiHandler)
+
+    def start(self):
+        # Serves on a background thread
+        threading.Thread(target=self.serve_forever, name='motor-api', daemon=True).start()
@@ -0,0 +1,89 @@
+import cv2
+
+# Bounding box colors (the Tableau 10 color scheme)
+BBOX_COLORS = [(164,120,87), (68,148,228), (93,97,209), (178,182,133), (88,159,106),
+               (96,202,231), (159,124,168), (169,162,241), (98,118,150), (172,176,184)]
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+STATUS_COLOR = (0, 255, 255)
+
+
+# Draws detection boxes, their labels and the status lines onto frames.
+# A label only depends on the class, the confidence in whole percent and
+# the track id, so its text and cv2.getTextSize() result are worked out
+# once per (track prefix, class, percent) and reused; a box then costs
+# the two rectangles and the putText. The cache is cleared when it grows
+# past `max_cached` labels, which only happens with many track ids.
+#
+# Drawing is the caller's decision: the loops only call draw() for frames
+# some consumer (the window, the stream, the clip ring) is going to use.
+class OverlayRenderer:
+    def __init__(self, labels, font_scale=0.5, max_cached=4096):
+        self.labels = labels
+        self.font_scale = font_scale
+        self.max_cached = max_cached
+        self.frames_drawn = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = {}
+
+    def _label(self, prefix, classidx, percent):
+        key = (prefix, classidx, percent)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+        if len(self._cache) >= self.max_cached:
+            self._cache.clear()
+        text = f'{prefix}{self.labels[classidx]}: {percent}%'
+        (w, h), baseline = cv2.getTextSize(text, FONT, self.font_scale, 1)
+        cached = self._cache[key] = (text, w, h, baseline, BBOX_COLORS[classidx % 10])
+        return cached
+
+    def draw_detections(self, frame, dets):
+        # Convert coordinates once for the whole frame instead of per box
+        boxes = dets['xyxy'].astype(int).tolist()
+        classes = dets['cls'].tolist()
+        percents = [int(conf * 100) for conf in dets['conf'].tolist()]
+
+        # Tracked detections carry a stable id that goes in the label
+        if 'track_id' in dets.dtype.names:
+            prefixes = [f'#{i} ' for i in dets['track_id'].tolist()]
+        else:
+            prefixes = [''] * len(dets)
+
+        for (xmin, ymin, xmax, ymax), classidx, percent, prefix in zip(boxes, classes, percents, prefixes):
+            text, w, h, baseline, color = self._label(prefix, classidx, percent)
+            cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 2)
+            label_ymin = max(ymin, h + 10)
+            cv2.rectangle(frame, (xmin, label_ymin - h - 10), (xmin + w, label_ymin + baseline - 10), color, cv2.FILLED)
+            cv2.putText(frame, text, (xmin, label_ymin - 7), FONT, self.font_scale, (0, 0, 0), 1)
+
+        # Basic object counting
+        return len(dets)
+
+    def draw_roi(self, frame, roi):
+        # Outline each tile of the rail band the model is looking at
+        h, w = frame.shape[:2]
+        for x0, y0, x1, y1 in roi.tile_bounds(w, h):
+            cv2.rectangle(frame, (x0, y0), (x1 - 1, y1 - 1), (255, 255, 255), 1)
+
+    def draw_status(self, frame, lines):
+        # One line of status text every 20 px down the top-left corner;
+        # None leaves its line empty so the others keep their place
+        for i, line in enumerate(lines):
+            if line is not None:
+                cv2.putText(frame, line, (10, 20 + 20 * i), FONT, .7, STATUS_COLOR, 2)
+
+    def draw(self, frame, dets, roi=None, status=()):
+        if roi is not None:
+            self.draw_roi(frame, roi)
+        count = self.draw_detections(frame, dets)
+        self.draw_status(frame, status)
+        self.frames_drawn += 1
+        return count
+
+    def stats(self):
+        return {'frames_drawn': self.frames_drawn, 'labels_cached': len(self._cache),
+                'cache_hits': self.cache_hits, 'cache_misses': self.cache_misses}
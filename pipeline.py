@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+
+
+# Bounded queue that drops the oldest item when full, so the consumer
+# always gets the freshest frame instead of working through a backlog
+class LatestQueue:
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        # Returns None once the queue is closed and drained, or on timeout
+        with self._condition:
+            if not self._items and not self._closed:
+                self._condition.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed and not self._items
+
+    def qsize(self):
+        return len(self._items)
+
+
+# Counts items handled by a stage and turns them into a rate
+class StageCounter:
+    def __init__(self):
+        self.count = 0
+        self._last_count = 0
+        self._last_time = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+
+    def rate(self):
+        now = time.perf_counter()
+        elapsed = now - self._last_time
+        rate = (self.count - self._last_count) / elapsed if elapsed > 0 else 0.0
+        self._last_count = self.count
+        self._last_time = now
+        return rate
+
+
+# Worker thread that pulls from inbox, applies func and pushes to outbox.
+# A None inbox makes it a source stage: func() is called with no argument
+# and returning None ends the pipeline.
+class StageWorker(threading.Thread):
+    def __init__(self, name, func, inbox, outbox, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.counter = StageCounter()
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                if self.inbox is None:
+                    item = self.func()
+                    if item is None:
+                        break
+                else:
+                    item = self.inbox.get(timeout=0.1)
+                    if item is None:
+                        if self.inbox.closed:
+                            break
+                        continue
+                    item = self.func(item)
+                    if item is None:
+                        continue
+                self.counter.tick()
+                self.outbox.put(item)
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+        finally:
+            self.outbox.close()
+
+
+# Capture -> inference -> render pipeline. Capture and inference run in
+# their own threads; rendering/output is pulled from the main thread with
+# next_result() because cv2.imshow has to stay on the thread that owns
+# the window. infer_fn is called as infer_fn(frame, seq) with the capture
+# sequence number next_result() hands back alongside the frame.
+class Pipeline:
+    def __init__(self, capture_fn, infer_fn, capture_queue_size=1, result_queue_size=2):
+        self.stop_event = threading.Event()
+        self.frames = LatestQueue(capture_queue_size)
+        self.results = LatestQueue(result_queue_size)
+        self._seq = 0
+
+        def capture():
+            frame = capture_fn()
+            if frame is None:
+                return None
+            self._seq += 1
+            return (self._seq, time.perf_counter(), frame)
+
+        def infer(item):
+            seq, t_capture, frame = item
+            return (seq, t_capture, frame, infer_fn(frame, seq))
+
+        self.capture_worker = StageWorker('capture', capture, None, self.frames, self.stop_event)
+        self.infer_worker = StageWorker('inference', infer, self.frames, self.results, self.stop_event)
+        self.render_counter = StageCounter()
+
+    def start(self):
+        self.capture_worker.start()
+        self.infer_worker.start()
+
+    def next_result(self, timeout=0.5):
+        # Returns (seq, t_capture, frame, results), or None when the
+        # pipeline has finished
+        while True:
+            item = self.results.get(timeout=timeout)
+            if item is not None:
+                self.render_counter.tick()
+                return item
+            if self.results.closed or self.stop_event.is_set():
+                return None
+
+    def stats(self):
+        # Per-stage throughput (items/s since the last call) and queue depth
+        return {
+            'capture_fps': self.capture_worker.counter.rate(),
+            'inference_fps': self.infer_worker.counter.rate(),
+            'render_fps': self.render_counter.rate(),
+            'capture_queue': self.frames.qsize(),
+            'result_queue': self.results.qsize(),
+            'capture_dropped': self.frames.dropped,
+            'result_dropped': self.results.dropped,
+        }
+
+    def stop(self):
+        self.stop_event.set()
+        self.frames.close()
+        self.results.close()
+        for worker in (self.capture_worker, self.infer_worker):
+            if worker.is_alive():
+                worker.join(timeout=2)
+        for worker in (self.capture_worker, self.infer_worker):
+            if worker.error is not None:
+                raise worker.error
@@ -0,0 +1,40 @@
+import numpy as np
+
+# Compact per-frame detection record handed to drawing, counting and logging
+DETECTION_DTYPE = np.dtype([
+    ('xyxy', np.float32, (4,)),
+    ('conf', np.float32),
+    ('cls', np.int32),
+])
+
+
+def to_numpy(values):
+    # Works for torch tensors (GPU or CPU) as well as plain arrays
+    if hasattr(values, 'cpu'):
+        values = values.cpu()
+    if hasattr(values, 'numpy'):
+        values = values.numpy()
+    return np.asarray(values)
+
+
+def empty_detections():
+    return np.empty(0, dtype=DETECTION_DTYPE)
+
+
+def make_detections(xyxy, conf, cls):
+    dets = np.empty(len(conf), dtype=DETECTION_DTYPE)
+    dets['xyxy'] = xyxy
+    dets['conf'] = conf
+    dets['cls'] = cls
+    return dets
+
+
+def extract_detections(boxes, min_thresh):
+    # Convert an ultralytics Boxes object with a single host copy.
+    # boxes.data is (N, 6) [x1, y1, x2, y2, conf, cls], or (N, 7) with a
+    # track id before conf/cls when the model runs in tracking mode.
+    data = to_numpy(boxes.data)
+    if data.size == 0:
+        return empty_detections()
+    data = data[data[:, -2] > min_thresh]
+    return make_detections(data[:, :4], data[:, -2], data[:, -1])
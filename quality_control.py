@@ -0,0 +1,228 @@
+import collections
+import logging
+import threading
+import time
+
+# One rung of the quality ladder. scale is the fraction of the capture
+# resolution that gets encoded and fps the frame rate cap (None = as fast
+# as frames arrive). Not every streamer can apply all three: Picamera2's
+# JpegEncoder can change quality and frame rate on the fly but not the
+# resolution, so its ladder only has scale 1.0.
+OperatingPoint = collections.namedtuple('OperatingPoint', 'quality scale fps')
+
+
+def build_ladder(max_quality=80, min_quality=30, step=10, scales=(1.0,), fps_steps=(None,)):
+    # Ordered best-first: quality drops first since it is invisible to the
+    # rest of the pipeline, then resolution, then frame rate
+    ladder = [OperatingPoint(q, scales[0], fps_steps[0])
+              for q in range(max_quality, min_quality - 1, -step)]
+    ladder += [OperatingPoint(min_quality, s, fps_steps[0]) for s in scales[1:]]
+    ladder += [OperatingPoint(min_quality, scales[-1], f) for f in fps_steps[1:]]
+    return ladder
+
+
+def picamera_ladder(max_quality=70, min_quality=30, fps=30.0, min_fps=10.0):
+    # Quality steps, then halving the frame rate down to min_fps
+    fps_steps = [fps]
+    while fps_steps[-1] / 2 >= min_fps:
+        fps_steps.append(fps_steps[-1] / 2)
+    return build_ladder(max_quality, min_quality, fps_steps=tuple(fps_steps))
+
+
+# Turns a server's cumulative per-client counters into rates between two
+# samples. backlog is the largest unsent byte count of any viewer (only
+# the asyncio server can see it), client_fps the frame rate reached by
+# the slowest viewer and source_fps the rate frames were published at.
+class StreamThroughput:
+    def __init__(self, output):
+        self.output = output
+        self._last_seq = output.seq
+        self._last_time = time.perf_counter()
+        self._sent = {}
+
+    def sample(self, clients, now=None):
+        now = time.perf_counter() if now is None else now
+        dt = max(now - self._last_time, 1e-6)
+        seq = self.output.seq
+        source_fps = (seq - self._last_seq) / dt
+        self._last_seq, self._last_time = seq, now
+
+        backlog = 0
+        client_fps = None
+        sent = {}
+        for client in list(clients):
+            backlog = max(backlog, client.backlog)
+            sent[id(client)] = client.frames_sent
+            previous = self._sent.get(id(client))
+            if previous is not None:
+                fps = (client.frames_sent - previous) / dt
+                client_fps = fps if client_fps is None else min(client_fps, fps)
+        self._sent = sent
+        return backlog, client_fps, source_fps
+
+
+# Steps down a ladder of operating points when the stream can't keep up
+# and back up when it can, with hysteresis so it doesn't oscillate.
+#
+# A sample is congested when any viewer has more than high_water of
+# max_backlog bytes queued, the slowest viewer gets less than 1 - max_drop
+# of the published frames, or encoding takes more than encode_budget of
+# the frame interval. It is healthy only when all three are comfortably
+# clear (low_water, min_drop, half the encode budget); anything in
+# between holds the current level. It takes down_after congested samples
+# in a row to step down and up_after healthy ones to step up. A step up
+# that is followed straight away by a step down means the link can't
+# carry that level, so the wait before the next attempt doubles (up to
+# max_up_after) and resets once the stream has been stable that long.
+#
+# Listeners are called with the new OperatingPoint on every change, on
+# the thread that called update().
+class QualityController:
+    def __init__(self, ladder, target_fps=30.0, max_backlog=512 * 1024, high_water=0.5, low_water=0.1,
+                 max_drop=0.2, min_drop=0.05, encode_budget=0.8, down_after=2, up_after=10, max_up_after=120):
+        self.ladder = list(ladder)
+        self.target_fps = target_fps
+        self.max_backlog = max_backlog
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_drop = max_drop
+        self.min_drop = min_drop
+        self.encode_budget = encode_budget
+        self.down_after = down_after
+        self.base_up_after = up_after
+        self.up_after = up_after
+        self.max_up_after = max_up_after
+        self.listeners = []
+        self.level = 0
+        self.changes = 0
+        self.reason = 'start'
+        self.last_sample = {}
+        self._bad = 0
+        self._good = 0
+        self._since_up = None
+
+    @property
+    def point(self):
+        return self.ladder[self.level]
+
+    def update(self, backlog=0, client_fps=None, source_fps=None, encode_seconds=None):
+        # Returns the new OperatingPoint if this sample changed it, else None
+        self.last_sample = {'backlog': backlog, 'client_fps': client_fps,
+                            'source_fps': source_fps, 'encode_ms': None if encode_seconds is None else encode_seconds * 1000}
+        delivered = 1.0
+        if client_fps is not None and source_fps:
+            delivered = client_fps / source_fps
+        fps = self.point.fps or self.target_fps
+        encode_load = 0.0 if encode_seconds is None else encode_seconds * fps
+
+        reasons = []
+        if backlog > self.high_water * self.max_backlog:
+            reasons.append(f'backlog {backlog // 1024} KiB')
+        if delivered < 1.0 - self.max_drop:
+            reasons.append(f'viewer gets {delivered * 100:.0f}% of frames')
+        if encode_load > self.encode_budget:
+            reasons.append(f'encode {encode_seconds * 1000:.1f} ms')
+        healthy = (backlog <= self.low_water * self.max_backlog and delivered >= 1.0 - self.min_drop
+                   and encode_load <= self.encode_budget / 2)
+
+        if self._since_up is not None:
+            self._since_up += 1
+        if reasons:
+            self._bad += 1
+            self._good = 0
+        elif healthy:
+            self._good += 1
+            self._bad = 0
+        else:
+            self._bad = self._good = 0
+
+        if self._since_up is not None and self._since_up >= self.up_after:
+            # Held the last step up long enough; back off the backoff
+            self.up_after = self.base_up_after
+            self._since_up = None
+
+        if self._bad >= self.down_after and self.level < len(self.ladder) - 1:
+            if self._since_up is not None:
+                self.up_after = min(self.up_after * 2, self.max_up_after)
+                self._since_up = None
+            return self._set_level(self.level + 1, ', '.join(reasons))
+        if self._good >= self.up_after and self.level > 0:
+            self._since_up = 0
+            return self._set_level(self.level - 1, 'healthy')
+        return None
+
+    def _set_level(self, level, reason):
+        self.level = level
+        self.changes += 1
+        self.reason = reason
+        self._bad = self._good = 0
+        point = self.point
+        logging.info('Stream quality -> q%d, scale %.2f, fps %s (%s)', point.quality, point.scale,
+                     point.fps or 'max', reason)
+        for callback in self.listeners:
+            callback(point)
+        return point
+
+    def state(self):
+        # The current operating point and why, for status endpoints
+        point = self.point
+        return {
+            'level': self.level,
+            'levels': len(self.ladder),
+            'quality': point.quality,
+            'scale': point.scale,
+            'fps': point.fps,
+            'changes': self.changes,
+            'reason': self.reason,
+            'up_after': self.up_after,
+            'sample': self.last_sample,
+        }
+
+
+# Samples a server's viewers every `interval` seconds and feeds the
+# controller. clients is a callable returning the current ClientStats;
+# encode_seconds, if given, returns the latest encode time.
+class QualityLoop(threading.Thread):
+    def __init__(self, controller, output, clients, encode_seconds=None, interval=1.0):
+        super().__init__(name='quality-control', daemon=True)
+        self.controller = controller
+        self.throughput = StreamThroughput(output)
+        self.clients = clients
+        self.encode_seconds = encode_seconds
+        self.interval = interval
+        self._closed = threading.Event()
+
+    def run(self):
+        while not self._closed.wait(self.interval):
+            backlog, client_fps, source_fps = self.throughput.sample(self.clients())
+            encode = self.encode_seconds() if self.encode_seconds is not None else None
+            self.controller.update(backlog, client_fps, source_fps, encode)
+
+    def close(self):
+        self._closed.set()
+        self.join(timeout=2)
+
+
+def picamera_listener(picam2, encoder):
+    # Applies operating points to a running Picamera2 JpegEncoder, which
+    # reads encoder.q for every frame; frame rate goes through the sensor's
+    # frame duration limits, so the ladder should give every rung an
+    # explicit fps (see picamera_ladder) or a step back up keeps the cap
+    def apply(point):
+        encoder.q = point.quality
+        if point.fps:
+            duration = int(1e6 / point.fps)
+            picam2.set_controls({'FrameDurationLimits': (duration, duration)})
+    return apply
+
+
+def adapt_picamera_stream(picam2, encoder, output, server, fps=30.0, interval=1.0):
+    # Wires a controller to a Picamera2 JpegEncoder streaming through
+    # `server` (either MJPEG server) and exposes it on /status.json
+    controller = QualityController(picamera_ladder(encoder.q, fps=fps), target_fps=fps,
+                                   max_backlog=getattr(server, 'max_backlog', 512 * 1024))
+    controller.listeners.append(picamera_listener(picam2, encoder))
+    server.status['stream_quality'] = controller.state
+    control = QualityLoop(controller, output, lambda: server.clients, interval=interval)
+    control.start()
+    return control
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def parse_band(text):
+    # "0.4,0.8" -> (0.4, 0.8), fractions of the frame height (or width)
+    lo, hi = (float(v) for v in text.split(','))
+    if not 0.0 <= lo < hi <= 1.0:
+        raise ValueError(f'Band {text} must be two fractions with 0 <= lo < hi <= 1')
+    return lo, hi
+
+
+# Region of interest covering the rail band, optionally split into
+# overlapping tiles along its width. split() returns crops (views into the
+# frame, no copy) and the offset of each crop in full-frame pixels.
+class RailRoi:
+    def __init__(self, y_band=(0.0, 1.0), x_band=(0.0, 1.0), tiles=1, overlap=0.2):
+        if tiles < 1:
+            raise ValueError('tiles must be at least 1')
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError('overlap must be in [0, 1)')
+        self.y_band = y_band
+        self.x_band = x_band
+        self.tiles = tiles
+        self.overlap = overlap
+
+    def bounds(self, width, height):
+        x0, x1 = int(self.x_band[0] * width), int(self.x_band[1] * width)
+        y0, y1 = int(self.y_band[0] * height), int(self.y_band[1] * height)
+        return x0, y0, x1, y1
+
+    def tile_bounds(self, width, height):
+        x0, y0, x1, y1 = self.bounds(width, height)
+        band_w = x1 - x0
+        # n tiles of width t overlapping by overlap*t cover t*(n - (n-1)*overlap)
+        tile_w = int(np.ceil(band_w / (self.tiles - (self.tiles - 1) * self.overlap)))
+        step = tile_w * (1.0 - self.overlap)
+        bounds = []
+        for i in range(self.tiles):
+            tx0 = x0 + int(round(i * step))
+            tx1 = min(tx0 + tile_w, x1)
+            bounds.append((tx0, y0, tx1, y1))
+        return bounds
+
+    def split(self, frame):
+        h, w = frame.shape[:2]
+        crops, offsets = [], []
+        for tx0, ty0, tx1, ty1 in self.tile_bounds(w, h):
+            crops.append(frame[ty0:ty1, tx0:tx1])
+            offsets.append((tx0, ty0))
+        return crops, offsets
+
+
+def box_iou(box, boxes):
+    # IoU of one xyxy box against an (N, 4) array
+    ix0 = np.maximum(box[0], boxes[:, 0])
+    iy0 = np.maximum(box[1], boxes[:, 1])
+    ix1 = np.minimum(box[2], boxes[:, 2])
+    iy1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix1 - ix0, 0, None) * np.clip(iy1 - iy0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(dets, iou_thresh=0.5):
+    # Class-aware greedy NMS over a structured detection array; used to
+    # merge duplicates of one object seen by two overlapping tiles
+    if len(dets) < 2:
+        return dets
+    order = np.argsort(-dets['conf'])
+    dets = dets[order]
+    boxes = dets['xyxy']
+    keep = np.ones(len(dets), dtype=bool)
+    for i in range(len(dets)):
+        if not keep[i]:
+            continue
+        rest = np.nonzero(keep[i + 1:])[0] + i + 1
+        if not len(rest):
+            break
+        same_class = dets['cls'][rest] == dets['cls'][i]
+        overlap = box_iou(boxes[i], boxes[rest]) > iou_thresh
+        keep[rest[same_class & overlap]] = False
+    return dets[keep]
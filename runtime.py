@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from async_stream import AsyncMjpegServer
+from backends import DEFAULT_CACHE, set_threads
+from change_gate import ChangeGate
+from detector import Detector, choose_model, load_model
+from frame_source import open_source, parse_resolution
+from instrumentation import StageTimer
+from metrics import Metrics, MetricsServer, register_stream, register_system, register_timer
+from motor import MotorApiServer, MotorController, load_gpio, parse_speed
+from overlay import OverlayRenderer
+from quality_control import QualityController, QualityLoop, build_ladder
+from roi import RailRoi, parse_band
+from speed_control import DutyCalibration, SpeedGovernor
+from startup import Startup, timed
+from streaming import StreamingOutput
+
+# One process, one camera. The camera is configured once with two
+# streams from the ISP: `main` (640x480) feeds the MJPEG stream, clips
+# and an optional H.264 recording, `lores` (320x240) feeds the detector,
+# so nothing is resized on the CPU before inference. Streaming,
+# detection, recording and motor control run as components of a Runtime
+# that starts them in order and stops them in reverse on SIGTERM/SIGINT
+# or when the camera runs out of frames.
+#
+#   python runtime.py --clip-dir clips --motors --metrics-port 9100
+#
+# Off the Pi, --source synthetic (or a video file) stands in for the
+# camera, with lores frames resized from main in software.
+
+STAGES = ('capture', 'gate', 'inference', 'postprocess', 'logging')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Detection, streaming, recording and motor control on one camera')
+    parser.add_argument('--source', default='picamera0',
+                        help='picamera0, or synthetic[:N]/a video file to stand in for the camera')
+    parser.add_argument('--main', type=parse_resolution, default=(640, 480), metavar='WxH',
+                        help='Size of the streamed/recorded main stream')
+    parser.add_argument('--lores', type=parse_resolution, default=(320, 240), metavar='WxH',
+                        help='Size of the stream the detector sees')
+    parser.add_argument('--lores-format', choices=('YUV420', 'RGB888'), default='YUV420',
+                        help='lores pixel format; Pi 4 and older only produce YUV420 there, a Pi 5 can give RGB888')
+    parser.add_argument('--fps', type=float, default=30.0, help='Sensor frame rate, shared by both streams')
+    parser.add_argument('--port', type=int, default=8000, help='MJPEG stream port')
+    parser.add_argument('--stream-quality', type=int, default=70)
+    parser.add_argument('--fixed-quality', action='store_true',
+                        help="Don't lower the stream's JPEG quality when viewers fall behind")
+    parser.add_argument('--model', help='Model to run instead of the cached benchmark winner')
+    parser.add_argument('--backend-cache', default=DEFAULT_CACHE)
+    parser.add_argument('--min-thresh', type=float, default=0.5)
+    parser.add_argument('--roi', type=parse_band, metavar='Y0,Y1',
+                        help='Only run the model on the rail band between these fractions of the lores height')
+    parser.add_argument('--roi-x', type=parse_band, default=(0.0, 1.0), metavar='X0,X1')
+    parser.add_argument('--tiles', type=int, default=1)
+    parser.add_argument('--tile-overlap', type=float, default=0.2)
+    parser.add_argument('--gate-threshold', type=float, metavar='LEVELS',
+                        help='Skip inference on lores frames that barely changed (off by default)')
+    parser.add_argument('--gate-max-stale', type=int, default=15, metavar='N')
+    parser.add_argument('--warmup', type=int, default=3, metavar='N')
+    parser.add_argument('--no-overlay', action='store_true',
+                        help="Stream the camera picture without the detector's boxes")
+    parser.add_argument('--log-dir', metavar='DIR', help='Record every detection with a crop to DIR')
+    parser.add_argument('--log-max-mb', type=float, default=64)
+    parser.add_argument('--dedup-radius', type=int, metavar='BITS',
+                        help="Don't store crops within this many hash bits of a recent one (off by default; "
+                             "8 matches about 92%% of a box re-seen with 2 px of jitter, see bench_crop_dedup.py)")
+    parser.add_argument('--dedup-window', type=float, default=60.0, metavar='S', help='0: match crops from any time')
+    parser.add_argument('--dedup-index', metavar='PATH', help='Default: LOG_DIR/crop_index.npz')
+    parser.add_argument('--clip-dir', metavar='DIR', help='Save clips of the main stream around detections')
+    parser.add_argument('--clip-pre', type=float, default=5.0, metavar='S')
+    parser.add_argument('--clip-post', type=float, default=5.0, metavar='S')
+    parser.add_argument('--clip-mb', type=float, default=32)
+    parser.add_argument('--record', metavar='DIR', help='Record the main stream as H.264 to DIR')
+    parser.add_argument('--record-bitrate', type=int, default=4_000_000)
+    parser.add_argument('--motors', action='store_true', help='Run the motor controller and its HTTP API')
+    parser.add_argument('--drive', action='store_true',
+                        help='Drive forward, capped so every stretch of rail gets analysed (implies --motors)')
+    parser.add_argument('--drive-speed', type=parse_speed, default='medium')
+    parser.add_argument('--footprint', type=float, default=0.3, metavar='M')
+    parser.add_argument('--frame-overlap', type=float, default=0.3)
+    parser.add_argument('--speed-per-duty', type=float, default=0.015)
+    parser.add_argument('--min-duty', type=float, default=20.0)
+    parser.add_argument('--motor-port', type=int, default=8001)
+    parser.add_argument('--mock-gpio', action='store_true')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='Also serve /metrics on its own port (it is always on the stream port)')
+    parser.add_argument('--ready-file', metavar='PATH')
+    parser.add_argument('--duration', type=float, metavar='S', help='Stop after this many seconds')
+    return parser.parse_args()
+
+
+# The Pi camera with a main and a lores stream. Encoders attach to main;
+# capture_lores() hands the detector its own smaller BGR copy. Drawing
+# callbacks in `overlays` run on every main frame before it reaches the
+# encoders (Picamera2's pre_callback), so the stream, clips and
+# recording show the detector's boxes without a second encode.
+class DualStreamCamera:
+    def __init__(self, main_size, lores_size, lores_format='YUV420', fps=30.0, camera_num=0):
+        from picamera2 import Picamera2
+        self.main_size = tuple(main_size)
+        self.lores_size = tuple(lores_size)
+        self.lores_format = lores_format
+        self.overlays = []
+        self.picam2 = Picamera2(camera_num)
+        duration = int(1e6 / fps)
+        self.picam2.configure(self.picam2.create_video_configuration(
+            main={'size': self.main_size, 'format': 'XRGB8888'},
+            lores={'size': self.lores_size, 'format': lores_format},
+            controls={'FrameDurationLimits': (duration, duration)}))
+        self.picam2.pre_callback = self._draw
+
+    def _draw(self, request):
+        if not self.overlays:
+            return
+        from picamera2 import MappedArray
+        with MappedArray(request, 'main') as m:
+            for draw in self.overlays:
+                draw(m.array)
+
+    def start(self):
+        self.picam2.start()
+
+    def capture_lores(self):
+        frame = self.picam2.capture_array('lores')
+        if self.lores_format == 'YUV420':
+            # I420 planes, (h * 3 / 2, w); a colour conversion but no resize
+            return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
+        return frame
+
+    def start_stream(self, output, quality):
+        from picamera2.encoders import JpegEncoder
+        from picamera2.outputs import FileOutput
+        encoder = JpegEncoder(q=quality)
+        self.picam2.start_encoder(encoder, FileOutput(output), name='main')
+        return encoder
+
+    def start_recording(self, path, bitrate):
+        from picamera2.encoders import H264Encoder
+        from picamera2.outputs import FileOutput
+        encoder = H264Encoder(bitrate=bitrate)
+        self.picam2.start_encoder(encoder, FileOutput(path), name='main')
+        return encoder
+
+    def stop_encoder(self, encoder):
+        self.picam2.stop_encoder(encoder)
+
+    def stop(self):
+        self.picam2.stop()
+
+    def close(self):
+        self.picam2.close()
+
+
+# JPEG quality and destination of one SourceCamera stream (the
+# attributes the runtime sets on picamera2's JpegEncoder)
+class SoftwareJpegEncoder:
+    def __init__(self, output, q):
+        self.output = output
+        self.q = q
+
+
+# Software stand-in for DualStreamCamera, for running the whole runtime
+# against a recording or the synthetic source. A thread paces the source
+# as the main stream, resizes each frame for lores (the work the ISP does
+# on the Pi) and JPEG-encodes main for the stream.
+class SourceCamera(threading.Thread):
+    def __init__(self, spec, main_size, lores_size, fps=30.0):
+        super().__init__(name='source-camera', daemon=True)
+        self.source = open_source(spec, main_size, realtime=True, fps=fps, fmt='RGB888')
+        self.main_size = tuple(main_size)
+        self.lores_size = tuple(lores_size)
+        self.overlays = []
+        self.encoders = []
+        self._lores = None
+        self._seq = 0
+        self._last_taken = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def run(self):
+        while not self._closed:
+            frame = self.source.capture_array()
+            if frame is None:
+                break
+            lores = cv2.resize(frame, self.lores_size, interpolation=cv2.INTER_AREA)
+            with self._condition:
+                self._lores = lores
+                self._seq += 1
+                self._condition.notify_all()
+            for draw in self.overlays:
+                draw(frame)
+            for encoder in list(self.encoders):
+                ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), encoder.q])
+                if ok:
+                    encoder.output.publish(buf.tobytes())
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def start(self):
+        self.source.start()
+        super().start()
+
+    def capture_lores(self):
+        # The next lores frame, or None once the source has run out
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > self._last_taken or self._closed)
+            if self._seq == self._last_taken:
+                return None
+            self._last_taken = self._seq
+            return self._lores
+
+    def start_stream(self, output, quality):
+        encoder = SoftwareJpegEncoder(output, quality)
+        self.encoders.append(encoder)
+        return encoder
+
+    def start_recording(self, path, bitrate):
+        logging.warning('H.264 recording needs the Pi camera; not recording %s', path)
+        return None
+
+    def stop_encoder(self, encoder):
+        if encoder in self.encoders:
+            self.encoders.remove(encoder)
+
+    def stop(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.join(timeout=2)
+
+    def close(self):
+        self.source.stop()
+
+
+# Runs the detector on lores frames as fast as they come. The newest
+# detections are kept for overlay(), which the camera calls on each main
+# frame with boxes scaled up from lores coordinates. If `wanted` is set,
+# frames are only drawn on while it returns true.
+class DetectionWorker(threading.Thread):
+    def __init__(self, camera, detector, labels, timer, gate=None, logger=None, clips=None):
+        super().__init__(name='detection', daemon=True)
+        self.camera = camera
+        self.detector = detector
+        self.labels = labels
+        self.timer = timer
+        self.gate = gate
+        self.logger = logger
+        self.clips = clips
+        self.renderer = OverlayRenderer(labels)
+        self.wanted = None
+        # Both streams show the same field of view, so a lores box maps to
+        # main by the width and height ratios separately (they differ when
+        # e.g. main is 16:9 and lores 4:3)
+        self.scale = (camera.main_size[0] / camera.lores_size[0], camera.main_size[1] / camera.lores_size[1])
+        self.frames = 0
+        self.detections = 0
+        self.dets = None
+        self.error = None
+        self._closed = threading.Event()
+
+    def run(self):
+        timer = self.timer
+        try:
+            while not self._closed.is_set():
+                timer.start()
+                frame = self.camera.capture_lores()
+                timer.lap('capture')
+                if frame is None:
+                    logging.info('Camera stopped delivering frames')
+                    break
+                self.frames += 1
+                skip = self.gate is not None and self.dets is not None and not self.gate.should_infer(frame)
+                timer.lap('gate')
+                if skip:
+                    continue
+                raw = self.detector.infer(frame)
+                timer.lap('inference')
+                dets = self.detector.postprocess(raw)
+                timer.lap('postprocess')
+                self.dets = dets
+                if len(dets):
+                    self.detections += len(dets)
+                    if self.logger is not None:
+                        self.logger.log(frame, self.frames, dets)
+                        timer.lap('logging')
+                    if self.clips is not None:
+                        self.clips.trigger()
+        except Exception as e:
+            # Surfaces in the runtime, which shuts everything down
+            self.error = e
+            logging.exception('Detection failed')
+
+    def overlay(self, frame):
+        dets = self.dets
+        if dets is None or not len(dets) or (self.wanted is not None and not self.wanted()):
+            return
+        sx, sy = self.scale
+        if (sx, sy) != (1.0, 1.0):
+            dets = dets.copy()
+            dets['xyxy'] *= (sx, sy, sx, sy)
+        self.renderer.draw_detections(frame, dets)
+
+    def state(self):
+        return {'frames': self.frames, 'detections': self.detections,
+                'inferences': self.timer.stages['inference'].total,
+                'showing': 0 if self.dets is None else len(self.dets)}
+
+    def close(self):
+        self._closed.set()
+        self.join(timeout=5)
+
+
+# Starts components in the order they are added and stops them in
+# reverse, so everything started before a failure is still cleaned up.
+# stop() of one component failing doesn't keep the rest running.
+class Runtime:
+    def __init__(self):
+        self.components = []
+        self.stopping = threading.Event()
+
+    def add(self, name, start, stop):
+        if start is not None:
+            start()
+        self.components.append((name, stop))
+        logging.info('Started %s', name)
+
+    def request_stop(self, *_):
+        self.stopping.set()
+
+    def wait(self, alive, timeout=None):
+        # Until a signal, the deadline, or alive() turning false
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stopping.wait(0.5):
+            if not alive() or (deadline is not None and time.monotonic() >= deadline):
+                break
+
+    def close(self):
+        while self.components:
+            name, stop = self.components.pop()
+            try:
+                stop()
+                logging.info('Stopped %s', name)
+            except Exception:
+                logging.exception('Stopping %s failed', name)
+
+
+def open_dual_camera(args):
+    if args.source.startswith('picamera'):
+        return DualStreamCamera(args.main, args.lores, args.lores_format, args.fps,
+                                camera_num=int(args.source[len('picamera'):] or 0))
+    return SourceCamera(args.source, args.main, args.lores, args.fps)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    startup = Startup(args.ready_file)
+    runtime = Runtime()
+    signal.signal(signal.SIGTERM, runtime.request_stop)
+    signal.signal(signal.SIGINT, runtime.request_stop)
+
+    try:
+        path, imgsz, threads = choose_model(args.model, args.backend_cache)
+        startup.status('Loading model and opening camera')
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            loading = pool.submit(timed, load_model, path)
+            camera, open_seconds = timed(open_dual_camera, args)
+            # Released last, and also if loading the model fails
+            runtime.add('camera device', None, camera.close)
+            (model, labels), load_seconds = loading.result()
+        startup.record('model_load', load_seconds)
+        startup.record('camera_open', open_seconds)
+
+        timer = StageTimer(STAGES)
+        roi = None
+        if args.roi is not None:
+            roi = RailRoi(args.roi, args.roi_x, args.tiles, args.tile_overlap)
+        detector = Detector(model, args.min_thresh, roi, imgsz=imgsz)
+        if args.warmup or threads:
+            detector.warm_up(args.lores, max(args.warmup, 1))
+            set_threads(model, threads)
+        gate = None
+        if args.gate_threshold is not None:
+            gate = ChangeGate(args.gate_threshold, args.gate_max_stale)
+
+        metrics = Metrics()
+        register_system(metrics)
+        register_timer(metrics, timer)
+
+        logger = None
+        if args.log_dir is not None:
+            from event_log import open_defect_log
+            logger = open_defect_log(args.log_dir, labels, args.log_max_mb,
+                                     args.dedup_radius, args.dedup_window, args.dedup_index)
+            runtime.add('defect log', logger.start, logger.close)
+
+        runtime.add('camera', camera.start, camera.stop)
+
+        # Stream: the main stream encoded once, fanned out to viewers and
+        # the clip ring. Only JPEG quality adapts; the frame rate is the
+        # sensor's and would slow the detector down with it.
+        output = StreamingOutput()
+        server = AsyncMjpegServer(('', args.port))
+        server.attach(output)
+        server.metrics = metrics
+        register_stream(metrics, server, output)
+        runtime.add('stream server', server.start, server.shutdown)
+        encoder = camera.start_stream(output, args.stream_quality)
+        runtime.add('stream encoder', None, lambda: camera.stop_encoder(encoder))
+        if not args.fixed_quality:
+            controller = QualityController(build_ladder(args.stream_quality, 30), target_fps=args.fps,
+                                           max_backlog=server.max_backlog)
+            controller.listeners.append(lambda point: setattr(encoder, 'q', point.quality))
+            server.status['stream_quality'] = controller.state
+            control = QualityLoop(controller, output, lambda: server.clients)
+            runtime.add('stream quality', control.start, control.close)
+
+        clips = None
+        if args.clip_dir is not None:
+            from clip_buffer import ClipRecorder
+            clips = ClipRecorder(args.clip_dir, int(args.clip_mb * 1024 * 1024), args.clip_pre, args.clip_post)
+            clips.attach(output)
+            metrics.counter('clips_saved_total', 'Clips written around detections', lambda: clips.clips_written)
+            runtime.add('clip recorder', clips.start, clips.close)
+
+        recorder = None
+        if args.record is not None:
+            os.makedirs(args.record, exist_ok=True)
+            record_path = os.path.join(args.record, time.strftime('run-%Y%m%d-%H%M%S.h264'))
+            recorder = camera.start_recording(record_path, args.record_bitrate)
+            if recorder is not None:
+                runtime.add(f'recording to {record_path}', None, lambda: camera.stop_encoder(recorder))
+
+        worker = DetectionWorker(camera, detector, labels, timer, gate, logger, clips)
+        server.status['detection'] = worker.state
+        if not args.no_overlay:
+            # Clips and recordings always keep the boxes; the stream only
+            # needs them while someone is watching
+            if clips is None and recorder is None:
+                worker.wanted = lambda: bool(server.clients)
+            camera.overlays.append(worker.overlay)
+        runtime.add('detection', worker.start, worker.close)
+
+        if args.motors or args.drive:
+            motors = MotorController(load_gpio(args.mock_gpio), speed=args.drive_speed)
+            runtime.add('motors', motors.start, motors.close)
+            server.status['motors'] = motors.state
+            metrics.gauge('motor_duty_percent', 'Motor duty cycle after the speed limit', lambda: motors.duty)
+            if args.drive:
+                governor = SpeedGovernor(motors, lambda: timer.stages['inference'].total + (gate.skipped if gate else 0),
+                                         args.footprint, args.frame_overlap,
+                                         DutyCalibration(args.speed_per_duty, args.min_duty))
+                runtime.add('speed governor', governor.start, governor.close)
+                motors.submit('forward')
+            motor_api = MotorApiServer(('', args.motor_port), motors)
+            runtime.add('motor API', motor_api.start, motor_api.shutdown)
+
+        if args.metrics_port is not None:
+            metrics_server = MetricsServer(('', args.metrics_port), metrics)
+            runtime.add('metrics server', metrics_server.start, metrics_server.shutdown)
+
+        logging.info('Ready after %.2f s; stream at http://<this host>:%d/stream.mjpg', startup.ready(), args.port)
+        runtime.wait(worker.is_alive, args.duration)
+        if worker.error is not None:
+            logging.error('Shutting down after a detection error: %s', worker.error)
+    finally:
+        startup.stopping()
+        runtime.close()
+    state = worker.state()
+    logging.info('%d lores frames, %d inferences, %d detections', state['frames'], state['inferences'],
+                 state['detections'])
+    if clips is not None:
+        logging.info('%d clips saved', clips.stats()['clips'])
+    if logger is not None and logger.dedup is not None:
+        logging.info('%d duplicate crops not stored', logger.duplicates)
+
+
+if __name__ == "__main__":
+    main()
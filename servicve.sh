@@ -2,12 +2,21 @@
 Description=Raspberry Pi Camera Streaming Service
 After=network.target
 
+# The script sends READY=1 once the camera is open and the frame server
+# is listening, so dependants and `systemctl start` wait for that rather
+# than for the process to exist. yolo_detect.py does the same after its
+# model warm-up (or writes --ready-file for other supervisors).
+
 [Service]
+Type=notify
+NotifyAccess=main
+TimeoutStartSec=60
 ExecStart=/usr/bin/python3 /home/saravana/cam_stream/camera_stream.py
 WorkingDirectory=/home/saravana/cam_stream/
 StandardOutput=inherit
 StandardError=inherit
 Restart=always
+RestartSec=2
 User=saravana
 
 [Install]
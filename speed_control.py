@@ -0,0 +1,122 @@
+import logging
+import math
+import threading
+import time
+
+
+def max_ground_speed(footprint, overlap, rate):
+    # Fastest the car can go (m/s) while every stretch of rail is still
+    # analysed: consecutive analysed frames may only advance by the part
+    # of the footprint (metres of track along the direction of travel
+    # covered by the analysed region) that isn't required to overlap
+    return footprint * (1.0 - overlap) * rate
+
+
+# Linear motor model from a calibration run: below min_duty the car
+# doesn't move, above it ground speed grows by speed_per_duty m/s per
+# percent of duty cycle. Measure two points on the track (e.g. time 2 m
+# at 40% and at 70%) to fill these in.
+class DutyCalibration:
+    def __init__(self, speed_per_duty=0.015, min_duty=20.0, max_duty=75.0):
+        self.speed_per_duty = speed_per_duty
+        self.min_duty = min_duty
+        self.max_duty = max_duty
+
+    def speed(self, duty):
+        return max(duty - self.min_duty, 0.0) * self.speed_per_duty
+
+    def duty(self, speed):
+        # 0 when the speed is too low to move at all
+        if speed <= 0:
+            return 0.0
+        return min(self.min_duty + speed / self.speed_per_duty, self.max_duty)
+
+
+# Caps the motors' duty cycle so the car never outruns the detector.
+#
+# Every `interval` seconds it reads `analysed()`, a running count of
+# frames the detector has looked at, and turns the increase into a rate.
+# A falling rate (thermal throttling, a busy CPU) is acted on at once; a
+# rising one is smoothed and the duty is allowed up by at most max_step
+# percent per update, so a short burst can't speed the car up past what
+# the detector sustains. A detector that stops dead is only noticed at
+# the next update, up to 1/rate + interval after its last frame, so the
+# allowed speed covers that reaction time as well and is then scaled by
+# `margin`. If the detector stops analysing altogether the limit goes to
+# 0 and the car stops until it catches up. `applied` is set once the
+# latest limit has reached the motors.
+class SpeedGovernor(threading.Thread):
+    def __init__(self, motors, analysed, footprint, overlap=0.3, calibration=None, margin=0.8, interval=0.5,
+                 smoothing=0.3, max_step=5.0):
+        super().__init__(name='speed-governor', daemon=True)
+        self.motors = motors
+        self.analysed = analysed
+        self.footprint = footprint
+        self.overlap = overlap
+        self.calibration = calibration or DutyCalibration()
+        self.margin = margin
+        self.interval = interval
+        self.smoothing = smoothing
+        self.max_step = max_step
+        self.rate = None
+        self.speed = 0.0
+        self.limit = None
+        self.applied = threading.Event()
+        self._last_count = None
+        self._last_time = None
+        self._closed = threading.Event()
+
+    def update(self, now=None):
+        now = time.perf_counter() if now is None else now
+        count = self.analysed()
+        if self._last_count is None:
+            # No rate yet; hold the car until there is one
+            self._last_count, self._last_time = count, now
+            return self._set_limit(0.0)
+        dt = now - self._last_time
+        if dt <= 0:
+            return self.limit
+        rate = (count - self._last_count) / dt
+        self._last_count, self._last_time = count, now
+
+        if self.rate is None or rate < self.rate:
+            self.rate = rate
+        else:
+            self.rate += self.smoothing * (rate - self.rate)
+
+        self.speed = (self.margin * max_ground_speed(self.footprint, self.overlap, self.rate)
+                      / (1.0 + self.rate * self.interval))
+        duty = self.calibration.duty(self.speed)
+        limit = self.limit or 0.0
+        if duty > limit:
+            duty = min(duty, max(limit, self.calibration.min_duty) + self.max_step)
+            self.speed = min(self.speed, self.calibration.speed(duty))
+        return self._set_limit(duty)
+
+    def _set_limit(self, duty):
+        # Round down so the cap never exceeds the safe speed
+        duty = math.floor(duty * 10) / 10
+        if duty != self.limit:
+            if self.limit is None or (duty == 0.0) != (self.limit == 0.0):
+                logging.info('Speed governor: %s (%.1f analysed frames/s)',
+                             'holding the car' if duty == 0.0 else f'moving, duty limit {duty:.1f}%',
+                             self.rate or 0.0)
+            self.applied = self.motors.set_limit(duty)
+            self.limit = duty
+        return duty
+
+    def run(self):
+        self.update()
+        while not self._closed.wait(self.interval):
+            self.update()
+
+    def state(self):
+        return {'analysed_fps': self.rate, 'max_speed_mps': self.speed, 'duty_limit': self.limit,
+                'footprint_m': self.footprint, 'overlap': self.overlap, 'margin': self.margin}
+
+    def close(self):
+        # Lifts the limit so the motors go back to the operator's speed
+        self._closed.set()
+        if self.is_alive():
+            self.join(timeout=2)
+        self.motors.set_limit(None)
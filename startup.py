@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import socket
+import time
+
+
+def timed(fn, *args):
+    # (fn(*args), seconds it took)
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def process_age():
+    # Seconds since this process was started, so a startup report also
+    # covers interpreter start-up and imports; falls back to 0 where
+    # /proc isn't available
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def sd_notify(state):
+    # Minimal sd_notify(3): one datagram to $NOTIFY_SOCKET, if systemd set
+    # one (Type=notify units). A no-op everywhere else.
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError as e:
+        logging.warning('sd_notify failed: %s', e)
+        return False
+
+
+# Timeline of the startup sequence. mark(phase) records the time since
+# the process started; record(phase, seconds) stores a duration measured
+# elsewhere (e.g. the model load on its own thread). Phase changes are
+# passed on to systemd as STATUS= lines, and ready() sends READY=1 and/or
+# writes a ready file for supervisors that poll for one.
+class Startup:
+    def __init__(self, ready_file=None):
+        self.ready_file = ready_file
+        self.t0 = time.perf_counter() - process_age()
+        self.marks = {}
+        self.durations = {}
+        if ready_file and os.path.exists(ready_file):
+            # Left over from a previous run (e.g. before a crash restart)
+            os.remove(ready_file)
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+
+    def mark(self, phase):
+        self.marks[phase] = self.elapsed()
+        return self.marks[phase]
+
+    def record(self, phase, seconds):
+        self.durations[phase] = seconds
+
+    def status(self, text):
+        sd_notify(f'STATUS={text}')
+
+    def ready(self):
+        elapsed = self.mark('ready')
+        sd_notify(f'READY=1\nSTATUS=Running, ready after {elapsed:.2f} s')
+        if self.ready_file:
+            tmp = self.ready_file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'pid': os.getpid(), 'ready_after_s': elapsed}, f)
+            os.replace(tmp, self.ready_file)
+        return elapsed
+
+    def stopping(self):
+        sd_notify('STOPPING=1')
+        if self.ready_file and os.path.exists(self.ready_file):
+            os.remove(self.ready_file)
+
+    def report(self):
+        return {'marks_s': self.marks, 'durations_s': self.durations}
+
+    def format_report(self):
+        lines = [f'{phase:<18} {seconds:8.3f} s' for phase, seconds in self.marks.items()]
+        lines += [f'  {phase:<16} {seconds:8.3f} s' for phase, seconds in self.durations.items()]
+        return '\n'.join(lines)
@@ -0,0 +1,205 @@
+import io
+import json
+import logging
+import socketserver
+import threading
+import time
+from threading import Condition
+from http import server
+
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+PAGE = """\
+<!DOCTYPE html>
+<html>
+  <head>
+    <title>Raspberry Pi Video Streaming</title>
+  </head>
+  <body>
+    <h1>Raspberry Pi Video Stream</h1>
+    <img src="stream.mjpg" width="640" height="480" />
+  </body>
+</html>
+"""
+
+# Holds the latest encoded frame as an immutable bytes object together
+# with a monotonically increasing sequence number. Readers keep the last
+# sequence they sent and always jump to the newest frame, so a gap in
+# sequence numbers is exactly the number of frames that reader missed.
+# Subscribers (e.g. the asyncio broadcaster) are called with (seq, frame)
+# on the publishing thread.
+#
+# It is also the file-like object FileOutput(JpegEncoder) writes into.
+# Picamera2 hands over one complete JPEG per write, which is published
+# as-is: bytes are kept without copying, anything else (a memoryview onto
+# a reused encoder buffer) is copied once. Frames that arrive in pieces
+# are collected until the next SOI marker.
+class StreamingOutput(io.BufferedIOBase):
+    def __init__(self):
+        self.frame = None
+        self.seq = 0
+        self.timestamp = None
+        self.condition = Condition()
+        self.subscribers = []
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, buf):
+        if buf[:2] == b'\xff\xd8':
+            if self._parts:
+                self.publish(b''.join(self._parts))
+                self._parts = []
+            if buf[-2:] == b'\xff\xd9':
+                self.publish(buf if isinstance(buf, bytes) else bytes(buf))
+                return len(buf)
+        self._parts.append(bytes(buf))
+        return len(buf)
+
+    def publish(self, frame, timestamp=None):
+        with self.condition:
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = time.time() if timestamp is None else timestamp
+            seq = self.seq
+            self.condition.notify_all()
+        for callback in self.subscribers:
+            callback(seq, frame)
+
+    def wait_for_frame(self, last_seq, timeout=None):
+        # Returns (seq, frame, timestamp) for the newest frame after
+        # last_seq, or None if nothing new arrived within timeout seconds
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > last_seq, timeout):
+                return None
+            return self.seq, self.frame, self.timestamp
+
+# Per-viewer counters kept by the server while the viewer is connected.
+# backlog is the number of bytes queued for the viewer but not yet sent,
+# where the server can see it.
+class ClientStats:
+    backlog = 0
+
+    def __init__(self, address):
+        self.address = address
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.connected_at = time.time()
+
+    def record(self, seq, last_seq, size):
+        if last_seq:
+            self.frames_dropped += seq - last_seq - 1
+        self.frames_sent += 1
+        self.bytes_sent += size
+
+class StreamingHandler(server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        output = self.server.output
+        if self.path == '/':
+            self.send_response(301)
+            self.send_header('Location', '/index.html')
+            self.end_headers()
+        elif self.path == '/index.html':
+            content = PAGE.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', len(content))
+            self.end_headers()
+            self.wfile.write(content)
+        elif self.path == '/status.json':
+            content = self.server.status_json()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', len(content))
+            self.end_headers()
+            self.wfile.write(content)
+        elif self.path == '/metrics' and self.server.metrics is not None:
+            content = self.server.metrics.render()
+            self.send_response(200)
+            self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', len(content))
+            self.end_headers()
+            self.wfile.write(content)
+        elif self.path == '/stream.mjpg':
+            self.send_response(200)
+            self.send_header('Age', 0)
+            self.send_header('Cache-Control', 'no-cache, private')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
+            self.end_headers()
+            stats = self.server.add_client(self.client_address)
+            last_seq = output.seq
+            stalled = 0.0
+            try:
+                while True:
+                    item = output.wait_for_frame(last_seq, self.server.frame_timeout)
+                    if item is None:
+                        # Encoder stalled; give up on this viewer eventually
+                        # instead of holding its thread forever
+                        stalled += self.server.frame_timeout
+                        if stalled >= self.server.stall_timeout:
+                            logging.warning('No frames for %.0f s, closing streaming client %s',
+                                            stalled, self.client_address)
+                            break
+                        continue
+                    stalled = 0.0
+                    seq, frame, _ = item
+                    self.wfile.write(b'--FRAME\r\n')
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', len(frame))
+                    self.end_headers()
+                    self.wfile.write(frame)
+                    self.wfile.write(b'\r\n')
+                    stats.record(seq, last_seq, len(frame))
+                    last_seq = seq
+            except Exception as e:
+                logging.warning(
+                    'Removed streaming client %s: %s',
+                    self.client_address, str(e))
+            finally:
+                self.server.remove_client(stats)
+                logging.info('Client %s: %d frames sent, %d dropped',
+                             self.client_address, stats.frames_sent, stats.frames_dropped)
+        else:
+            self.send_error(404)
+            self.end_headers()
+
+# Thread-per-client MJPEG server. Frames come from `output`, a
+# StreamingOutput fed by the encoder. Handlers wake at least every
+# frame_timeout seconds and drop a viewer after stall_timeout seconds
+# without a new frame. /status.json and /metrics work as on
+# AsyncMjpegServer.
+class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, handler, output, frame_timeout=1.0, stall_timeout=10.0):
+        self.output = output
+        self.frame_timeout = frame_timeout
+        self.stall_timeout = stall_timeout
+        self.clients = set()
+        self.status = {}
+        self.metrics = None
+        self._clients_lock = threading.Lock()
+        super().__init__(address, handler)
+
+    def status_json(self):
+        with self._clients_lock:
+            clients = [{'address': str(c.address), 'frames_sent': c.frames_sent,
+                        'frames_dropped': c.frames_dropped} for c in self.clients]
+        status = {'frames_published': self.output.seq, 'clients': clients}
+        for name, fn in self.status.items():
+            status[name] = fn()
+        return json.dumps(status).encode('utf-8')
+
+    def add_client(self, address):
+        stats = ClientStats(address)
+        with self._clients_lock:
+            self.clients.add(stats)
+        return stats
+
+    def remove_client(self, stats):
+        with self._clients_lock:
+            self.clients.discard(stats)
@@ -0,0 +1,122 @@
+import numpy as np
+
+from postprocess import DETECTION_DTYPE
+from roi import box_iou
+
+# Detection record plus the stable id of the track it belongs to
+TRACK_DTYPE = np.dtype(DETECTION_DTYPE.descr + [('track_id', np.int32)])
+
+
+# One tracked object. State is box centre/size plus centre velocity in
+# pixels per frame, corrected with a fixed-gain alpha-beta filter (a
+# steady-state Kalman filter for a constant-velocity model).
+class Track:
+    def __init__(self, track_id, xyxy, conf, cls):
+        self.id = track_id
+        self.cls = int(cls)
+        self.conf = float(conf)
+        self.state = self._to_state(xyxy)
+        self.velocity = np.zeros(2, dtype=np.float32)
+        self.hits = 1
+        self.misses = 0
+        self.frames_since_update = 0
+
+    @staticmethod
+    def _to_state(xyxy):
+        x0, y0, x1, y1 = xyxy
+        return np.array([(x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0], dtype=np.float32)
+
+    def xyxy(self):
+        cx, cy, w, h = self.state
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+    def predict(self, conf_decay):
+        self.state[:2] += self.velocity
+        self.conf *= conf_decay
+        self.frames_since_update += 1
+
+    def correct(self, xyxy, conf, alpha, beta):
+        measured = self._to_state(xyxy)
+        residual = measured - self.state
+        self.state += alpha * residual
+        self.velocity += beta * residual[:2] / max(self.frames_since_update, 1)
+        self.conf = float(conf)
+        self.hits += 1
+        self.misses = 0
+        self.frames_since_update = 0
+
+
+# Carries detector boxes across the frames where the detector does not
+# run. Call step(dets) on detector frames and step() on the others; each
+# returns the current tracks as a TRACK_DTYPE array. needs_detection()
+# says when the detector should run again: every `detect_every` frames, or
+# sooner once any track's confidence has decayed below `refresh_conf`.
+class IouTracker:
+    def __init__(self, detect_every=5, iou_thresh=0.3, max_misses=3, conf_decay=0.95,
+                 refresh_conf=0.35, alpha=0.6, beta=0.2):
+        self.detect_every = detect_every
+        self.iou_thresh = iou_thresh
+        self.max_misses = max_misses
+        self.conf_decay = conf_decay
+        self.refresh_conf = refresh_conf
+        self.alpha = alpha
+        self.beta = beta
+        self.tracks = []
+        self.next_id = 1
+        self._since_detection = None
+
+    @property
+    def unique_count(self):
+        # Number of distinct objects seen so far
+        return self.next_id - 1
+
+    def needs_detection(self):
+        if self._since_detection is None or self._since_detection + 1 >= self.detect_every:
+            return True
+        return any(t.conf < self.refresh_conf for t in self.tracks)
+
+    def step(self, dets=None):
+        for track in self.tracks:
+            track.predict(self.conf_decay)
+        if dets is None:
+            self._since_detection += 1
+        else:
+            self._associate(dets)
+            self._since_detection = 0
+        return self.current()
+
+    def _associate(self, dets):
+        unmatched_dets = set(range(len(dets)))
+        if self.tracks and len(dets):
+            # Greedy matching on IoU, best pairs first, same class only
+            track_boxes = np.array([t.xyxy() for t in self.tracks])
+            pairs = []
+            for d in range(len(dets)):
+                ious = box_iou(dets['xyxy'][d], track_boxes)
+                for t in np.nonzero(ious >= self.iou_thresh)[0]:
+                    if self.tracks[t].cls == dets['cls'][d]:
+                        pairs.append((ious[t], t, d))
+            matched_tracks = set()
+            for _, t, d in sorted(pairs, reverse=True):
+                if t in matched_tracks or d not in unmatched_dets:
+                    continue
+                self.tracks[t].correct(dets['xyxy'][d], dets['conf'][d], self.alpha, self.beta)
+                matched_tracks.add(t)
+                unmatched_dets.discard(d)
+            for t, track in enumerate(self.tracks):
+                if t not in matched_tracks:
+                    track.misses += 1
+        else:
+            for track in self.tracks:
+                track.misses += 1
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for d in sorted(unmatched_dets):
+            self.tracks.append(Track(self.next_id, dets['xyxy'][d], dets['conf'][d], dets['cls'][d]))
+            self.next_id += 1
+
+    def current(self):
+        out = np.empty(len(self.tracks), dtype=TRACK_DTYPE)
+        for i, track in enumerate(self.tracks):
+            out[i] = (track.xyxy(), track.conf, track.cls, track.id)
+        return out
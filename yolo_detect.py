@@ -1,127 +1,577 @@
-import os
-import sys
+import argparse
+import json
+import signal
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
-import numpy as np
-from ultralytics import YOLO
+
+from backends import DEFAULT_CACHE, set_threads
+from frame_convert import BgrConverter
+from frame_source import FORMATS, open_source, parse_resolution
+from instrumentation import FpsMeter, StageTimer, write_report
+from metrics import Metrics, MetricsServer, register_stream, register_system, register_timer
+from pipeline import Pipeline
+from change_gate import ChangeGate
+from detector import DEFAULT_MODEL, Detector, choose_model, load_model
+from motor import MotorApiServer, MotorController, load_gpio, parse_speed
+from overlay import OverlayRenderer
+from roi import RailRoi, parse_band
+from speed_control import DutyCalibration, SpeedGovernor
+from startup import Startup, timed
+from tracker import IouTracker
+
+# ultralytics (and torch behind it), the streaming stack and the defect
+# log are imported where they are first needed, so the process gets to
+# open the camera sooner and features that are off cost nothing
 
 # Fixed parameters
-model_path = "yolo11n_ncnn_model"
+model_path = DEFAULT_MODEL
 img_source = "picamera0"
 min_thresh = 0.5
 resW, resH = 320, 240  # Lowest reasonable resolution
 
-# Check if model file exists and is valid
-if (not os.path.exists(model_path)):
-    print('ERROR: Model path is invalid or model was not found. Make sure the model filename was entered correctly.')
-    sys.exit(0)
+# Stages timed by the instrumentation layer, in loop order
+STAGES = ('capture', 'convert', 'gate', 'inference', 'postprocess', 'logging', 'tracking', 'overlay', 'publish', 'display')
 
-# Load the model into memory and get labelmap
-model = YOLO(model_path, task='detect')
-labels = model.names
 
-# Set source type to picamera
-source_type = 'picamera'
-picam_idx = 0
+def parse_args():
+    parser = argparse.ArgumentParser(description='YOLO rail defect detection on the Pi camera')
+    parser.add_argument('--model', help=f'Model to run instead of the cached benchmark winner or {model_path}')
+    parser.add_argument('--backend-cache', default=DEFAULT_CACHE,
+                        help='Configuration picked by benchmark_backends.py')
+    parser.add_argument('--source', default=img_source,
+                        help='picamera0, synthetic[:N], an image directory or a video file')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Pace file and synthetic sources to their frame rate instead of running flat out')
+    parser.add_argument('--loop', action='store_true',
+                        help='Loop file sources forever')
+    parser.add_argument('--resolution', type=parse_resolution, default=(resW, resH), metavar='WxH',
+                        help='Capture resolution, e.g. 1280x720 together with --roi')
+    parser.add_argument('--camera-format', choices=FORMATS, default='XRGB8888',
+                        help='RGB888 asks the camera for 3-channel frames and skips colour conversion')
+    parser.add_argument('--roi', type=parse_band, metavar='Y0,Y1',
+                        help='Only run the model on the rail band between these fractions of the frame height')
+    parser.add_argument('--roi-x', type=parse_band, default=(0.0, 1.0), metavar='X0,X1',
+                        help='Horizontal extent of the rail band as fractions of the frame width')
+    parser.add_argument('--tiles', type=int, default=1,
+                        help='Split the rail band into this many overlapping tiles')
+    parser.add_argument('--tile-overlap', type=float, default=0.2,
+                        help='Fraction of each tile shared with its neighbour')
+    parser.add_argument('--gate-threshold', type=float, metavar='LEVELS',
+                        help='Skip inference when the frame differs from the last inferred one by less '
+                             'than this many grey levels on average (off by default)')
+    parser.add_argument('--gate-max-stale', type=int, default=15, metavar='N',
+                        help='Run inference at least every N frames even when nothing changed')
+    parser.add_argument('--track-every', type=int, metavar='N',
+                        help='Run the detector every N frames and track boxes in between (off by default)')
+    parser.add_argument('--log-dir', metavar='DIR',
+                        help='Record every detection with a JPEG crop to SQLite segments in DIR')
+    parser.add_argument('--log-max-mb', type=float, default=64,
+                        help='Start a new defect log segment after this many MiB')
+    parser.add_argument('--dedup-radius', type=int, metavar='BITS',
+                        help='Store a crop only if no crop of the same class within this many bits of its '
+                             'perceptual hash was logged recently (off by default). With 8, bench_crop_dedup.py '
+                             'matches about 97%% of 80 px boxes shifted 1 px, 92%% with corners moved up to 2 px, '
+                             '55%% shifted 3 px and 42%% grown 10%%, and 0.1%% of unrelated boxes')
+    parser.add_argument('--dedup-window', type=float, default=60.0, metavar='S',
+                        help='How recently a matching crop must have been seen to count as a duplicate '
+                             '(0: ever, e.g. to skip defects already stored on an earlier pass)')
+    parser.add_argument('--dedup-index', metavar='PATH',
+                        help='Where the crop hash index is kept between runs (default: LOG_DIR/crop_index.npz)')
+    parser.add_argument('--stream-port', type=int, metavar='PORT',
+                        help='Serve annotated frames as MJPEG on this port (off by default)')
+    parser.add_argument('--stream-quality', type=int, default=70,
+                        help='JPEG quality of the annotated stream')
+    parser.add_argument('--stream-fps', type=float, default=10.0,
+                        help='Maximum frame rate of the annotated stream, independent of inference')
+    parser.add_argument('--stream-fixed-quality', action='store_true',
+                        help="Don't adapt the stream's quality, size and frame rate to the viewers")
+    parser.add_argument('--clip-dir', metavar='DIR',
+                        help='Save annotated clips around every detection to DIR (off by default)')
+    parser.add_argument('--clip-pre', type=float, default=5.0, metavar='S',
+                        help='Seconds of video kept before a detection')
+    parser.add_argument('--clip-post', type=float, default=5.0, metavar='S',
+                        help='Seconds of video kept after the last detection of a clip')
+    parser.add_argument('--clip-mb', type=float, default=32,
+                        help='MiB of memory for the pre-roll ring; bounds how far back a clip can reach')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='Serve Prometheus metrics at /metrics on this port (also on the stream port)')
+    parser.add_argument('--drive', action='store_true',
+                        help='Drive forward and cap the speed so every stretch of rail gets analysed')
+    parser.add_argument('--drive-speed', type=parse_speed, default='medium',
+                        help='Duty cycle (0-100 or low/medium/high) when the detector keeps up')
+    parser.add_argument('--footprint', type=float, default=0.3, metavar='M',
+                        help='Metres of track along the direction of travel covered by the analysed region')
+    parser.add_argument('--frame-overlap', type=float, default=0.3,
+                        help='Fraction of the footprint consecutive analysed frames must share')
+    parser.add_argument('--speed-per-duty', type=float, default=0.015,
+                        help='Calibrated ground speed gain, m/s per percent duty above --min-duty')
+    parser.add_argument('--min-duty', type=float, default=20.0,
+                        help='Duty cycle below which the car does not move')
+    parser.add_argument('--motor-port', type=int, default=8001,
+                        help='Port of the HTTP motor command API when driving')
+    parser.add_argument('--mock-gpio', action='store_true',
+                        help='Drive a simulated GPIO instead of the motor pins')
+    parser.add_argument('--headless', action='store_true',
+                        help='No window and no keyboard: for running as a service without a display. '
+                             'Frames are only annotated for the stream and clips')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Run capture, inference and rendering in separate workers')
+    parser.add_argument('--stats-interval', type=float, default=5.0,
+                        help='Seconds between pipeline throughput reports (pipelined mode)')
+    parser.add_argument('--bench', type=int, metavar='N',
+                        help='Run N frames, then write a per-stage latency report')
+    parser.add_argument('--bench-report', default='bench_report.json',
+                        help='Where --bench writes its JSON report')
+    parser.add_argument('--warmup', type=int, default=3, metavar='N',
+                        help='Inferences on a blank frame before the loop starts (0 to skip)')
+    parser.add_argument('--ready-file', metavar='PATH',
+                        help='Write this file once warmed up (READY=1 also goes to systemd if it asked)')
+    parser.add_argument('--serial-startup', action='store_true',
+                        help='Load the model before opening the camera instead of alongside it')
+    parser.add_argument('--startup-bench', metavar='PATH',
+                        help='Stop after the first detection and write the startup timeline to PATH')
+    return parser.parse_args()
 
-# Set up picamera
-from picamera2 import Picamera2
-cap = Picamera2()
-cap.configure(cap.create_video_configuration(main={"format": 'XRGB8888', "size": (resW, resH)}))
-cap.start()
 
-# Set bounding box colors (using the Tableu 10 color scheme)
-bbox_colors = [(164,120,87), (68,148,228), (93,97,209), (178,182,133), (88,159,106), 
-              (96,202,231), (159,124,168), (169,162,241), (98,118,150), (172,176,184)]
+def open_camera(args):
+    # Set up picamera (or a recorded/synthetic stand-in)
+    cap = open_source(args.source, args.resolution, realtime=args.realtime, loop=args.loop, fmt=args.camera_format)
+    cap.start()
+    return cap
 
-# Initialize control and status variables
-avg_frame_rate = 0
-frame_rate_buffer = []
-fps_avg_len = 200
 
-# Begin inference loop
-while True:
+def handle_key(frame):
+    # Returns False when the user asked to quit
+    key = cv2.waitKey(5)
 
-    t_start = time.perf_counter()
+    if key == ord('q') or key == ord('Q'):  # Press 'q' to quit
+        return False
+    elif key == ord('s') or key == ord('S'):  # Press 's' to pause inference
+        cv2.waitKey()
+    elif key == ord('p') or key == ord('P'):  # Press 'p' to save a picture of results on this frame
+        cv2.imwrite('capture.png', frame)
+    return True
 
-    # Grab frames using picamera interface
-    frame_bgra = cap.capture_array()
-    frame = cv2.cvtColor(np.copy(frame_bgra), cv2.COLOR_BGRA2BGR)
-    if (frame is None):
-        print('Unable to read frames from the Picamera. This indicates the camera is disconnected or not working. Exiting program.')
-        break
 
-    # Run inference on frame
-    results = model(frame, verbose=False)
+def run_sequential(cap, detector, labels, timer, max_frames=None, gate=None, tracker=None, logger=None, publisher=None,
+                   clips=None, show=True):
+    # Average FPS over the last 200 frames
+    fps_meter = FpsMeter(window=200)
+    renderer = OverlayRenderer(labels)
 
-    # Extract results
-    detections = results[0].boxes
+    # Each frame is finished with before the next capture, so one
+    # conversion buffer is enough
+    converter = BgrConverter(pool_size=1)
+    frames = 0
+    dets = None
 
-    # Initialize variable for basic object counting
-    object_count = 0
+    # Begin inference loop; Ctrl-C (or SIGTERM when headless) ends it
+    try:
+        while max_frames is None or frames < max_frames:
 
-    # Go through each detection and get bbox coords, confidence, and class
-    for i in range(len(detections)):
+            t_start = timer.start()
 
-        # Get bounding box coordinates
-        xyxy_tensor = detections[i].xyxy.cpu()
-        xyxy = xyxy_tensor.numpy().squeeze()
-        xmin, ymin, xmax, ymax = xyxy.astype(int)
+            # Grab frames using picamera interface
+            frame_bgra = cap.capture_array()
+            timer.lap('capture')
+            if (frame_bgra is None):
+                print('Unable to read frames from the source. This indicates the camera is disconnected or the recording has ended. Exiting program.')
+                break
+            frame = converter.convert(frame_bgra)
+            timer.lap('convert')
 
-        # Get bounding box class ID and name
-        classidx = int(detections[i].cls.item())
-        classname = labels[classidx]
+            # Between detector runs the tracker carries the boxes forward, and
+            # the previous detections are reused when the scene hasn't changed
+            run_model = tracker is None or tracker.needs_detection()
+            run_model = run_model and (gate is None or gate.should_infer(frame)) or dets is None
+            timer.lap('gate')
 
-        # Get bounding box confidence
-        conf = detections[i].conf.item()
+            if run_model:
+                # Run inference on frame (or on the rail band tiles)
+                raw = detector.infer(frame)
+                timer.lap('inference')
 
-        # Draw box if confidence threshold is high enough
-        if conf > min_thresh:
+                # Extract results above the confidence threshold
+                dets = detector.postprocess(raw)
+                timer.lap('postprocess')
 
-            color = bbox_colors[classidx % 10]
-            cv2.rectangle(frame, (xmin,ymin), (xmax,ymax), color, 2)
+                # Queue crops for the background writer before anything is drawn
+                if logger is not None:
+                    logger.log(frame, frames, dets)
+                    timer.lap('logging')
+                if clips is not None and len(dets):
+                    clips.trigger()
 
-            label = f'{classname}: {int(conf*100)}%'
-            labelSize, baseLine = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-            label_ymin = max(ymin, labelSize[1] + 10)
-            cv2.rectangle(frame, (xmin, label_ymin-labelSize[1]-10), (xmin+labelSize[0], label_ymin+baseLine-10), color, cv2.FILLED)
-            cv2.putText(frame, label, (xmin, label_ymin-7), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+            if tracker is not None:
+                shown = tracker.step(dets if run_model else None)
+                timer.lap('tracking')
+            else:
+                shown = dets
 
-            # Count objects
-            object_count = object_count + 1
+            # Only annotate frames the window or the stream is going to use
+            if show or (publisher is not None and publisher.due()):
+                renderer.draw(frame, shown, detector.roi, status=(
+                    f'FPS: {fps_meter.fps():0.2f}',
+                    f'Number of objects: {len(shown)}',
+                    None if gate is None else f'Skipped: {gate.skip_rate*100:.0f}%',
+                    None if tracker is None else f'Unique defects: {tracker.unique_count}'))
+                timer.lap('overlay')
 
-    # Calculate and draw framerate
-    cv2.putText(frame, f'FPS: {avg_frame_rate:0.2f}', (10,20), cv2.FONT_HERSHEY_SIMPLEX, .7, (0,255,255), 2)
-    
-    # Display detection results
-    cv2.putText(frame, f'Number of objects: {object_count}', (10,40), cv2.FONT_HERSHEY_SIMPLEX, .7, (0,255,255), 2)
-    cv2.imshow('YOLO detection results', frame)
+                # Hand the annotated frame to the stream encoder
+                if publisher is not None:
+                    publisher.submit(frame)
+                    timer.lap('publish')
 
-    key = cv2.waitKey(5)
-    
-    if key == ord('q') or key == ord('Q'):  # Press 'q' to quit
-        break
-    elif key == ord('s') or key == ord('S'):  # Press 's' to pause inference
-        cv2.waitKey()
-    elif key == ord('p') or key == ord('P'):  # Press 'p' to save a picture of results on this frame
-        cv2.imwrite('capture.png', frame)
-    
-    # Calculate FPS for this frame
-    t_stop = time.perf_counter()
-    frame_rate_calc = float(1/(t_stop - t_start))
-
-    # Append FPS result to frame_rate_buffer
-    if len(frame_rate_buffer) >= fps_avg_len:
-        temp = frame_rate_buffer.pop(0)
-        frame_rate_buffer.append(frame_rate_calc)
+            if show:
+                cv2.imshow('YOLO detection results', frame)
+                keep_going = handle_key(frame)
+                timer.lap('display')
+                if not keep_going:
+                    break
+
+            # Calculate FPS for this frame
+            fps_meter.add(time.perf_counter() - t_start)
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+
+    return fps_meter.fps(), frames
+
+
+def run_pipelined(cap, detector, labels, timer, stats_interval, max_frames=None, gate=None, tracker=None, logger=None,
+                  publisher=None, clips=None, metrics=None, show=True):
+    # Capture and inference each get their own thread; annotation and
+    # display stay here on the main thread, which owns the OpenCV window.
+    # Each thread records its own stages, so time them explicitly rather
+    # than with the shared lap() mark. Capture can run ahead of a slow
+    # inference, so frames get their own buffers rather than a reused pool.
+    converter = BgrConverter(pool_size=None)
+    renderer = OverlayRenderer(labels)
+    last_dets = [None]
+
+    def capture():
+        t0 = time.perf_counter()
+        frame_bgra = cap.capture_array()
+        t1 = time.perf_counter()
+        timer.record('capture', t1 - t0)
+        if frame_bgra is None:
+            print('Unable to read frames from the source. This indicates the camera is disconnected or the recording has ended. Exiting program.')
+            return None
+        frame = converter.convert(frame_bgra)
+        timer.record('convert', time.perf_counter() - t1)
+        return frame
+
+    def track(dets, detected):
+        # The tracker lives on the inference thread, which sees every
+        # frame that reaches the renderer
+        if tracker is None:
+            return dets
+        t0 = time.perf_counter()
+        shown = tracker.step(dets if detected else None)
+        timer.record('tracking', time.perf_counter() - t0)
+        return shown
+
+    def infer(frame, seq):
+        t0 = time.perf_counter()
+        run_model = tracker is None or tracker.needs_detection()
+        run_model = run_model and (gate is None or gate.should_infer(frame)) or last_dets[0] is None
+        if not run_model:
+            timer.record('gate', time.perf_counter() - t0)
+            return track(last_dets[0], False)
+        t1 = time.perf_counter()
+        raw = detector.infer(frame)
+        t2 = time.perf_counter()
+        dets = detector.postprocess(raw)
+        timer.record('gate', t1 - t0)
+        timer.record('inference', t2 - t1)
+        timer.record('postprocess', time.perf_counter() - t2)
+        if logger is not None:
+            t3 = time.perf_counter()
+            logger.log(frame, seq, dets)
+            timer.record('logging', time.perf_counter() - t3)
+        if clips is not None and len(dets):
+            clips.trigger()
+        last_dets[0] = dets
+        return track(dets, True)
+
+    pipeline = Pipeline(capture, infer)
+    if metrics is not None:
+        register_pipeline(metrics, pipeline)
+    pipeline.start()
+
+    stats = pipeline.stats()
+    frames = 0
+    t_begin = t_report = time.perf_counter()
+    try:
+        while max_frames is None or frames < max_frames:
+            item = pipeline.next_result()
+            if item is None:
+                break
+            seq, t_capture, frame, dets = item
+
+            t_start = timer.start()
+
+            if t_start - t_report >= stats_interval:
+                stats = pipeline.stats()
+                t_report = t_start
+                print(f"capture {stats['capture_fps']:.1f} FPS | inference {stats['inference_fps']:.1f} FPS | "
+                      f"render {stats['render_fps']:.1f} FPS | queues {stats['capture_queue']}/{stats['result_queue']} | "
+                      f"dropped {stats['capture_dropped']}/{stats['result_dropped']}"
+                      + ('' if gate is None else f" | skipped {gate.skip_rate*100:.0f}%")
+                      + ('' if tracker is None else f" | unique defects {tracker.unique_count}"))
+
+            # Only annotate frames the window or the stream is going to use
+            if show or (publisher is not None and publisher.due()):
+                renderer.draw(frame, dets, detector.roi, status=(
+                    f"FPS: {stats['inference_fps']:0.2f}",
+                    f'Number of objects: {len(dets)}',
+                    f'Latency: {(t_start - t_capture) * 1000:.0f} ms'))
+                timer.lap('overlay')
+                if publisher is not None:
+                    publisher.submit(frame)
+                    timer.lap('publish')
+
+            if show:
+                cv2.imshow('YOLO detection results', frame)
+                keep_going = handle_key(frame)
+                timer.lap('display')
+                if not keep_going:
+                    break
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+
+    # Average inference rate over the whole run
+    return pipeline.infer_worker.counter.count / (time.perf_counter() - t_begin), frames
+
+
+def register_pipeline(metrics, pipeline):
+    queues = {'capture': pipeline.frames, 'result': pipeline.results}
+    metrics.counter('pipeline_items_total', 'Items handled by each pipelined stage',
+                    lambda: [({'stage': 'capture'}, pipeline.capture_worker.counter.count),
+                             ({'stage': 'inference'}, pipeline.infer_worker.counter.count),
+                             ({'stage': 'render'}, pipeline.render_counter.count)])
+    metrics.gauge('pipeline_queue_depth', 'Items waiting between pipelined stages',
+                  lambda: [({'queue': name}, q.qsize()) for name, q in queues.items()])
+    metrics.counter('pipeline_dropped_total', 'Items replaced by a newer one before they were taken',
+                    lambda: [({'queue': name}, q.dropped) for name, q in queues.items()])
+
+
+def register_metrics(metrics, timer, gate=None, logger=None, publisher=None, clips=None, motors=None):
+    # Everything the detection loop and its helpers already count
+    register_system(metrics)
+    register_timer(metrics, timer)
+    if gate is not None:
+        metrics.counter('gate_skipped_total', 'Frames the change gate kept from the detector', lambda: gate.skipped)
+    if logger is not None:
+        metrics.gauge('log_queue_depth', 'Detections waiting for the defect log writer', lambda: logger.queue.qsize())
+        metrics.counter('log_records_total', 'Defect log records by outcome',
+                        lambda: [({'outcome': 'written'}, logger.written), ({'outcome': 'dropped'}, logger.dropped)])
+        if logger.dedup is not None:
+            metrics.counter('log_duplicate_crops_total', 'Logged detections whose crop matched a stored one',
+                            lambda: logger.duplicates)
+            metrics.gauge('crop_index_entries', 'Crop hashes in the dedup index', lambda: len(logger.dedup))
+    if publisher is not None:
+        metrics.gauge('stream_encode_seconds', 'Time the last annotated frame took to JPEG-encode',
+                      lambda: publisher.encode_seconds)
+    if clips is not None:
+        metrics.counter('clips_saved_total', 'Clips written around detections', lambda: clips.clips_written)
+        metrics.counter('clip_frames_lost_total', 'Clip frames evicted before they were written',
+                        lambda: clips.frames_lost)
+    if motors is not None:
+        metrics.gauge('motor_duty_percent', 'Motor duty cycle after the speed limit', lambda: motors.duty)
+
+
+def main():
+    args = parse_args()
+    startup = Startup(args.ready_file)
+    startup.mark('imports')
+    path, imgsz, threads = choose_model(args.model, args.backend_cache)
+
+    # Loading the model and bringing up the camera both take a while and
+    # mostly wait on I/O and native code, so overlap them
+    startup.status('Loading model and opening camera')
+    if args.serial_startup:
+        (model, labels), load_seconds = timed(load_model, path)
+        cap, open_seconds = timed(open_camera, args)
     else:
-        frame_rate_buffer.append(frame_rate_calc)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            loading = pool.submit(timed, load_model, path)
+            cap, open_seconds = timed(open_camera, args)
+            (model, labels), load_seconds = loading.result()
+    startup.record('model_load', load_seconds)
+    startup.record('camera_open', open_seconds)
+    startup.mark('model_and_camera')
+    timer = StageTimer(STAGES)
+
+    roi = None
+    if args.roi is not None:
+        roi = RailRoi(args.roi, args.roi_x, args.tiles, args.tile_overlap)
+    detector = Detector(model, min_thresh, roi, imgsz=imgsz)
+    if args.warmup or threads:
+        # The thread count can only be set once the backend is built,
+        # which happens on the first inference
+        startup.status('Warming up')
+        warmup = detector.warm_up(args.resolution, max(args.warmup, 1))
+        startup.record('warmup_first', warmup[0])
+        startup.record('warmup_last', warmup[-1])
+        startup.mark('warmup')
+        set_threads(model, threads)
+    gate = None
+    if args.gate_threshold is not None:
+        gate = ChangeGate(args.gate_threshold, args.gate_max_stale)
+    tracker = None
+    if args.track_every is not None:
+        tracker = IouTracker(detect_every=args.track_every)
+    logger = None
+    if args.log_dir is not None:
+        from event_log import open_defect_log
+        logger = open_defect_log(args.log_dir, labels, args.log_max_mb,
+                                 args.dedup_radius, args.dedup_window, args.dedup_index)
+        logger.start()
+    server = publisher = control = clips = None
+    if args.stream_port is not None or args.clip_dir is not None:
+        # Clips are cut from the same encoded frames the stream serves,
+        # so recording them costs no extra JPEG encoding
+        from annotated_stream import AnnotatedStreamPublisher
+        from streaming import StreamingOutput
+        output = StreamingOutput()
+        publisher = AnnotatedStreamPublisher(output, args.stream_quality, args.stream_fps)
+        publisher.start()
+    if args.clip_dir is not None:
+        from clip_buffer import ClipRecorder
+        clips = ClipRecorder(args.clip_dir, int(args.clip_mb * 1024 * 1024), args.clip_pre, args.clip_post)
+        clips.attach(output)
+        clips.start()
+    if args.stream_port is not None:
+        from async_stream import AsyncMjpegServer
+        from quality_control import QualityController, QualityLoop, build_ladder
+        server = AsyncMjpegServer(('', args.stream_port))
+        server.attach(output)
+        server.start()
+        if not args.stream_fixed_quality:
+            # Drop quality, then size, then frame rate when viewers fall behind
+            fps = args.stream_fps
+            controller = QualityController(build_ladder(args.stream_quality, 30, scales=(1.0, 0.75, 0.5),
+                                                        fps_steps=(fps, fps / 2, fps / 4)),
+                                           target_fps=fps, max_backlog=server.max_backlog)
+            controller.listeners.append(publisher.apply)
+            server.status['stream_quality'] = controller.state
+            control = QualityLoop(controller, output, lambda: server.clients,
+                                  encode_seconds=lambda: publisher.encode_seconds)
+            control.start()
+        print(f'Annotated stream at http://<this host>:{args.stream_port}/stream.mjpg')
+    motors = governor = motor_api = None
+    if args.drive:
+        # Frames the gate skipped look the same as the last analysed one,
+        # so they count as covered; frames only tracked in between
+        # detector runs don't
+        def analysed():
+            return timer.stages['inference'].total + (gate.skipped if gate is not None else 0)
+        motors = MotorController(load_gpio(args.mock_gpio), speed=args.drive_speed)
+        motors.start()
+        governor = SpeedGovernor(motors, analysed, args.footprint, args.frame_overlap,
+                                 DutyCalibration(args.speed_per_duty, args.min_duty))
+        governor.start()
+        motors.submit('forward')
+        motor_api = MotorApiServer(('', args.motor_port), motors)
+        motor_api.start()
+        print(f'Motor API at http://<this host>:{args.motor_port}/motor')
+
+    metrics = metrics_server = None
+    if args.metrics_port is not None or server is not None:
+        metrics = Metrics()
+        register_metrics(metrics, timer, gate, logger, publisher, clips, motors)
+        if server is not None:
+            register_stream(metrics, server, output)
+            server.metrics = metrics
+        if args.metrics_port is not None:
+            metrics_server = MetricsServer(('', args.metrics_port), metrics)
+            metrics_server.start()
+            print(f'Metrics at http://<this host>:{args.metrics_port}/metrics')
+
+    if args.headless:
+        # A service is stopped with SIGTERM; end the loop as Ctrl-C would so
+        # everything below still shuts down cleanly
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f'Ready after {startup.ready():.2f} s')
+    max_frames = 1 if args.startup_bench else args.bench
+    try:
+        t_begin = time.perf_counter()
+        if args.pipelined:
+            avg_frame_rate, frames = run_pipelined(cap, detector, labels, timer, args.stats_interval, max_frames,
+                                                    gate=gate, tracker=tracker, logger=logger, publisher=publisher,
+                                                    clips=clips, metrics=metrics, show=not args.headless)
+        else:
+            avg_frame_rate, frames = run_sequential(cap, detector, labels, timer, max_frames,
+                                                     gate=gate, tracker=tracker, logger=logger, publisher=publisher,
+                                                     clips=clips, show=not args.headless)
+        elapsed = time.perf_counter() - t_begin
+        if args.startup_bench:
+            startup.mark('first_detection')
+            startup.record('first_inference', timer.stages['inference'].values()[0])
+    finally:
+        startup.stopping()
+        if motors is not None:
+            motor_api.shutdown()
+            governor.close()
+            motors.close()
+        cap.stop()
+        if not args.headless:
+            cv2.destroyAllWindows()
+        if logger is not None:
+            logger.close()
+        if control is not None:
+            control.close()
+        if publisher is not None:
+            publisher.close()
+        if clips is not None:
+            clips.close()
+        if server is not None:
+            server.shutdown()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+    if args.startup_bench:
+        print(startup.format_report())
+        report = startup.report()
+        report.update(serial=args.serial_startup, warmup=args.warmup, model=path, source=args.source)
+        with open(args.startup_bench, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Startup report written to {args.startup_bench}')
+        return
+
+    # Clean up
+    print(f'Average pipeline FPS: {avg_frame_rate:.2f}')
+    print(timer.format_summary())
+    if gate is not None:
+        print(f'Change gate skipped {gate.skipped} of {gate.checked} frames ({gate.skip_rate*100:.1f}%)')
+    if logger is not None:
+        stats = logger.stats()
+        print(f"Defect log: {stats['written']} records written, {stats['dropped']} dropped, last segment {stats['segment']}")
+        if logger.dedup is not None:
+            print(f"Crop dedup: {stats['duplicates']} duplicate crops not stored, {len(logger.dedup)} hashes indexed")
+    if clips is not None:
+        stats = clips.stats()
+        print(f"Clips: {stats['clips']} saved from {stats['triggers']} detections, {stats['frames_lost']} frames lost, "
+              f"ring held {stats['ring_seconds']:.1f} s; last {stats['last_clip']}")
+
+    if args.bench:
+        write_report(args.bench_report, timer, frames, elapsed,
+                     mode='pipelined' if args.pipelined else 'sequential',
+                     source=args.source, resolution=list(args.resolution), model=path, imgsz=imgsz, threads=threads,
+                     roi=None if roi is None else {'y': roi.y_band, 'x': roi.x_band, 'tiles': roi.tiles},
+                     gate=None if gate is None else gate.stats(),
+                     unique_defects=None if tracker is None else tracker.unique_count,
+                     defect_log=None if logger is None else logger.stats(),
+                     clips=None if clips is None else clips.stats(),
+                     speed_control=None if governor is None else governor.state())
+        print(f'Benchmark report written to {args.bench_report}')
 
-    # Calculate average FPS for past frames
-    avg_frame_rate = np.mean(frame_rate_buffer)
 
-# Clean up
-print(f'Average pipeline FPS: {avg_frame_rate:.2f}')
-cap.stop()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()